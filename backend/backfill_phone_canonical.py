@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Backfill phone_canonical on providers, customers and companies, and
+customer_phone_canonical on visit requests and customer notifications.
+
+Safe to run while the API is serving traffic and to interrupt: progress is
+checkpointed per collection and the next run resumes where it stopped.
+
+Usage:
+    python backfill_phone_canonical.py [--batch-size 500] [--pause 0.05] [--restart]
+"""
+
+import os
+import asyncio
+import argparse
+from pathlib import Path
+from motor.motor_asyncio import AsyncIOMotorClient
+from dotenv import load_dotenv
+
+# Load environment
+load_dotenv(Path(__file__).parent / '.env')
+
+from phones import PHONE_FIELDS, PHONE_BACKFILL_BATCH_SIZE, ensure_phone_indexes, backfill_phone_canonical, phone_checkpoint_id
+from versions import bump_versions
+
+# MongoDB connection
+mongo_url = os.environ['MONGO_URL']
+client = AsyncIOMotorClient(mongo_url)
+db = client[os.environ['DB_NAME']]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Backfill phone_canonical on account collections")
+    parser.add_argument('--batch-size', type=int, default=PHONE_BACKFILL_BATCH_SIZE)
+    parser.add_argument('--pause', type=float, default=0.0, help="Seconds to sleep between batches")
+    parser.add_argument('--restart', action='store_true', help="Ignore checkpoints and rescan everything")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Backfilling phone_canonical")
+    print("=" * 60)
+
+    if args.restart:
+        await db.migration_checkpoints.delete_many({'_id': {'$in': [phone_checkpoint_id(name) for name, _, _ in PHONE_FIELDS]}})
+        print("Checkpoints cleared")
+
+    await ensure_phone_indexes(db)
+    report = await backfill_phone_canonical(db, batch_size=args.batch_size, pause_seconds=args.pause)
+    if report.get('companies', {}).get('updated'):
+        await bump_versions(db, 'companies')
+
+    for name, stats in report.items():
+        print(f"\n{name}: {stats['scanned']} scanned, {stats['updated']} updated, {len(stats['conflicts'])} conflicts")
+        for conflict in stats['conflicts']:
+            print(f"  ⚠ duplicate phone {conflict['phone_number']} (id {conflict['id']})")
+
+    print("\n" + "=" * 60)
+    print("Backfill complete!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
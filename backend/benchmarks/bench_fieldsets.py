@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Payload size and latency of list endpoints per `fields=` view.
+
+Seeds realistic rentals, property sales and providers (long descriptions,
+several photos, compliance documents) into the configured database, then
+requests each endpoint with the default projection, `fields=detail` and
+`fields=card` through the ASGI interface, and reports response bytes and
+median latency. Seeded documents are removed afterwards; point DB_NAME at
+a scratch database anyway.
+
+Usage (from backend/):
+    MONGO_URL=mongodb://localhost:27017 DB_NAME=bench python benchmarks/bench_fieldsets.py [--documents 500] [--requests 30]
+"""
+
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+from datetime import datetime, timezone, timedelta
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx
+
+import server
+
+BENCH_PREFIX = 'bench-fieldsets-'
+
+DESCRIPTION = (
+    "Belle propriété située dans un quartier calme, proche des commerces, des écoles et des transports. "
+    "Cuisine équipée, salon spacieux, chambres lumineuses avec placards, salle de bain moderne, "
+    "groupe électrogène, forage et gardiennage. Accès facile depuis la route principale. "
+) * 4
+
+
+def photos(kind: str, i: int, count: int = 8) -> list:
+    return [f"https://res.cloudinary.com/bench/image/upload/v1/servispro/{kind}/{i}_{n}_0123456789abcdef.jpg" for n in range(count)]
+
+
+def document(i: int, name: str) -> str:
+    return f"https://res.cloudinary.com/bench/raw/upload/v1/servispro/documents/{i}_{name}_0123456789abcdef.pdf"
+
+
+def seed_documents(count: int) -> dict:
+    now = datetime.now(timezone.utc)
+    rentals, sales, providers = [], [], []
+    for i in range(count):
+        created_at = (now - timedelta(minutes=i)).isoformat()
+        rentals.append({
+            'id': f'{BENCH_PREFIX}rental-{i}', 'service_provider_id': f'{BENCH_PREFIX}provider-{i}',
+            'provider_name': 'Mamadou Diallo', 'provider_phone': '+224620000000', 'property_type': 'Appartement',
+            'title': f"Appartement meublé {i} à Kipé", 'description': DESCRIPTION, 'location': 'Kipé, Ratoma, Conakry',
+            'rental_price': 3500000, 'caution': 7000000, 'mois_avance': 3, 'rental_type': 'long_term',
+            'amenities': ['wifi', 'climatisation', 'parking', 'gardien'], 'is_available': True,
+            'photos': photos('rentals', i), 'titre_foncier': document(i, 'titre_foncier'),
+            'registration_ministere': document(i, 'registration'), 'seller_id_document': document(i, 'id'),
+            'documents_additionnels': [document(i, f'annexe_{n}') for n in range(3)],
+            'approval_status': 'approved', 'rejection_reason': None, 'approved_at': created_at, 'approved_by': 'admin',
+            'created_at': created_at, 'updated_at': created_at,
+        })
+        sales.append({
+            'id': f'{BENCH_PREFIX}sale-{i}', 'agent_id': f'{BENCH_PREFIX}company', 'agent_name': 'Immo Conakry',
+            'agent_phone': '+224620000001', 'owner_type': 'company', 'property_type': 'Villa',
+            'title': f"Villa {i} avec jardin", 'description': DESCRIPTION, 'location': 'Lambanyi, Ratoma, Conakry',
+            'sale_price': 2500000000, 'surface_area': '600 m²', 'num_rooms': 5, 'num_bathrooms': 3,
+            'has_garage': True, 'has_garden': True, 'has_pool': False, 'year_built': 2018,
+            'features': ['clôture', 'forage', 'groupe électrogène'], 'is_negotiable': True, 'is_available': True,
+            'photos': photos('property_sales', i), 'titre_foncier': document(i, 'titre_foncier'),
+            'registration_ministere': document(i, 'registration'), 'seller_id_document': document(i, 'id'),
+            'documents_additionnels': [document(i, f'annexe_{n}') for n in range(3)],
+            'documents_verified': True, 'verification_date': created_at, 'status': 'approved',
+            'created_at': created_at, 'updated_at': created_at,
+        })
+        providers.append({
+            'id': f'{BENCH_PREFIX}provider-{i}', 'first_name': 'Mamadou', 'last_name': f'Diallo {i}',
+            'phone_number': f'+22462{i:07d}', 'password': '$2b$12$' + 'x' * 53, 'profession': 'Plombier',
+            'profession_group': 'Artisanat', 'years_experience': '5-10', 'about_me': DESCRIPTION,
+            'profile_picture': photos('profiles', i, 1)[0], 'id_verification_picture': document(i, 'cni'),
+            'documents': [{'path': document(i, f'diplome_{n}'), 'filename': f'diplome_{n}.pdf', 'uploaded_at': created_at} for n in range(5)],
+            'online_status': i % 3 == 0, 'verification_status': 'approved', 'price': 150000,
+            'location': 'Conakry', 'region': 'conakry', 'ville': 'conakry', 'commune': 'ratoma', 'quartier': 'Kipé',
+            'created_at': created_at,
+        })
+    return {'rental_listings': rentals, 'property_sales': sales, 'service_providers': providers}
+
+
+async def measure(client: httpx.AsyncClient, path: str, params: dict, requests: int):
+    """(response bytes, median ms)"""
+    timings = []
+    size = 0
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = await client.get(path, params=params)
+        timings.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+        size = len(response.content)
+    return size, statistics.median(timings)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark sparse fieldsets of list endpoints")
+    parser.add_argument("--documents", type=int, default=500, help="Documents seeded per collection")
+    parser.add_argument("--requests", type=int, default=30, help="Requests per measurement")
+    args = parser.parse_args()
+
+    seeded = seed_documents(args.documents)
+    for name, docs in seeded.items():
+        await server.db[name].insert_many([dict(doc) for doc in docs])
+
+    cases = [
+        ("/api/rentals", {'limit': 100}),
+        ("/api/property-sales", {'limit': 100}),
+        ("/api/admin/rentals", {}),
+        ("/api/admin/providers", {}),
+    ]
+    views = [("default", None), ("detail", "detail"), ("card", "card")]
+
+    try:
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            print(f"{'endpoint':<24} {'view':<8} {'bytes':>10} {'ms p50':>8}   vs default")
+            for path, params in cases:
+                baseline = None
+                for label, fields in views:
+                    query = {**params, **({'fields': fields} if fields else {})}
+                    size, latency = await measure(client, path, query, args.requests)
+                    line = f"{path:<24} {label:<8} {size:>10} {latency:>8.1f}"
+                    if baseline:
+                        line += f"   {size / baseline[0] - 1:+.0%} bytes, {latency / baseline[1] - 1:+.0%} time"
+                    else:
+                        baseline = (size, latency)
+                    print(line)
+    finally:
+        for name in seeded:
+            await server.db[name].delete_many({'id': {'$regex': f'^{BENCH_PREFIX}'}})
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Per-request overhead of the security and rate-limit middlewares.
+
+Compares the previous BaseHTTPMiddleware implementations with the pure ASGI
+ones in server.py, on a small JSON endpoint and on a static file served
+from a StaticFiles mount like /api/uploads. Requests are driven straight
+through the ASGI interface so the numbers only contain framework and
+middleware cost.
+
+Usage (from backend/):
+    MONGO_URL=mongodb://localhost:27017 DB_NAME=bench python benchmarks/bench_middleware.py [--requests 20000] [--rounds 3]
+"""
+
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from fastapi.staticfiles import StaticFiles
+from starlette.middleware.base import BaseHTTPMiddleware
+
+import server
+
+
+class LegacySecurityHeadersMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        response = await call_next(request)
+        response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
+        response.headers["Content-Security-Policy"] = "default-src 'self'; script-src 'self' 'unsafe-inline' 'unsafe-eval'; style-src 'self' 'unsafe-inline'; img-src 'self' data: https:; font-src 'self' data:; connect-src 'self' https:;"
+        response.headers["X-Frame-Options"] = "SAMEORIGIN"
+        response.headers["X-Content-Type-Options"] = "nosniff"
+        response.headers["X-XSS-Protection"] = "1; mode=block"
+        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
+        response.headers["Permissions-Policy"] = "geolocation=(), microphone=(), camera=()"
+        return response
+
+
+class LegacyRateLimitMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        login_paths = ["/api/auth/login", "/api/admin/login", "/api/customer/login", "/api/company/login"]
+        if request.method == "POST" and any(request.url.path.endswith(path) for path in login_paths):
+            if await server.is_ip_blocked(server.get_client_ip(request)):
+                return JSONResponse(status_code=429, content={"detail": "rate limited"})
+        return await call_next(request)
+
+
+def build_app(security_middleware, rate_limit_middleware, static_dir: Path) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/ping")
+    async def ping():
+        return {"status": "ok", "items": list(range(10))}
+
+    app.mount("/api/uploads", StaticFiles(directory=str(static_dir)), name="uploads")
+    if security_middleware:
+        app.add_middleware(security_middleware)
+    if rate_limit_middleware:
+        app.add_middleware(rate_limit_middleware)
+    return app
+
+
+async def run(app, path: str, requests: int) -> float:
+    """Average microseconds per request"""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 12345),
+        "server": ("bench", 80),
+    }
+
+    never = asyncio.Event()
+
+    def make_receive():
+        sent = False
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            # Client stays connected until the response is complete
+            await never.wait()
+        return receive
+
+    async def send(message):
+        pass
+
+    # Warm up
+    for _ in range(200):
+        await app(dict(scope), make_receive(), send)
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), make_receive(), send)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark middleware overhead")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        static_dir = Path(tmp)
+        (static_dir / "photo.jpg").write_bytes(b"\xff\xd8" + b"0" * 50_000)
+
+        variants = {
+            "no middleware": build_app(None, None, static_dir),
+            "BaseHTTPMiddleware (before)": build_app(LegacySecurityHeadersMiddleware, LegacyRateLimitMiddleware, static_dir),
+            "pure ASGI (after)": build_app(server.SecurityHeadersMiddleware, server.RateLimitMiddleware, static_dir),
+        }
+
+        # Best of several interleaved rounds to damp scheduler and disk cache noise
+        results = {name: [float("inf"), float("inf")] for name in variants}
+        for _ in range(args.rounds):
+            for name, app in variants.items():
+                best = results[name]
+                best[0] = min(best[0], await run(app, "/api/ping", args.requests))
+                best[1] = min(best[1], await run(app, "/api/uploads/photo.jpg", args.requests // 4))
+
+        print(f"{'variant':<30} {'JSON µs/req':>12} {'static µs/req':>14}")
+        baseline = results["no middleware"]
+        for name, (json_us, static_us) in results.items():
+            line = f"{name:<30} {json_us:>12.1f} {static_us:>14.1f}"
+            if name != "no middleware":
+                line += f"   ({json_us - baseline[0]:+.1f} / {static_us - baseline[1]:+.1f} µs vs no middleware)"
+            print(line)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Serialization cost of list endpoints, before and after the fast responses.
+
+"Before" is a copy of the endpoints as they were: plain documents returned
+through FastAPI's jsonable_encoder and JSONResponse, model endpoints
+building a model per document and validated again against response_model.
+"After" is server.app (precompiled TypeAdapters, orjson). Both run the same
+queries on the same seeded documents, driven through the ASGI interface;
+the responses are checked to decode to the same JSON.
+
+Usage (from backend/):
+    MONGO_URL=mongodb://localhost:27017 DB_NAME=bench python benchmarks/bench_serialization.py [--documents 1000] [--requests 20]
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import httpx
+from fastapi import FastAPI, Response
+
+import server
+from server import db, RentalListing, ServiceProvider
+from bench_fieldsets import BENCH_PREFIX, seed_documents
+
+
+def build_legacy_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/admin/providers")
+    async def admin_providers():
+        return await db.service_providers.find({}, {'_id': 0, 'password': 0}).sort('created_at', -1).to_list(1000)
+
+    @app.get("/api/admin/rentals")
+    async def admin_rentals():
+        return await db.rental_listings.find({}, {'_id': 0, 'search': 0}).sort('created_at', -1).to_list(1000)
+
+    @app.get("/api/admin/property-sales")
+    async def admin_property_sales():
+        return await db.property_sales.find({}, {'_id': 0, 'search': 0}).sort('created_at', -1).to_list(100)
+
+    @app.get("/api/providers", response_model=List[ServiceProvider])
+    async def providers(response: Response, limit: int = 100):
+        docs = await server.fetch_page(db.service_providers, {}, {'_id': 0, 'password': 0}, limit, None, response)
+        return [ServiceProvider(**p) for p in docs]
+
+    @app.get("/api/rentals", response_model=List[RentalListing])
+    async def rentals(response: Response, limit: int = 100):
+        query = {'approval_status': 'approved'}
+        docs = await server.fetch_page(db.rental_listings, query, {'_id': 0, 'search': 0}, limit, None, response)
+        return [RentalListing(**r) for r in docs]
+
+    return app
+
+
+async def measure(client: httpx.AsyncClient, path: str, requests: int):
+    """(median ms, decoded body)"""
+    timings = []
+    body = None
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = await client.get(path)
+        timings.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+        body = response.content
+    return statistics.median(timings), json.loads(body)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark list endpoint serialization")
+    parser.add_argument("--documents", type=int, default=1000, help="Documents seeded per collection")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per measurement")
+    args = parser.parse_args()
+
+    seeded = seed_documents(args.documents)
+    for name, docs in seeded.items():
+        await db[name].insert_many([dict(doc) for doc in docs])
+
+    paths = [
+        "/api/admin/providers",
+        "/api/admin/rentals",
+        "/api/admin/property-sales",
+        "/api/providers?limit=100",
+        "/api/rentals?limit=100",
+    ]
+
+    try:
+        before = httpx.AsyncClient(transport=httpx.ASGITransport(app=build_legacy_app()), base_url="http://bench")
+        after = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://bench")
+        async with before, after:
+            print(f"{'endpoint':<28} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+            for path in paths:
+                # Interleaved, best median of two rounds
+                results = {'before': [], 'after': []}
+                for _ in range(2):
+                    for label, client in (('before', before), ('after', after)):
+                        results[label].append(await measure(client, path, args.requests))
+                before_ms = min(ms for ms, _ in results['before'])
+                after_ms = min(ms for ms, _ in results['after'])
+                same = results['before'][0][1] == results['after'][0][1]
+                print(f"{path:<28} {before_ms:>10.1f} {after_ms:>10.1f} {before_ms / after_ms:>7.1f}x"
+                      + ("" if same else "   ✗ responses differ"))
+    finally:
+        for name in seeded:
+            await db[name].delete_many({'id': {'$regex': f'^{BENCH_PREFIX}'}})
+
+if __name__ == "__main__":
+    asyncio.run(main())
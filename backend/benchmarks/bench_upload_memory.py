@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Peak memory of concurrent large uploads, before and after streaming.
+
+Simulates N concurrent requests each carrying a large PDF. Files are held in
+SpooledTemporaryFile objects exactly like Starlette's UploadFile (rolled to
+disk past 1 MB). The Cloudinary network calls are replaced by sinks that
+consume their input the way the SDK does, so only our own buffering is
+measured:
+
+- before: await file.read() of the whole body, then one upload call
+- after:  server.store_upload() on the Cloudinary backend, chunked upload_large
+          from the temp file (each file has distinct content so none is deduplicated)
+
+Needs a reachable MongoDB for the stored_files registry.
+
+Usage (from backend/):
+    MONGO_URL=mongodb://localhost:27017 DB_NAME=bench python benchmarks/bench_upload_memory.py [--files 5] [--size-mb 20]
+"""
+
+import sys
+import uuid
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from starlette.datastructures import UploadFile
+
+import server
+
+
+def fake_upload(file, **options):
+    """Stand-in for cloudinary.uploader.upload: the SDK needs the whole payload as bytes"""
+    data = file if isinstance(file, bytes) else file.read()
+    return {"secure_url": f"https://res.cloudinary.com/bench/{options['public_id']}", "public_id": options["public_id"], "bytes": len(data)}
+
+
+def fake_upload_large(file, **options):
+    """Stand-in for cloudinary.uploader.upload_large: one chunk in memory at a time"""
+    chunk_size = options["chunk_size"]
+    total = 0
+    with file:
+        chunk = file.read(chunk_size)
+        while chunk:
+            total += len(chunk)
+            chunk = file.read(chunk_size)
+    return {"secure_url": f"https://res.cloudinary.com/bench/{options['public_id']}", "public_id": options["public_id"], "bytes": total}
+
+
+def make_upload(size: int) -> UploadFile:
+    spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    # Unique first block so the content store transfers every file
+    spooled.write(b"%PDF" + uuid.uuid4().bytes + b"0" * (1024 * 1024 - 20))
+    block = b"0" * (1024 * 1024)
+    for _ in range(size // len(block) - 1):
+        spooled.write(block)
+    spooled.seek(0)
+    return UploadFile(spooled, size=size, filename="document.pdf")
+
+
+async def upload_before(file: UploadFile) -> dict:
+    file_content = await file.read()
+    await file.seek(0)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(server.storage_io_executor, lambda: fake_upload(file_content, public_id="bench/before"))
+
+
+async def measure(label: str, upload, files: int, size: int):
+    uploads = [make_upload(size) for _ in range(files)]
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    results = await asyncio.gather(*(upload(file) for file in uploads))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    for file in uploads:
+        await file.close()
+    failed = [r for r in results if isinstance(r, dict) and r.get("success") is False]
+    print(f"{label:<28} peak traced memory: {peak / (1024 * 1024):8.1f} MB"
+          + (f"  ({len(failed)} failed: {failed[0].get('error')})" if failed else ""))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark memory of concurrent uploads")
+    parser.add_argument("--files", type=int, default=5)
+    parser.add_argument("--size-mb", type=int, default=20)
+    args = parser.parse_args()
+
+    size = args.size_mb * 1024 * 1024
+    server.MAX_UPLOAD_SIZE_BYTES = max(server.MAX_UPLOAD_SIZE_BYTES, size)
+    server.cloudinary.uploader.upload = fake_upload
+    server.cloudinary.uploader.upload_large = fake_upload_large
+    server.content_store.backend = server.storage_backends["cloudinary"]
+
+    print(f"{args.files} concurrent uploads of {args.size_mb} MB")
+    await measure("before (read whole file)", upload_before, args.files, size)
+    await measure("after (streamed chunks)", lambda f: server.store_upload(f, folder="bench"), args.files, size)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Find (and optionally delete) stored files that no document references.
+
+Files become orphaned whenever an update replaces or drops a URL (a photo
+removed from a listing, company documents cleared on rejection...). The
+collector:
+
+1. Streams every collection in STORAGE_REFERENCE_FIELDS with a projection
+   of the URL fields only, and keeps an 8-byte digest of each referenced
+   object, so memory stays small with hundreds of thousands of files.
+2. Lists UPLOAD_DIR, the Cloudinary folder (image and raw resources) and,
+   when configured, the S3 bucket.
+3. Reports objects that are not referenced and older than --min-age-hours
+   (recent uploads may not be attached to their document yet), and with
+   --delete removes them in bulk batches throttled to --rate objects/s.
+
+An orphan that is still in the stored_files registry is only deleted if its
+refcount did not change since the scan started, so a concurrent upload of
+the same content keeps its file.
+
+Usage:
+    python gc_orphaned_files.py [--backend all|local|cloudinary|s3] [--prefix servispro/]
+                                [--min-age-hours 24] [--delete] [--rate 20] [--report orphans.jsonl]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+from pathlib import Path
+from datetime import datetime, timezone, timedelta
+from motor.motor_asyncio import AsyncIOMotorClient
+from dotenv import load_dotenv
+import cloudinary
+import cloudinary.api
+
+# Load environment
+load_dotenv(Path(__file__).parent / '.env')
+
+from storage import STORAGE_BACKEND, STORAGE_REFERENCE_FIELDS, build_storage_backends
+
+# MongoDB connection
+mongo_url = os.environ['MONGO_URL']
+client = AsyncIOMotorClient(mongo_url)
+db = client[os.environ['DB_NAME']]
+
+# Cloudinary configuration
+cloudinary.config(
+    cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
+    api_key=os.getenv("CLOUDINARY_API_KEY"),
+    api_secret=os.getenv("CLOUDINARY_API_SECRET"),
+    secure=True
+)
+
+UPLOAD_DIR = Path(os.environ.get('UPLOAD_DIR', '/app/backend/uploads'))
+
+SCAN_BATCH_SIZE = 1000
+CLOUDINARY_LIST_PAGE_SIZE = 500
+
+
+def object_digest(backend: str, ref: str) -> bytes:
+    """
+    Compact identity of a stored object. Cloudinary public_ids are compared
+    without extension: raw assets may carry it in the public_id while image
+    URLs always add it.
+    """
+    if backend == 'cloudinary':
+        head, _, name = ref.rpartition('/')
+        ref = f"{head}/{name.rsplit('.', 1)[0]}" if head else name.rsplit('.', 1)[0]
+    return hashlib.blake2b(f"{backend}:{ref}".encode(), digest_size=8).digest()
+
+
+def iter_urls(value):
+    """Strings nested in a projected field (str, list of str, list of {path: url})"""
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, list):
+        for item in value:
+            yield from iter_urls(item)
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from iter_urls(item)
+
+
+async def collect_references(backends) -> set:
+    """Digests of every stored object referenced from the database"""
+    referenced = set()
+    for name, fields in STORAGE_REFERENCE_FIELDS.items():
+        projection = {'_id': 0, **{field: 1 for field in fields}}
+        scanned = 0
+        async for doc in db[name].find({}, projection, batch_size=SCAN_BATCH_SIZE):
+            scanned += 1
+            for url in iter_urls(doc):
+                for backend in backends.values():
+                    location = backend.locate(url)
+                    if location is not None:
+                        referenced.add(object_digest(backend.name, location[0]))
+                        break
+        print(f"  {name}: {scanned} documents scanned")
+    return referenced
+
+
+async def registry_snapshot() -> dict:
+    """digest -> (sha256, refcount) for objects in the stored_files registry"""
+    snapshot = {}
+    async for entry in db.stored_files.find({'state': 'ready'}, {'backend': 1, 'ref': 1, 'refcount': 1}):
+        if entry.get('ref'):
+            snapshot[object_digest(entry['backend'], entry['ref'])] = (entry['_id'], entry.get('refcount', 0))
+    return snapshot
+
+
+def list_local(root: Path):
+    """(ref, resource_type, size, modified_at) for files under the upload directory"""
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False) and not entry.name.endswith('.part'):
+                    stat = entry.stat()
+                    ref = Path(entry.path).relative_to(root).as_posix()
+                    resource_type = 'raw' if ref.rsplit('.', 1)[-1].lower() in ('pdf', 'doc', 'docx') else 'image'
+                    yield ref, resource_type, stat.st_size, datetime.fromtimestamp(stat.st_mtime, timezone.utc)
+
+
+def list_cloudinary(prefix: str):
+    """(public_id, resource_type, size, created_at) for assets under a folder prefix"""
+    for resource_type in ('image', 'raw'):
+        cursor = None
+        while True:
+            page = cloudinary.api.resources(
+                type='upload',
+                resource_type=resource_type,
+                prefix=prefix,
+                max_results=CLOUDINARY_LIST_PAGE_SIZE,
+                next_cursor=cursor
+            )
+            for resource in page.get('resources', []):
+                created_at = datetime.fromisoformat(resource['created_at'].replace('Z', '+00:00'))
+                yield resource['public_id'], resource_type, resource.get('bytes', 0), created_at
+            cursor = page.get('next_cursor')
+            if not cursor:
+                break
+
+
+def list_s3(backend, prefix: str):
+    """(key, resource_type, size, last_modified) for objects under a key prefix"""
+    paginator = backend.client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=backend.bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            ref = obj['Key']
+            resource_type = 'raw' if ref.rsplit('.', 1)[-1].lower() in ('pdf', 'doc', 'docx') else 'image'
+            yield ref, resource_type, obj['Size'], obj['LastModified']
+
+
+async def delete_orphans(backend, orphans: list, snapshot: dict, rate: float, stats: dict):
+    """Delete orphans in bulk batches, at most `rate` objects per second"""
+    for start in range(0, len(orphans), backend.delete_batch_size):
+        batch = orphans[start:start + backend.delete_batch_size]
+        started = time.monotonic()
+
+        # Drop registry entries first so the content can't be deduplicated onto a
+        # deleted object; skip any whose refcount moved since the snapshot
+        deletable = []
+        for orphan in batch:
+            entry = snapshot.get(object_digest(backend.name, orphan['ref']))
+            if entry is not None:
+                result = await db.stored_files.delete_one({'_id': entry[0], 'refcount': entry[1]})
+                if result.deleted_count == 0:
+                    stats['skipped'] += 1
+                    continue
+            deletable.append(orphan)
+
+        by_type = {}
+        for orphan in deletable:
+            by_type.setdefault(orphan['resource_type'], []).append(orphan['ref'])
+        for resource_type, refs in by_type.items():
+            try:
+                results = await asyncio.to_thread(backend.delete_many, refs, resource_type)
+            except Exception as e:
+                print(f"  ✗ {backend.name} bulk delete failed: {e!r}")
+                stats['failed'] += len(refs)
+                continue
+            deleted = sum(1 for ref in refs if results.get(ref))
+            stats['deleted'] += deleted
+            stats['failed'] += len(refs) - deleted
+
+        if rate > 0:
+            elapsed = time.monotonic() - started
+            await asyncio.sleep(max(0.0, len(batch) / rate - elapsed))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Report or delete stored files no document references")
+    parser.add_argument('--backend', choices=['all', 'local', 'cloudinary', 's3'], default='all')
+    parser.add_argument('--prefix', default='servispro/', help="Cloudinary folder / S3 key prefix to scan")
+    parser.add_argument('--min-age-hours', type=float, default=24, help="Ignore files newer than this")
+    parser.add_argument('--delete', action='store_true', help="Delete orphans (default: report only)")
+    parser.add_argument('--rate', type=float, default=20, help="Max deletions per second")
+    parser.add_argument('--report', help="Write orphans as JSON lines to this file")
+    args = parser.parse_args()
+
+    backends = build_storage_backends(UPLOAD_DIR, STORAGE_BACKEND)
+    listings = {
+        'local': lambda: list_local(UPLOAD_DIR),
+        'cloudinary': lambda: list_cloudinary(args.prefix),
+    }
+    if 's3' in backends:
+        listings['s3'] = lambda: list_s3(backends['s3'], args.prefix)
+    if args.backend != 'all':
+        if args.backend not in listings:
+            sys.exit(f"Backend {args.backend} is not configured")
+        listings = {args.backend: listings[args.backend]}
+    if 'cloudinary' in listings and not os.getenv("CLOUDINARY_CLOUD_NAME"):
+        print("Cloudinary not configured, skipping")
+        del listings['cloudinary']
+
+    print("=" * 60)
+    print(f"Orphaned file GC ({'DELETE' if args.delete else 'report only'})")
+    print("=" * 60)
+
+    started = time.monotonic()
+    snapshot = await registry_snapshot()
+    print("\nScanning references...")
+    referenced = await collect_references(backends)
+    print(f"  {len(referenced)} referenced files")
+
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=args.min_age_hours)
+    report = open(args.report, 'w') if args.report else None
+    try:
+        for name, listing in listings.items():
+            backend = backends[name]
+            stats = {'scanned': 0, 'bytes': 0, 'orphans': 0, 'orphan_bytes': 0, 'deleted': 0, 'skipped': 0, 'failed': 0}
+            orphans = []
+            print(f"\nListing {name}...")
+            # Listing calls are blocking; nothing else runs on this loop meanwhile
+            for ref, resource_type, size, modified_at in listing():
+                stats['scanned'] += 1
+                stats['bytes'] += size
+                if modified_at > cutoff or object_digest(name, ref) in referenced:
+                    continue
+                stats['orphans'] += 1
+                stats['orphan_bytes'] += size
+                orphans.append({'ref': ref, 'resource_type': resource_type})
+                if report:
+                    report.write(json.dumps({'backend': name, 'ref': ref, 'resource_type': resource_type,
+                                             'size': size, 'modified_at': modified_at.isoformat()}) + "\n")
+
+            if args.delete and orphans:
+                await delete_orphans(backend, orphans, snapshot, args.rate, stats)
+
+            print(f"  {stats['scanned']} files ({stats['bytes'] / (1024 * 1024):.1f} MB), "
+                  f"{stats['orphans']} orphaned ({stats['orphan_bytes'] / (1024 * 1024):.1f} MB)")
+            for orphan in orphans[:10]:
+                print(f"    - {orphan['ref']}")
+            if len(orphans) > 10:
+                print(f"    ... and {len(orphans) - 10} more")
+            if args.delete:
+                print(f"  {stats['deleted']} deleted, {stats['skipped']} skipped (re-referenced), {stats['failed']} failed")
+    finally:
+        if report:
+            report.close()
+
+    print("\n" + "=" * 60)
+    print(f"GC complete in {time.monotonic() - started:.1f}s")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
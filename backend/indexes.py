@@ -0,0 +1,414 @@
+"""
+Declarative MongoDB index spec for the collections queried by the API.
+
+INDEX_SPEC lists, per collection, the indexes backing server.py's lookups
+(`id`, owner fields), its filtered listings sorted by created_at and the
+provider discovery sorted by rank. The API applies it idempotently at
+startup with ensure_indexes(); the manage_indexes.py CLI diffs it against
+the database and, with --explain, runs HOT_QUERIES through explain() to
+catch any that still scans a whole collection.
+
+Indexes owned by other modules (phone_canonical, TTL collections, the
+storage registry) are created by those modules and are not listed here.
+"""
+
+import logging
+from typing import Dict, List, Optional
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from search import SEARCH_FIELDS, search_indexes
+
+logger = logging.getLogger(__name__)
+
+
+def index(keys: List[tuple], **options) -> IndexModel:
+    """IndexModel named after its keys, like MongoDB's default names"""
+    name = '_'.join(f"{field}_{direction}" for field, direction in keys)
+    return IndexModel(keys, name=name, **options)
+
+
+def by_id() -> IndexModel:
+    """Unique index on the public `id` every lookup uses"""
+    return index([('id', ASCENDING)], unique=True)
+
+
+def newest(*fields: str) -> IndexModel:
+    """Equality on fields, sorted by created_at descending"""
+    return index([(field, ASCENDING) for field in fields] + [('created_at', DESCENDING)])
+
+
+def keyset(*fields: str) -> IndexModel:
+    """Equality on fields, then the (created_at, id) order of paginated listings"""
+    return index([(field, ASCENDING) for field in fields] + [('created_at', DESCENDING), ('id', DESCENDING)])
+
+
+def ranked(*fields: str) -> IndexModel:
+    """Equality on fields, then the (rank, id) order of provider discovery"""
+    return index([(field, ASCENDING) for field in fields] + [('rank', DESCENDING), ('id', DESCENDING)])
+
+
+INDEX_SPEC: Dict[str, List[IndexModel]] = {
+    'service_providers': [
+        by_id(),
+        keyset(),
+        newest('verification_status'),
+        newest('profession'),
+        ranked(),
+        ranked('profession'),
+        ranked('profession', 'region', 'ville', 'commune'),
+        ranked('region', 'ville', 'commune'),
+        ranked('verification_status', 'profession'),
+        ranked('online_status', 'profession'),
+        index([('rank_v', ASCENDING), ('rank_updated_at', ASCENDING)]),
+        # Raw number fallback of phone lookups (phones.find_by_phone)
+        index([('phone_number', ASCENDING)]),
+    ],
+    'customers': [
+        by_id(),
+        newest(),
+        index([('phone_number', ASCENDING)]),
+    ],
+    'companies': [
+        by_id(),
+        index([('rccm_number', ASCENDING)]),
+        index([('phone_number', ASCENDING)]),
+        keyset(),
+        keyset('verification_status'),
+    ],
+    'admins': [
+        by_id(),
+        index([('username', ASCENDING)], unique=True),
+    ],
+    'rental_listings': [
+        by_id(),
+        newest(),
+        newest('service_provider_id'),
+        keyset('approval_status'),
+    ],
+    'property_sales': [
+        by_id(),
+        keyset(),
+        newest('agent_id'),
+        keyset('status'),
+    ],
+    'vehicle_listings': [
+        by_id(),
+        keyset(),
+        newest('owner_id'),
+        keyset('is_available'),
+    ],
+    'vehicle_sales': [
+        by_id(),
+        newest('seller_id'),
+        keyset('status'),
+    ],
+    'vehicle_inquiries': [
+        by_id(),
+        newest('status'),
+    ],
+    'vehicle_bookings': [
+        by_id(),
+        newest('owner_id'),
+    ],
+    'job_offers': [
+        by_id(),
+        newest(),
+        newest('service_provider_id'),
+        newest('customer_id'),
+        newest('status'),
+    ],
+    'company_job_offers': [
+        by_id(),
+        newest('company_id'),
+        keyset('is_active'),
+    ],
+    'company_services': [
+        by_id(),
+        index([('company_id', ASCENDING)]),
+        keyset(),
+        keyset('category'),
+    ],
+    'reviews': [
+        newest('service_provider_id'),
+        # One review per customer and job. Databases created before it was
+        # unique have a plain index of that name, rebuilt by ensure_indexes
+        # once no pair is reviewed twice (see repair_rating_summaries.py)
+        index([('job_id', ASCENDING), ('customer_id', ASCENDING)], unique=True),
+    ],
+    'notifications': [
+        newest('user_id', 'user_type'),
+        index([('user_id', ASCENDING), ('user_type', ASCENDING), ('is_read', ASCENDING)]),
+    ],
+    'customer_notifications': [
+        newest('customer_id'),
+        newest('customer_phone'),
+        newest('customer_phone_canonical'),
+    ],
+    'chat_messages': [
+        newest(),
+        index([('rental_id', ASCENDING), ('created_at', ASCENDING)]),
+        index([('sender_id', ASCENDING)]),
+    ],
+    'visit_requests': [
+        by_id(),
+        newest(),
+        newest('provider_id'),
+        newest('owner_id'),
+        newest('customer_phone'),
+        newest('customer_phone_canonical'),
+        newest('rental_id'),
+    ],
+    'property_inquiries': [
+        by_id(),
+        newest('customer_id'),
+        newest('status'),
+    ],
+    'payments': [
+        by_id(),
+        newest(),
+        index([('job_id', ASCENDING)]),
+        newest('provider_id', 'status'),
+        newest('customer_phone'),
+        newest('status'),
+    ],
+    'refund_requests': [
+        by_id(),
+        newest(),
+        newest('customer_id'),
+    ],
+    'credit_transactions': [
+        newest('customer_id'),
+    ],
+    'no_show_reports': [
+        index([('payment_id', ASCENDING)]),
+    ],
+    'feedbacks': [
+        by_id(),
+        newest(),
+        newest('status'),
+    ],
+    'service_fees': [
+        index([('profession', ASCENDING)], unique=True),
+    ],
+    'admin_settings': [
+        index([('type', ASCENDING)]),
+    ],
+}
+
+# Text search and location token indexes (search.py)
+for _name in SEARCH_FIELDS:
+    INDEX_SPEC[_name] = INDEX_SPEC.get(_name, []) + search_indexes()
+
+# Indexes other modules create on these collections; not reported as extra
+EXTERNAL_INDEXES = {
+    'service_providers': {'phone_canonical_unique'},
+    'customers': {'phone_canonical_unique'},
+    'companies': {'phone_canonical_unique'},
+}
+
+# Sort of the paginated public listings, and the filter a cursor adds
+PAGE_SORT = [('created_at', -1), ('id', -1)]
+AFTER_CURSOR = {'$or': [{'created_at': {'$lt': 'x'}}, {'created_at': 'x', 'id': {'$lt': 'x'}}]}
+RANK_SORT = [('rank', -1), ('id', -1)]
+AFTER_RANK_CURSOR = {'$or': [{'rank': {'$lt': 1}}, {'rank': 1, 'id': {'$lt': 'x'}}, {'rank': None}]}
+
+# Representative filters and sorts of the API's frequent queries
+# (collection, filter, sort); values are placeholders, only the shape matters
+HOT_QUERIES = [
+    ('service_providers', {'id': 'x'}, None),
+    ('service_providers', {}, PAGE_SORT),
+    ('service_providers', AFTER_CURSOR, PAGE_SORT),
+    ('service_providers', {'verification_status': 'approved'}, [('created_at', -1)]),
+    ('service_providers', {'profession': 'AgentImmobilier'}, [('created_at', -1)]),
+    ('service_providers', {}, RANK_SORT),
+    ('service_providers', {'profession': 'x'}, RANK_SORT),
+    ('service_providers', {'profession': 'x', **AFTER_RANK_CURSOR}, RANK_SORT),
+    ('service_providers', {'profession': 'x', 'region': 'x', 'ville': 'x'}, RANK_SORT),
+    ('service_providers', {'region': 'x', 'ville': 'x', 'commune': 'x'}, RANK_SORT),
+    ('service_providers', {'verification_status': 'approved', 'profession': 'x'}, RANK_SORT),
+    ('service_providers', {'online_status': True, 'profession': 'x'}, RANK_SORT),
+    ('service_providers', {'online_status': True, 'verification_status': 'approved'}, RANK_SORT),
+    ('customers', {'id': 'x'}, None),
+    ('customers', {'phone_number': {'$in': ['x', 'y']}}, None),
+    ('companies', {'id': 'x', 'verification_status': 'approved'}, None),
+    ('companies', {'verification_status': 'approved'}, PAGE_SORT),
+    ('companies', {'$and': [{'verification_status': 'approved'}, AFTER_CURSOR]}, PAGE_SORT),
+    ('companies', {'rccm_number': 'x'}, None),
+    ('admins', {'username': 'x'}, None),
+    ('rental_listings', {'id': 'x'}, None),
+    ('rental_listings', {'service_provider_id': 'x'}, [('created_at', -1)]),
+    ('rental_listings', {'approval_status': 'approved', 'is_available': True}, PAGE_SORT),
+    ('rental_listings', {'$and': [{'approval_status': 'approved'}, AFTER_CURSOR]}, PAGE_SORT),
+    ('property_sales', {'id': 'x'}, None),
+    ('property_sales', {'agent_id': 'x'}, [('created_at', -1)]),
+    ('property_sales', {'status': 'approved', 'is_available': True}, PAGE_SORT),
+    ('property_sales', {'$and': [{'status': 'approved', 'is_available': True}, AFTER_CURSOR]}, PAGE_SORT),
+    ('vehicle_listings', {'id': 'x'}, None),
+    ('vehicle_listings', {'owner_id': 'x'}, [('created_at', -1)]),
+    ('vehicle_listings', {'is_available': True}, PAGE_SORT),
+    ('vehicle_listings', {'$and': [{'is_available': True}, AFTER_CURSOR]}, PAGE_SORT),
+    ('vehicle_sales', {'seller_id': 'x'}, [('created_at', -1)]),
+    ('vehicle_sales', {'status': 'approved'}, PAGE_SORT),
+    ('vehicle_sales', {'$and': [{'status': 'approved'}, AFTER_CURSOR]}, PAGE_SORT),
+    ('vehicle_bookings', {'owner_id': 'x'}, [('created_at', -1)]),
+    ('job_offers', {'id': 'x'}, None),
+    ('job_offers', {'service_provider_id': 'x'}, [('created_at', -1)]),
+    ('job_offers', {'status': {'$in': ['Accepted', 'ProviderCompleted']}}, [('created_at', -1)]),
+    ('company_job_offers', {'company_id': 'x'}, [('created_at', -1)]),
+    ('company_job_offers', {'is_active': True}, PAGE_SORT),
+    ('company_job_offers', {'$and': [{'is_active': True}, AFTER_CURSOR]}, PAGE_SORT),
+    ('company_services', {'company_id': 'x'}, None),
+    ('company_services', {}, PAGE_SORT),
+    ('company_services', {'category': 'x'}, PAGE_SORT),
+    ('reviews', {'service_provider_id': 'x'}, [('created_at', -1)]),
+    ('reviews', {'job_id': 'x', 'customer_id': 'x'}, None),
+    ('notifications', {'user_id': 'x', 'user_type': 'provider'}, [('created_at', -1)]),
+    ('notifications', {'user_id': 'x', 'user_type': 'provider', 'is_read': False}, None),
+    ('customer_notifications', {'$or': [{'customer_id': 'x'}, {'customer_phone_canonical': 'x'}, {'customer_phone': 'x'}]}, [('created_at', -1)]),
+    ('chat_messages', {'rental_id': 'x'}, [('created_at', 1)]),
+    ('visit_requests', {'$or': [{'provider_id': 'x'}, {'owner_id': 'x'}]}, [('created_at', -1)]),
+    ('visit_requests', {'$or': [{'customer_phone_canonical': 'x'}, {'customer_phone': 'x'}]}, [('created_at', -1)]),
+    ('visit_requests', {'rental_id': 'x'}, [('created_at', -1)]),
+    ('property_inquiries', {'customer_id': 'x'}, [('created_at', -1)]),
+    ('payments', {'job_id': 'x'}, None),
+    ('payments', {'provider_id': 'x', 'status': 'completed'}, [('created_at', -1)]),
+    ('payments', {'customer_phone': 'x'}, [('created_at', -1)]),
+    ('refund_requests', {'customer_id': 'x'}, [('created_at', -1)]),
+    ('credit_transactions', {'customer_id': 'x'}, [('created_at', -1)]),
+    ('service_fees', {'profession': 'x'}, None),
+    ('admin_settings', {'type': 'platform_settings'}, None),
+    ('rental_listings', {'$text': {'$search': 'x'}, 'approval_status': 'approved'}, None),
+    ('property_sales', {'$text': {'$search': 'x'}, 'status': 'approved'}, None),
+    ('vehicle_listings', {'$text': {'$search': 'x'}}, None),
+    ('companies', {'$text': {'$search': 'x'}, 'verification_status': 'approved'}, None),
+    ('property_sales', {'status': 'approved', 'search.location_tokens': {'$regex': '^x'}}, PAGE_SORT),
+    ('vehicle_listings', {'search.location_tokens': {'$regex': '^x'}}, PAGE_SORT),
+    ('company_job_offers', {'is_active': True, 'search.location_tokens': {'$regex': '^x'}}, PAGE_SORT),
+    ('company_services', {'search.location_tokens': {'$regex': '^x'}}, PAGE_SORT),
+]
+
+
+def _key(model: IndexModel) -> Optional[list]:
+    """Key to compare with index_information(); None for text indexes, which report internal keys"""
+    key = list(model.document['key'].items())
+    if any(direction == 'text' for _, direction in key):
+        return None
+    return key
+
+
+# Index exists under this name or these keys with other options
+INDEX_CONFLICT_CODES = (85, 86)  # IndexOptionsConflict, IndexKeySpecsConflict
+
+
+async def _rebuild_index(collection, model: IndexModel, conflict: OperationFailure):
+    """
+    Replace the index the spec entry conflicts with (same name or keys,
+    other options). If the new one can't be built (duplicates under a new
+    unique constraint) the old one is restored, so its queries stay indexed.
+    """
+    existing = await collection.index_information()
+    key = list(model.document['key'].items())
+    old_name = next((name for name, info in existing.items()
+                     if name == model.document['name'] or list(info['key']) == key), None)
+    if old_name is None:
+        raise conflict
+    old = existing[old_name]
+    await collection.drop_index(old_name)
+    try:
+        await collection.create_indexes([model])
+    except OperationFailure:
+        options = {k: v for k, v in old.items() if k not in ('key', 'v', 'ns')}
+        await collection.create_indexes([IndexModel(list(old['key']), name=old_name, **options)])
+        raise
+    logger.info(f"Index {collection.name}.{old_name} rebuilt as {model.document['name']}")
+
+
+async def ensure_indexes(db, spec: Dict[str, List[IndexModel]] = INDEX_SPEC) -> dict:
+    """
+    Create every index in the spec. Existing identical indexes are a no-op,
+    so this runs on every startup. An index whose options changed is
+    rebuilt; one that can't be built (duplicate values under a unique
+    index) is logged and skipped, keeping the index it would replace.
+    """
+    report = {'collections': 0, 'failed': []}
+    for name, models in spec.items():
+        try:
+            await db[name].create_indexes(models)
+        except OperationFailure:
+            # Retry one by one to build the others and name the culprit
+            for model in models:
+                try:
+                    try:
+                        await db[name].create_indexes([model])
+                    except OperationFailure as e:
+                        if e.code not in INDEX_CONFLICT_CODES:
+                            raise
+                        await _rebuild_index(db[name], model, e)
+                except OperationFailure as e:
+                    logger.error(f"Index {name}.{model.document['name']} not created: {e}")
+                    report['failed'].append(f"{name}.{model.document['name']}")
+        report['collections'] += 1
+    return report
+
+
+async def diff_indexes(db, spec: Dict[str, List[IndexModel]] = INDEX_SPEC) -> Dict[str, dict]:
+    """
+    Per collection: indexes of the spec that are missing (or exist under the
+    same name with other keys) and indexes in the database the spec doesn't
+    know about. Collections without differences are omitted.
+    """
+    diff = {}
+    for name, models in spec.items():
+        existing = await db[name].index_information()
+        expected = {model.document['name']: _key(model) for model in models}
+        missing = [
+            index_name for index_name, key in expected.items()
+            if index_name not in existing or (key is not None and list(existing[index_name]['key']) != key)
+        ]
+        extra = [
+            index_name for index_name in existing
+            if index_name != '_id_'
+            and index_name not in expected
+            and index_name not in EXTERNAL_INDEXES.get(name, ())
+        ]
+        if missing or extra:
+            diff[name] = {'missing': missing, 'extra': extra}
+    return diff
+
+
+def _plan_stages(plan: dict):
+    """Every stage of an explain() plan tree"""
+    yield plan.get('stage')
+    for child in ('inputStage', 'queryPlan'):
+        if child in plan:
+            yield from _plan_stages(plan[child])
+    for stage in plan.get('inputStages', []):
+        yield from _plan_stages(stage)
+
+
+def winning_plan(explain: dict) -> dict:
+    planner = explain.get('queryPlanner', {})
+    # Slot-based engine plans nest the classic tree under queryPlan
+    plan = planner.get('winningPlan', {})
+    return plan.get('queryPlan', plan)
+
+
+async def explain_hot_queries(db, queries: Optional[list] = None) -> List[dict]:
+    """Winning plan stages of each hot query; collscan is True for full scans"""
+    results = []
+    for name, query, sort in queries or HOT_QUERIES:
+        cursor = db[name].find(query, {'_id': 0}).limit(100)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        stages = [stage for stage in _plan_stages(winning_plan(explain)) if stage]
+        results.append({
+            'collection': name,
+            'filter': query,
+            'sort': sort,
+            'stages': stages,
+            'collscan': 'COLLSCAN' in stages
+        })
+    return results
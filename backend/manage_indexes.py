@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Compare the database indexes with the spec in indexes.py.
+
+Prints, per collection, the indexes of the spec that are missing and the
+ones in the database the spec doesn't list. With --apply, creates the
+missing indexes (the API also does this at startup). With --explain, runs
+the API's hot queries through explain() and exits with status 1 if any of
+them does a COLLSCAN.
+
+Usage:
+    python manage_indexes.py [--apply] [--explain]
+"""
+
+import os
+import sys
+import asyncio
+import argparse
+from pathlib import Path
+from motor.motor_asyncio import AsyncIOMotorClient
+from dotenv import load_dotenv
+
+# Load environment
+load_dotenv(Path(__file__).parent / '.env')
+
+from indexes import INDEX_SPEC, ensure_indexes, diff_indexes, explain_hot_queries
+
+# MongoDB connection
+mongo_url = os.environ['MONGO_URL']
+client = AsyncIOMotorClient(mongo_url)
+db = client[os.environ['DB_NAME']]
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description="Diff, apply and verify the MongoDB index spec")
+    parser.add_argument('--apply', action='store_true', help="Create missing indexes")
+    parser.add_argument('--explain', action='store_true', help="Fail if a hot query does a COLLSCAN")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"Index spec: {sum(len(models) for models in INDEX_SPEC.values())} indexes on {len(INDEX_SPEC)} collections")
+    print("=" * 60)
+
+    if args.apply:
+        report = await ensure_indexes(db)
+        print(f"\nApplied on {report['collections']} collections, {len(report['failed'])} failed")
+        for name in report['failed']:
+            print(f"  ✗ {name}")
+
+    diff = await diff_indexes(db)
+    if not diff:
+        print("\nIndexes match the spec")
+    for name, changes in diff.items():
+        print(f"\n{name}")
+        for index_name in changes['missing']:
+            print(f"  + {index_name} (missing)")
+        for index_name in changes['extra']:
+            print(f"  - {index_name} (not in spec)")
+
+    status = 0
+    if args.explain:
+        print("\nQuery plans:")
+        for result in await explain_hot_queries(db):
+            mark = "✗" if result['collscan'] else "✓"
+            sort = f" sort {result['sort']}" if result['sort'] else ""
+            print(f"  {mark} {result['collection']} {result['filter']}{sort}: {' <- '.join(result['stages'])}")
+            if result['collscan']:
+                status = 1
+        if status:
+            print("\nSome hot queries scan whole collections")
+
+    print("\n" + "=" * 60)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -2,19 +2,38 @@
 """
 Migration script to transfer all local files to Cloudinary
 and update database references.
+
+Each collection is streamed with a cursor and its files are uploaded by a
+bounded pool of concurrent workers through the content store, so identical
+files are uploaded once. Each document takes its own stored_files
+reference on every file it points to, like an upload through the API, and
+that reference is checkpointed per (document, file) in
+migration_checkpoints: a rerun after a failure or interruption reuses it
+instead of taking another one and only retries what is left. Document
+updates are sent in concurrent batches and guarded on the old values, so
+edits made while the migration runs are never overwritten; the references
+taken for a document whose guard missed are released again.
+
+Usage:
+    python migrate_to_cloudinary.py [--dry-run] [--collection service_providers ...] [--concurrency 8]
 """
 
 import os
+import time
 import asyncio
+import argparse
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 import cloudinary
-import cloudinary.uploader
 
 # Load environment
 load_dotenv(Path(__file__).parent / '.env')
 
+from storage import LOCAL_UPLOAD_URL_PREFIX, ContentStore, StorageDeletionQueue, UnclosableReader, build_storage_backends
+from versions import bump_versions
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
@@ -28,398 +47,262 @@ cloudinary.config(
     secure=True
 )
 
-UPLOAD_DIR = Path("/app/backend/uploads")
+UPLOAD_DIR = Path(os.environ.get('UPLOAD_DIR', '/app/backend/uploads'))
 
-def upload_file_to_cloudinary(file_path: Path, folder: str) -> dict:
-    """Upload a single file to Cloudinary"""
-    try:
-        file_ext = file_path.suffix.lower()
-        
-        # Determine resource type
-        if file_ext in ['.pdf', '.doc', '.docx']:
-            resource_type = "raw"
-        else:
-            resource_type = "image"
-        
-        # Upload to Cloudinary
-        result = cloudinary.uploader.upload(
-            str(file_path),
-            folder=folder,
-            resource_type=resource_type,
-            overwrite=True
+UPLOAD_TIMEOUT_SECONDS = 120
+UPLOAD_RETRIES = 2
+UPDATE_BATCH_SIZE = 100
+
+# collection -> {field: Cloudinary folder}; fields hold a URL, a list of URLs
+# or a list of {path: url} documents
+MIGRATIONS = {
+    'service_providers': {
+        'profile_picture': 'servispro/profiles',
+        'id_verification_picture': 'servispro/id_verification',
+        'documents': 'servispro/documents',
+    },
+    'companies': {
+        'logo': 'servispro/company_logos',
+        'licence_exploitation': 'servispro/company_documents',
+        'rccm_document': 'servispro/company_documents',
+        'nif_document': 'servispro/company_documents',
+        'attestation_fiscale': 'servispro/company_documents',
+        'documents_additionnels': 'servispro/company_documents',
+    },
+    'rental_listings': {
+        'photos': 'servispro/rentals',
+        'titre_foncier': 'servispro/rental_documents',
+        'registration_ministere': 'servispro/rental_documents',
+        'seller_id_document': 'servispro/rental_documents',
+        'document_ministere_habitat': 'servispro/rental_documents',
+        'document_batiment': 'servispro/rental_documents',
+    },
+    'property_sales': {
+        'photos': 'servispro/property_sales',
+    },
+    'vehicle_listings': {
+        'photos': 'servispro/vehicles',
+    },
+}
+
+
+def is_local(url) -> bool:
+    return isinstance(url, str) and url.startswith(LOCAL_UPLOAD_URL_PREFIX)
+
+
+class Stats:
+    def __init__(self):
+        self.documents = 0
+        self.updated = 0
+        self.migrated = 0
+        self.deduplicated = 0
+        self.resumed = 0
+        self.missing = 0
+        self.failed = 0
+        self.conflicts = 0
+        self.bytes = 0
+        self.started = time.monotonic()
+
+    def add(self, other: "Stats"):
+        for name in ('documents', 'updated', 'conflicts', 'migrated', 'deduplicated', 'resumed', 'missing', 'failed', 'bytes'):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def summary(self) -> str:
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        return (f"{self.documents} documents, {self.updated} updated, {self.conflicts} changed meanwhile | "
+                f"{self.migrated} files migrated ({self.deduplicated} deduplicated), {self.resumed} from checkpoint, "
+                f"{self.missing} missing, {self.failed} failed | "
+                f"{self.bytes / (1024 * 1024):.1f} MB in {elapsed:.1f}s "
+                f"({self.migrated / elapsed:.1f} files/s, {self.bytes / (1024 * 1024) / elapsed:.2f} MB/s)")
+
+
+class Migrator:
+    def __init__(self, db, content_store: ContentStore, deletions: StorageDeletionQueue, upload_dir: Path,
+                 concurrency: int, dry_run: bool):
+        self.db = db
+        self.content_store = content_store
+        self.deletions = deletions
+        self.upload_dir = upload_dir
+        self.dry_run = dry_run
+        self.upload_slots = asyncio.Semaphore(concurrency)
+        # Bounds documents in flight so the cursor doesn't run ahead of the uploads
+        self.document_slots = asyncio.Semaphore(concurrency * 4)
+
+    async def migrate_file(self, url: str, folder: str, owner: dict, stats: Stats) -> str:
+        """
+        New URL for a local file, or the original URL if it can't be migrated.
+        A new URL comes with a stored_files reference held for owner.
+        """
+        ref = url[len(LOCAL_UPLOAD_URL_PREFIX):]
+        checkpoint_id = f"cloudinary:{owner['collection']}:{owner['document_id']}:{ref}"
+        checkpoint = await self.db.migration_checkpoints.find_one({'_id': checkpoint_id})
+        if checkpoint:
+            stats.resumed += 1
+            return checkpoint['url']
+
+        file_path = self.upload_dir / ref
+        if not file_path.is_file():
+            stats.missing += 1
+            return url
+        if self.dry_run:
+            stats.migrated += 1
+            stats.bytes += file_path.stat().st_size
+            return url
+
+        file_ext = file_path.suffix.lower().lstrip('.') or 'jpg'
+        resource_type = "raw" if file_ext in ['pdf', 'doc', 'docx'] else "image"
+        async with self.upload_slots:
+            try:
+                with open(file_path, 'rb') as f:
+                    # Content already stored by another document is only referenced, not uploaded again
+                    stored = await self.content_store.put(
+                        UnclosableReader(f, file_path.name),
+                        folder=folder,
+                        ext=file_ext,
+                        resource_type=resource_type
+                    )
+            except Exception as e:
+                print(f"    ✗ {ref}: {e!r}")
+                stats.failed += 1
+                return url
+
+        await self.db.migration_checkpoints.update_one(
+            {'_id': checkpoint_id},
+            {'$set': {'url': stored['url'], **owner}},
+            upsert=True
         )
-        
-        return {
-            "success": True,
-            "url": result.get("secure_url"),
-            "public_id": result.get("public_id")
-        }
-    except Exception as e:
-        return {
-            "success": False,
-            "error": str(e)
-        }
-
-async def migrate_provider_files():
-    """Migrate provider profile pictures and documents"""
-    print("\n=== Migrating Provider Files ===")
-    
-    providers = await db.service_providers.find({}).to_list(1000)
-    migrated = 0
-    failed = 0
-    
-    for provider in providers:
-        updates = {}
-        
-        # Migrate profile picture
-        if provider.get('profile_picture') and provider['profile_picture'].startswith('/api/uploads/'):
-            filename = provider['profile_picture'].replace('/api/uploads/', '')
-            file_path = UPLOAD_DIR / filename
-            
-            if file_path.exists():
-                print(f"  Migrating profile picture for {provider.get('first_name', 'Unknown')}...")
-                result = upload_file_to_cloudinary(file_path, "servispro/profiles")
-                
-                if result["success"]:
-                    updates['profile_picture'] = result["url"]
-                    print(f"    ✓ Uploaded: {result['url'][:60]}...")
-                    migrated += 1
-                else:
-                    print(f"    ✗ Failed: {result['error']}")
-                    failed += 1
-        
-        # Migrate ID verification picture
-        if provider.get('id_verification_picture') and provider['id_verification_picture'].startswith('/api/uploads/'):
-            filename = provider['id_verification_picture'].replace('/api/uploads/', '')
-            file_path = UPLOAD_DIR / filename
-            
-            if file_path.exists():
-                print(f"  Migrating ID verification for {provider.get('first_name', 'Unknown')}...")
-                result = upload_file_to_cloudinary(file_path, "servispro/id_verification")
-                
-                if result["success"]:
-                    updates['id_verification_picture'] = result["url"]
-                    print(f"    ✓ Uploaded")
-                    migrated += 1
-                else:
-                    print(f"    ✗ Failed: {result['error']}")
-                    failed += 1
-        
-        # Migrate documents
-        if provider.get('documents'):
-            new_docs = []
-            for doc in provider['documents']:
-                doc_path = doc.get('path', '')
-                if doc_path.startswith('/api/uploads/'):
-                    filename = doc_path.replace('/api/uploads/', '')
-                    file_path = UPLOAD_DIR / filename
-                    
-                    if file_path.exists():
-                        print(f"  Migrating document: {doc.get('filename', 'unknown')}...")
-                        result = upload_file_to_cloudinary(file_path, "servispro/documents")
-                        
-                        if result["success"]:
-                            new_docs.append({
-                                **doc,
-                                'path': result["url"]
-                            })
-                            print(f"    ✓ Uploaded")
-                            migrated += 1
-                        else:
-                            new_docs.append(doc)  # Keep original on failure
-                            print(f"    ✗ Failed: {result['error']}")
-                            failed += 1
-                    else:
-                        new_docs.append(doc)
-                else:
-                    new_docs.append(doc)  # Already migrated or external URL
-            
-            if new_docs:
-                updates['documents'] = new_docs
-        
-        # Update provider in database
-        if updates:
-            await db.service_providers.update_one(
-                {'id': provider['id']},
-                {'$set': updates}
-            )
-    
-    print(f"\nProvider migration complete: {migrated} migrated, {failed} failed")
-    return migrated, failed
-
-async def migrate_company_files():
-    """Migrate company logos and documents"""
-    print("\n=== Migrating Company Files ===")
-    
-    companies = await db.companies.find({}).to_list(1000)
-    migrated = 0
-    failed = 0
-    
-    for company in companies:
-        updates = {}
-        
-        # Migrate logo
-        if company.get('logo') and company['logo'].startswith('/api/uploads/'):
-            filename = company['logo'].replace('/api/uploads/', '')
-            file_path = UPLOAD_DIR / filename
-            
-            if file_path.exists():
-                print(f"  Migrating logo for {company.get('company_name', 'Unknown')}...")
-                result = upload_file_to_cloudinary(file_path, "servispro/company_logos")
-                
-                if result["success"]:
-                    updates['logo'] = result["url"]
-                    print(f"    ✓ Uploaded")
-                    migrated += 1
-                else:
-                    print(f"    ✗ Failed: {result['error']}")
-                    failed += 1
-        
-        # Migrate documents (licence, rccm, nif, attestation_fiscale)
-        doc_fields = ['licence_exploitation', 'rccm_document', 'nif_document', 'attestation_fiscale']
-        for field in doc_fields:
-            if company.get(field) and company[field].startswith('/api/uploads/'):
-                filename = company[field].replace('/api/uploads/', '')
-                file_path = UPLOAD_DIR / filename
-                
-                if file_path.exists():
-                    print(f"  Migrating {field} for {company.get('company_name', 'Unknown')}...")
-                    result = upload_file_to_cloudinary(file_path, "servispro/company_documents")
-                    
-                    if result["success"]:
-                        updates[field] = result["url"]
-                        print(f"    ✓ Uploaded")
-                        migrated += 1
-                    else:
-                        print(f"    ✗ Failed: {result['error']}")
-                        failed += 1
-        
-        # Migrate additional documents
-        if company.get('documents_additionnels'):
-            new_docs = []
-            for doc_url in company['documents_additionnels']:
-                if doc_url.startswith('/api/uploads/'):
-                    filename = doc_url.replace('/api/uploads/', '')
-                    file_path = UPLOAD_DIR / filename
-                    
-                    if file_path.exists():
-                        print(f"  Migrating additional document...")
-                        result = upload_file_to_cloudinary(file_path, "servispro/company_documents")
-                        
-                        if result["success"]:
-                            new_docs.append(result["url"])
-                            print(f"    ✓ Uploaded")
-                            migrated += 1
-                        else:
-                            new_docs.append(doc_url)
-                            print(f"    ✗ Failed: {result['error']}")
-                            failed += 1
-                    else:
-                        new_docs.append(doc_url)
-                else:
-                    new_docs.append(doc_url)
-            
-            if new_docs:
-                updates['documents_additionnels'] = new_docs
-        
-        # Update company in database
-        if updates:
-            await db.companies.update_one(
-                {'id': company['id']},
-                {'$set': updates}
-            )
-    
-    print(f"\nCompany migration complete: {migrated} migrated, {failed} failed")
-    return migrated, failed
-
-async def migrate_rental_files():
-    """Migrate rental listing photos and documents"""
-    print("\n=== Migrating Rental Files ===")
-    
-    rentals = await db.rental_listings.find({}).to_list(1000)
-    migrated = 0
-    failed = 0
-    
-    for rental in rentals:
-        updates = {}
-        
-        # Migrate photos
-        if rental.get('photos'):
-            new_photos = []
-            for photo_url in rental['photos']:
-                if photo_url.startswith('/api/uploads/'):
-                    filename = photo_url.replace('/api/uploads/', '')
-                    file_path = UPLOAD_DIR / filename
-                    
-                    if file_path.exists():
-                        print(f"  Migrating rental photo for {rental.get('title', 'Unknown')[:30]}...")
-                        result = upload_file_to_cloudinary(file_path, "servispro/rentals")
-                        
-                        if result["success"]:
-                            new_photos.append(result["url"])
-                            migrated += 1
-                        else:
-                            new_photos.append(photo_url)
-                            failed += 1
-                    else:
-                        new_photos.append(photo_url)
-                else:
-                    new_photos.append(photo_url)
-            
-            if new_photos:
-                updates['photos'] = new_photos
-        
-        # Migrate documents
-        doc_fields = ['titre_foncier', 'registration_ministere', 'seller_id_document', 'document_ministere_habitat', 'document_batiment']
-        for field in doc_fields:
-            if rental.get(field) and rental[field].startswith('/api/uploads/'):
-                filename = rental[field].replace('/api/uploads/', '')
-                file_path = UPLOAD_DIR / filename
-                
-                if file_path.exists():
-                    result = upload_file_to_cloudinary(file_path, "servispro/rental_documents")
-                    if result["success"]:
-                        updates[field] = result["url"]
-                        migrated += 1
-                    else:
-                        failed += 1
-        
-        if updates:
-            await db.rental_listings.update_one(
-                {'id': rental['id']},
-                {'$set': updates}
-            )
-    
-    print(f"\nRental migration complete: {migrated} migrated, {failed} failed")
-    return migrated, failed
-
-async def migrate_property_sale_files():
-    """Migrate property sale photos and documents"""
-    print("\n=== Migrating Property Sale Files ===")
-    
-    sales = await db.property_sales.find({}).to_list(1000)
-    migrated = 0
-    failed = 0
-    
-    for sale in sales:
-        updates = {}
-        
-        # Migrate photos
-        if sale.get('photos'):
-            new_photos = []
-            for photo_url in sale['photos']:
-                if photo_url.startswith('/api/uploads/'):
-                    filename = photo_url.replace('/api/uploads/', '')
-                    file_path = UPLOAD_DIR / filename
-                    
-                    if file_path.exists():
-                        print(f"  Migrating sale photo for {sale.get('title', 'Unknown')[:30]}...")
-                        result = upload_file_to_cloudinary(file_path, "servispro/property_sales")
-                        
-                        if result["success"]:
-                            new_photos.append(result["url"])
-                            migrated += 1
-                        else:
-                            new_photos.append(photo_url)
-                            failed += 1
-                    else:
-                        new_photos.append(photo_url)
-                else:
-                    new_photos.append(photo_url)
-            
-            if new_photos:
-                updates['photos'] = new_photos
-        
-        if updates:
-            await db.property_sales.update_one(
-                {'id': sale['id']},
-                {'$set': updates}
-            )
-    
-    print(f"\nProperty sale migration complete: {migrated} migrated, {failed} failed")
-    return migrated, failed
-
-async def migrate_vehicle_files():
-    """Migrate vehicle photos"""
-    print("\n=== Migrating Vehicle Files ===")
-    
-    vehicles = await db.vehicle_listings.find({}).to_list(1000)
-    migrated = 0
-    failed = 0
-    
-    for vehicle in vehicles:
-        updates = {}
-        
-        if vehicle.get('photos'):
-            new_photos = []
-            for photo_url in vehicle['photos']:
-                if photo_url.startswith('/api/uploads/'):
-                    filename = photo_url.replace('/api/uploads/', '')
-                    file_path = UPLOAD_DIR / filename
-                    
-                    if file_path.exists():
-                        print(f"  Migrating vehicle photo...")
-                        result = upload_file_to_cloudinary(file_path, "servispro/vehicles")
-                        
-                        if result["success"]:
-                            new_photos.append(result["url"])
-                            migrated += 1
-                        else:
-                            new_photos.append(photo_url)
-                            failed += 1
-                    else:
-                        new_photos.append(photo_url)
-                else:
-                    new_photos.append(photo_url)
-            
-            if new_photos:
-                updates['photos'] = new_photos
-        
-        if updates:
-            await db.vehicle_listings.update_one(
-                {'id': vehicle['id']},
-                {'$set': updates}
-            )
-    
-    print(f"\nVehicle migration complete: {migrated} migrated, {failed} failed")
-    return migrated, failed
+        stats.migrated += 1
+        stats.deduplicated += stored['deduplicated']
+        stats.bytes += stored['size']
+        return stored['url']
+
+    async def migrate_value(self, value, folder: str, files: dict, owner: dict, stats: Stats):
+        """Migrated copy of a field value (URL, list of URLs or list of {path: url})"""
+        if is_local(value):
+            # One reference per distinct file of a document, as deleting it releases each URL once
+            if value not in files:
+                files[value] = asyncio.ensure_future(self.migrate_file(value, folder, owner, stats))
+            return await files[value]
+        if isinstance(value, list):
+            return list(await asyncio.gather(*(self.migrate_value(item, folder, files, owner, stats) for item in value)))
+        if isinstance(value, dict) and is_local(value.get('path')):
+            return {**value, 'path': await self.migrate_value(value['path'], folder, files, owner, stats)}
+        return value
+
+    async def migrate_document(self, name: str, doc: dict, fields: dict, stats: Stats, operations: list):
+        try:
+            owner = {'collection': name, 'document_id': doc['_id']}
+            files = {}
+            updates = {}
+            for field, folder in fields.items():
+                if field not in doc:
+                    continue
+                value = await self.migrate_value(doc[field], folder, files, owner, stats)
+                if value != doc[field]:
+                    updates[field] = value
+            if updates:
+                # Only applies if none of the migrated fields changed meanwhile
+                guard = {'_id': doc['_id'], **{field: doc[field] for field in updates}}
+                taken = [task.result() for url, task in files.items() if task.result() != url]
+                operations.append((guard, updates, taken))
+        finally:
+            self.document_slots.release()
+
+    async def release(self, name: str, document_id, urls: list):
+        """Drop the references taken for a document that was not updated"""
+        await self.deletions.enqueue(urls, reason=f"migration of {name} {document_id} superseded")
+        await self.db.migration_checkpoints.delete_many({'collection': name, 'document_id': document_id})
+
+    async def flush(self, collection, operations: list, stats: Stats):
+        if not operations or self.dry_run:
+            operations.clear()
+            return
+        batch = operations[:]
+        operations.clear()
+        # One update_one per document: its matched_count tells whether the guard held
+        results = await asyncio.gather(*(
+            collection.update_one(guard, {'$set': updates}) for guard, updates, _ in batch
+        ))
+        for (guard, _, taken), result in zip(batch, results):
+            if result.matched_count:
+                stats.updated += result.modified_count
+            else:
+                stats.conflicts += 1
+                await self.release(collection.name, guard['_id'], taken)
+
+    async def migrate_collection(self, name: str) -> Stats:
+        print(f"\n=== Migrating {name} ===")
+        fields = MIGRATIONS[name]
+        collection = self.db[name]
+        stats = Stats()
+        operations = []
+        pending = set()
+
+        query = {'$or': [
+            {field: {'$regex': f'^{LOCAL_UPLOAD_URL_PREFIX}'}} for field in fields
+        ] + [
+            {f'{field}.path': {'$regex': f'^{LOCAL_UPLOAD_URL_PREFIX}'}} for field in fields
+        ]}
+        projection = {'_id': 1, **{field: 1 for field in fields}}
+
+        async for doc in collection.find(query, projection).sort('_id', 1):
+            stats.documents += 1
+            await self.document_slots.acquire()
+            task = asyncio.create_task(self.migrate_document(name, doc, fields, stats, operations))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+            if len(operations) >= UPDATE_BATCH_SIZE:
+                await self.flush(collection, operations, stats)
+        if pending:
+            await asyncio.gather(*pending)
+        await self.flush(collection, operations, stats)
+        if stats.updated:
+            # Invalidates the ETags of the catalog endpoints serving these URLs
+            await bump_versions(self.db, name)
+
+        print(f"  {stats.summary()}")
+        return stats
+
 
 async def main():
+    parser = argparse.ArgumentParser(description="Migrate local uploads to Cloudinary")
+    parser.add_argument('--dry-run', action='store_true', help="Report what would be migrated without uploading")
+    parser.add_argument('--collection', action='append', choices=list(MIGRATIONS), help="Only migrate this collection (repeatable)")
+    parser.add_argument('--concurrency', type=int, default=8, help="Concurrent uploads")
+    args = parser.parse_args()
+
     print("=" * 60)
-    print("CLOUDINARY MIGRATION SCRIPT")
+    print("CLOUDINARY MIGRATION SCRIPT" + (" (DRY RUN)" if args.dry_run else ""))
     print("=" * 60)
     print(f"\nLocal upload directory: {UPLOAD_DIR}")
-    print(f"Files to migrate: {len(list(UPLOAD_DIR.glob('*')))}")
-    
-    total_migrated = 0
-    total_failed = 0
-    
-    # Run all migrations
-    m, f = await migrate_provider_files()
-    total_migrated += m
-    total_failed += f
-    
-    m, f = await migrate_company_files()
-    total_migrated += m
-    total_failed += f
-    
-    m, f = await migrate_rental_files()
-    total_migrated += m
-    total_failed += f
-    
-    m, f = await migrate_property_sale_files()
-    total_migrated += m
-    total_failed += f
-    
-    m, f = await migrate_vehicle_files()
-    total_migrated += m
-    total_failed += f
-    
+    print(f"Concurrency: {args.concurrency}")
+
+    executor = ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="migrate")
+    content_store = ContentStore(
+        db,
+        build_storage_backends(UPLOAD_DIR, 'cloudinary'),
+        'cloudinary',
+        executor,
+        timeout=UPLOAD_TIMEOUT_SECONDS,
+        retries=UPLOAD_RETRIES
+    )
+    # Released references are deleted by the API's storage deletion worker
+    deletions = StorageDeletionQueue(db, content_store, executor)
+    migrator = Migrator(db, content_store, deletions, UPLOAD_DIR, args.concurrency, args.dry_run)
+
+    total = Stats()
+    try:
+        for name in args.collection or MIGRATIONS:
+            total.add(await migrator.migrate_collection(name))
+    finally:
+        executor.shutdown(wait=False)
+
     print("\n" + "=" * 60)
-    print("MIGRATION COMPLETE")
+    print("MIGRATION COMPLETE" + (" (DRY RUN)" if args.dry_run else ""))
     print("=" * 60)
-    print(f"Total files migrated: {total_migrated}")
-    print(f"Total failures: {total_failed}")
+    print(total.summary())
+    if total.failed:
+        print("Some files failed; rerun the script to retry them (finished files are skipped)")
     print("=" * 60)
 
 if __name__ == "__main__":
@@ -0,0 +1,198 @@
+"""
+Phone number normalization shared by the API and maintenance scripts.
+
+Every provider, customer and company document carries a `phone_canonical`
+field (E.164 style, e.g. +224620000000) with a unique index, so a phone
+lookup is a single indexed equality query whatever format the user typed.
+Visit requests and customer notifications, which reference customers by
+phone, carry the same canonical form in `customer_phone_canonical`.
+
+Until the backfill has reached a document (or when it left it as a
+conflict) only its raw phone number is set: account lookups fall back to
+the spellings of the number the API used to store.
+"""
+
+import os
+import re
+import asyncio
+import logging
+from typing import List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+DEFAULT_PHONE_COUNTRY_CODE = os.environ.get('DEFAULT_PHONE_COUNTRY_CODE', '224')
+
+# Collections holding accounts identified by phone number
+PHONE_COLLECTIONS = ('service_providers', 'customers', 'companies')
+# Collections referencing a customer by phone number
+CUSTOMER_PHONE_COLLECTIONS = ('visit_requests', 'customer_notifications')
+
+# (collection, raw phone field, canonical field) kept in sync by the backfill
+PHONE_FIELDS = (
+    [(name, 'phone_number', 'phone_canonical') for name in PHONE_COLLECTIONS]
+    + [(name, 'customer_phone', 'customer_phone_canonical') for name in CUSTOMER_PHONE_COLLECTIONS]
+)
+
+# Part of the backfill checkpoint ids: bumped when canonical_phone changes
+# so the next backfill rescans every document
+PHONE_CANONICAL_VERSION = 2
+
+PHONE_BACKFILL_BATCH_SIZE = int(os.environ.get('PHONE_BACKFILL_BATCH_SIZE', '500'))
+
+_PHONE_SEPARATORS = re.compile(r'[\s\-.()/]')
+
+logger = logging.getLogger(__name__)
+
+
+def canonical_phone(phone: Optional[str]) -> Optional[str]:
+    """
+    Normalize a phone number to +<country code><number>.
+    Accepts the formats seen in the database and forms: 620000000,
+    0620000000, 224620000000, +224 620 00 00 00, 00224-620-000-000.
+    Numbers given with an explicit international prefix (+ or 00) keep
+    their own country code; anything else is assumed local. The national
+    trunk prefix 0 is dropped.
+    """
+    if not phone:
+        return None
+
+    cleaned = _PHONE_SEPARATORS.sub('', str(phone))
+    if cleaned.startswith('+'):
+        number = cleaned.lstrip('+')
+    elif cleaned.startswith('00'):
+        number = cleaned[2:]
+    elif cleaned.startswith(DEFAULT_PHONE_COUNTRY_CODE):
+        number = cleaned
+    else:
+        national = cleaned[1:] if cleaned.startswith('0') else cleaned
+        number = DEFAULT_PHONE_COUNTRY_CODE + national if national else ''
+    trunk = DEFAULT_PHONE_COUNTRY_CODE + '0'
+    if number.startswith(trunk):
+        number = DEFAULT_PHONE_COUNTRY_CODE + number[len(trunk):]
+    if not number or number == DEFAULT_PHONE_COUNTRY_CODE:
+        return None
+    return '+' + number
+
+
+def phone_filter(phone: Optional[str]) -> dict:
+    """Equality filter on phone_canonical that never matches documents lacking the field"""
+    return {'phone_canonical': canonical_phone(phone) or ''}
+
+
+def phone_variants(phone: Optional[str]) -> List[str]:
+    """Raw spellings a number may be stored under in documents without phone_canonical"""
+    canonical = canonical_phone(phone)
+    if canonical is None:
+        return []
+    variants = [str(phone).strip(), _PHONE_SEPARATORS.sub('', str(phone)), canonical, canonical[1:]]
+    prefix = '+' + DEFAULT_PHONE_COUNTRY_CODE
+    if canonical.startswith(prefix):
+        national = canonical[len(prefix):]
+        variants += [national, '0' + national]
+    return list(dict.fromkeys(variants))
+
+
+async def find_by_phone(collection, phone: Optional[str], projection: Optional[dict] = None) -> Optional[dict]:
+    """
+    Account with this phone number: the indexed phone_canonical match, then
+    the raw spellings for accounts the backfill hasn't reached or left as a
+    conflict
+    """
+    doc = await collection.find_one(phone_filter(phone), projection)
+    if doc is None and canonical_phone(phone):
+        doc = await collection.find_one({'phone_number': {'$in': phone_variants(phone)}}, projection)
+    return doc
+
+
+def customer_phone_clauses(phone: Optional[str]) -> List[dict]:
+    """$or clauses matching documents that reference a customer by this phone number"""
+    canonical = canonical_phone(phone)
+    clauses = [{'customer_phone_canonical': canonical}] if canonical else []
+    if phone:
+        # Documents the backfill hasn't reached yet
+        clauses.append({'customer_phone': phone})
+    return clauses
+
+
+def phone_checkpoint_id(name: str) -> str:
+    return f'phone_canonical:v{PHONE_CANONICAL_VERSION}:{name}'
+
+
+async def ensure_phone_indexes(db):
+    """Create the unique phone_canonical index on every account collection"""
+    for name in PHONE_COLLECTIONS:
+        # Partial so documents not yet backfilled don't collide on null
+        await db[name].create_index(
+            'phone_canonical',
+            unique=True,
+            partialFilterExpression={'phone_canonical': {'$type': 'string'}},
+            name='phone_canonical_unique'
+        )
+
+
+async def backfill_phone_canonical(db, batch_size: int = PHONE_BACKFILL_BATCH_SIZE, pause_seconds: float = 0.0) -> dict:
+    """
+    Set the canonical phone fields (PHONE_FIELDS) on existing documents,
+    walking each collection in _id order. Progress is checkpointed in
+    migration_checkpoints after every batch so the backfill can be
+    interrupted and resumed, and runs online alongside the API. Accounts
+    whose canonical number is already taken by another account are reported
+    as conflicts and left untouched.
+    """
+    report = {}
+    for name, source, target in PHONE_FIELDS:
+        collection = db[name]
+        checkpoint_id = phone_checkpoint_id(name)
+        checkpoint = await db.migration_checkpoints.find_one({'_id': checkpoint_id})
+        last_id = checkpoint.get('last_id') if checkpoint else None
+        stats = {'scanned': 0, 'updated': 0, 'conflicts': []}
+
+        while True:
+            query = {'_id': {'$gt': last_id}} if last_id is not None else {}
+            batch = await collection.find(
+                query,
+                {'_id': 1, 'id': 1, source: 1, target: 1}
+            ).sort('_id', 1).limit(batch_size).to_list(batch_size)
+            if not batch:
+                break
+
+            operations = []
+            pending = []
+            for doc in batch:
+                canonical = canonical_phone(doc.get(source))
+                if canonical and doc.get(target) != canonical:
+                    # Guard on the raw number so a concurrent profile update wins
+                    operations.append(UpdateOne(
+                        {'_id': doc['_id'], source: doc.get(source)},
+                        {'$set': {target: canonical}}
+                    ))
+                    pending.append(doc)
+
+            if operations:
+                try:
+                    result = await collection.bulk_write(operations, ordered=False)
+                    stats['updated'] += result.modified_count
+                except BulkWriteError as e:
+                    stats['updated'] += e.details.get('nModified', 0)
+                    for error in e.details.get('writeErrors', []):
+                        if error.get('code') == 11000:
+                            doc = pending[error['index']]
+                            stats['conflicts'].append({'id': doc.get('id'), 'phone_number': doc.get(source)})
+                        else:
+                            raise
+
+            stats['scanned'] += len(batch)
+            last_id = batch[-1]['_id']
+            await db.migration_checkpoints.update_one(
+                {'_id': checkpoint_id},
+                {'$set': {'last_id': last_id}},
+                upsert=True
+            )
+            if pause_seconds:
+                await asyncio.sleep(pause_seconds)
+
+        for conflict in stats['conflicts']:
+            logger.warning(f"{target} conflict in {name}: {conflict}")
+        report[name] = stats
+    return report
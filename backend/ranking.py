@@ -0,0 +1,143 @@
+"""
+Precomputed rank of service providers, the sort order of provider discovery.
+
+Each provider carries `rank_base`, a score built from its rating summary
+(ratings.py), its completed jobs and how recently it last completed one
+(RANK_WEIGHTS), and `rank`, which adds the online weight while the provider
+is online. rank_base is recomputed when a review or a completed job lands,
+and refreshed periodically since recency decays with time; `rank` is
+derived from rank_base and online_status by the database itself
+(ONLINE_RANK), so online toggles only need a single update.
+"""
+
+import os
+import math
+import asyncio
+from datetime import datetime, timezone, timedelta
+from typing import Iterable, Optional
+
+from pymongo import UpdateOne
+
+from ratings import summarize_provider
+
+# Bump when the scoring changes so the refresh recomputes every provider
+RANK_VERSION = 1
+
+RANK_WEIGHTS = {'rating': 50, 'jobs': 25, 'recency': 10, 'online': 15}
+
+# Bayesian prior: a provider starts as if it had RANK_PRIOR_REVIEWS reviews of RANK_PRIOR_RATING
+RANK_PRIOR_RATING = 3.5
+RANK_PRIOR_REVIEWS = 5
+# Completed jobs past which the jobs term is maxed out
+RANK_JOBS_SATURATION = 100
+# Days after which the recency term has decayed to 1/e
+RANK_RECENCY_DAYS = 180
+
+RANK_MAX_AGE_HOURS = float(os.environ.get('PROVIDER_RANK_MAX_AGE_HOURS', '24'))
+RANK_REFRESH_BATCH_SIZE = int(os.environ.get('PROVIDER_RANK_REFRESH_BATCH_SIZE', '200'))
+
+# rank from the stored rank_base and online_status, for pipeline updates
+ONLINE_RANK = {'$add': [
+    {'$ifNull': ['$rank_base', 0]},
+    {'$cond': [{'$eq': ['$online_status', True]}, RANK_WEIGHTS['online'], 0]}
+]}
+
+
+def _parse_time(value) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def rank_base(average_rating: Optional[float], review_count: int, completed_jobs: int,
+              last_active: Optional[datetime], now: datetime) -> float:
+    """Rank of a provider without the online weight"""
+    rating = ((average_rating or 0) * review_count + RANK_PRIOR_RATING * RANK_PRIOR_REVIEWS) / (review_count + RANK_PRIOR_REVIEWS)
+    jobs = min(math.log1p(completed_jobs) / math.log1p(RANK_JOBS_SATURATION), 1.0)
+    recency = 0.0
+    if last_active:
+        age_days = max((now - last_active).total_seconds() / 86400, 0)
+        recency = math.exp(-age_days / RANK_RECENCY_DAYS)
+    score = RANK_WEIGHTS['rating'] * rating / 5 + RANK_WEIGHTS['jobs'] * jobs + RANK_WEIGHTS['recency'] * recency
+    return round(score, 4)
+
+
+def new_provider_rank(created_at: str) -> dict:
+    """Rank fields of a provider that just registered (offline, no reviews nor jobs)"""
+    now = datetime.now(timezone.utc)
+    base = rank_base(None, 0, 0, _parse_time(created_at), now)
+    return {'rank_base': base, 'rank': base, 'rank_v': RANK_VERSION, 'rank_updated_at': now.isoformat()}
+
+
+def online_status_update(online: bool) -> list:
+    """Pipeline update setting online_status and the rank that follows from it"""
+    return [{'$set': {'online_status': online}}, {'$set': {'rank': ONLINE_RANK}}]
+
+
+async def refresh_provider_ranks(db, provider_ids: Iterable[str]) -> int:
+    """Recompute rank_base (and rank) of these providers; returns how many were updated"""
+    provider_ids = list(provider_ids)
+    if not provider_ids:
+        return 0
+
+    jobs = {
+        row['_id']: row async for row in db.job_offers.aggregate([
+            {'$match': {'service_provider_id': {'$in': provider_ids}, 'status': 'Completed'}},
+            {'$group': {'_id': '$service_provider_id', 'count': {'$sum': 1}, 'last': {'$max': '$completed_at'}}}
+        ])
+    }
+    providers = await db.service_providers.find(
+        {'id': {'$in': provider_ids}},
+        {'_id': 0, 'id': 1, 'created_at': 1, 'rating_summary': 1}
+    ).to_list(len(provider_ids))
+
+    now = datetime.now(timezone.utc)
+    operations = []
+    for provider in providers:
+        provider_id = provider['id']
+        summary = provider.get('rating_summary') or await summarize_provider(db, provider_id)
+        average = summary['sum'] / summary['count'] if summary['count'] else None
+        job = jobs.get(provider_id, {})
+        # A provider that never completed a job is as recent as its registration
+        last_active = _parse_time(job.get('last')) or _parse_time(provider.get('created_at'))
+        base = rank_base(average, summary['count'], job.get('count', 0), last_active, now)
+        operations.append(UpdateOne({'id': provider_id}, [
+            {'$set': {'rank_base': base, 'rank_v': RANK_VERSION, 'rank_updated_at': now.isoformat()}},
+            {'$set': {'rank': ONLINE_RANK}}
+        ]))
+    if not operations:
+        return 0
+    result = await db.service_providers.bulk_write(operations, ordered=False)
+    return result.modified_count
+
+
+async def refresh_stale_ranks(db, max_age_hours: float = RANK_MAX_AGE_HOURS,
+                              batch_size: int = RANK_REFRESH_BATCH_SIZE, pause_seconds: float = 0.0) -> int:
+    """
+    Recompute the rank of providers never ranked, ranked by an older
+    RANK_VERSION or last ranked more than max_age_hours ago. Walks the
+    collection in _id order, so it is safe to interrupt and rerun.
+    """
+    cutoff = (datetime.now(timezone.utc) - timedelta(hours=max_age_hours)).isoformat()
+    query = {'$or': [
+        {'rank_v': {'$ne': RANK_VERSION}},
+        {'rank_updated_at': {'$lt': cutoff}}
+    ]}
+    last_id = None
+    updated = 0
+
+    while True:
+        batch_query = {**query, '_id': {'$gt': last_id}} if last_id is not None else query
+        batch = await db.service_providers.find(batch_query, {'_id': 1, 'id': 1}).sort('_id', 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        updated += await refresh_provider_ranks(db, [doc['id'] for doc in batch if doc.get('id')])
+        last_id = batch[-1]['_id']
+        if pause_seconds:
+            await asyncio.sleep(pause_seconds)
+
+    return updated
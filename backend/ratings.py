@@ -0,0 +1,148 @@
+"""
+Rating summaries denormalized on service providers.
+
+Each provider carries `rating_summary`: the number of reviews, the sum of
+their ratings and a histogram of ratings 1-5. create_review maintains it
+with a single atomic $inc, so the rating stats of a provider page are one
+point read whatever its number of reviews.
+
+Providers registered before the summary existed are summarized from their
+reviews on first use; recompute_rating_summaries() rebuilds every summary
+from the reviews collection (repair_rating_summaries.py).
+"""
+
+import os
+from typing import Iterable, Optional
+
+from pymongo import UpdateOne
+
+RATING_VALUES = (1, 2, 3, 4, 5)
+
+RATING_REPAIR_BATCH_SIZE = int(os.environ.get('RATING_REPAIR_BATCH_SIZE', '500'))
+
+
+def empty_rating_summary() -> dict:
+    return {'count': 0, 'sum': 0, 'histogram': {str(value): 0 for value in RATING_VALUES}}
+
+
+def rating_increment(rating: int) -> dict:
+    """Update adding one review of `rating` to a provider's summary"""
+    return {'$inc': {
+        'rating_summary.count': 1,
+        'rating_summary.sum': rating,
+        f'rating_summary.histogram.{rating}': 1
+    }}
+
+
+def rating_stats(summary: Optional[dict]) -> dict:
+    """Public stats (count, rounded average, distribution) of a summary"""
+    summary = summary or empty_rating_summary()
+    count = summary.get('count', 0)
+    histogram = summary.get('histogram', {})
+    return {
+        'total_reviews': count,
+        'average_rating': round(summary.get('sum', 0) / count, 1) if count else 0,
+        'rating_distribution': {str(value): histogram.get(str(value), 0) for value in reversed(RATING_VALUES)}
+    }
+
+
+def _summary_pipeline(match: dict) -> list:
+    """Reviews grouped per provider and rating, in provider order"""
+    return [
+        {'$match': match},
+        {'$group': {'_id': {'provider': '$service_provider_id', 'rating': '$rating'}, 'reviews': {'$sum': 1}}},
+        {'$sort': {'_id.provider': 1}},
+    ]
+
+
+async def _summaries(db, match: dict):
+    """(provider_id, summary) pairs computed from the reviews matching `match`"""
+    provider_id, summary = None, None
+    async for row in db.reviews.aggregate(_summary_pipeline(match), allowDiskUse=True):
+        if row['_id']['provider'] != provider_id:
+            if provider_id is not None:
+                yield provider_id, summary
+            provider_id, summary = row['_id']['provider'], empty_rating_summary()
+        rating = row['_id']['rating']
+        summary['count'] += row['reviews']
+        summary['sum'] += rating * row['reviews']
+        if rating in RATING_VALUES:
+            summary['histogram'][str(rating)] += row['reviews']
+    if provider_id is not None:
+        yield provider_id, summary
+
+
+async def summarize_provider(db, provider_id: str) -> dict:
+    """Compute and store the summary of a provider that has none from its reviews"""
+    summary = empty_rating_summary()
+    async for _, computed in _summaries(db, {'service_provider_id': provider_id}):
+        summary = computed
+    # If a concurrent call stored one first, it already counts every inserted review
+    await db.service_providers.update_one(
+        {'id': provider_id, 'rating_summary': {'$exists': False}},
+        {'$set': {'rating_summary': summary}}
+    )
+    return summary
+
+
+async def add_review_rating(db, provider_id: str, rating: int):
+    """Count a new review in the provider's summary; summarizes providers that have none yet"""
+    result = await db.service_providers.update_one(
+        {'id': provider_id, 'rating_summary': {'$exists': True}},
+        rating_increment(rating)
+    )
+    if result.matched_count == 0:
+        # The review is already inserted, so the summary computed from the reviews includes it
+        await summarize_provider(db, provider_id)
+
+
+async def recompute_rating_summaries(db, batch_size: int = RATING_REPAIR_BATCH_SIZE,
+                                     provider_ids: Optional[Iterable[str]] = None) -> dict:
+    """
+    Rebuild rating_summary from the reviews of every provider (or of
+    provider_ids); providers without reviews get an empty summary. A review
+    created while this runs may be counted twice or missed for its
+    provider: rerun once writes are quiet.
+    """
+    if provider_ids is not None:
+        provider_ids = list(provider_ids)
+    match = {'service_provider_id': {'$in': provider_ids}} if provider_ids is not None else {}
+    report = {'summarized': 0, 'updated': 0, 'emptied': 0}
+    summarized = set()
+    operations = []
+
+    async def flush():
+        if operations:
+            result = await db.service_providers.bulk_write(operations, ordered=False)
+            report['updated'] += result.modified_count
+            operations.clear()
+
+    async for provider_id, summary in _summaries(db, match):
+        summarized.add(provider_id)
+        operations.append(UpdateOne({'id': provider_id}, {'$set': {'rating_summary': summary}}))
+        if len(operations) >= batch_size:
+            await flush()
+    await flush()
+    report['summarized'] = len(summarized)
+
+    # Providers left without reviews (or never summarized)
+    stale = {'$or': [{'rating_summary': {'$exists': False}}, {'rating_summary.count': {'$gt': 0}}]}
+    if provider_ids is not None:
+        stale = {'$and': [stale, {'id': {'$in': provider_ids}}]}
+    async for doc in db.service_providers.find(stale, {'_id': 0, 'id': 1}):
+        if doc.get('id') in summarized:
+            continue
+        operations.append(UpdateOne({'id': doc['id']}, {'$set': {'rating_summary': empty_rating_summary()}}))
+        report['emptied'] += 1
+        if len(operations) >= batch_size:
+            await flush()
+    await flush()
+    return report
+
+
+async def duplicate_reviews(db) -> list:
+    """(job_id, customer_id) pairs reviewed more than once, which block the unique index"""
+    return await db.reviews.aggregate([
+        {'$group': {'_id': {'job_id': '$job_id', 'customer_id': '$customer_id'}, 'ids': {'$push': '$id'}, 'count': {'$sum': 1}}},
+        {'$match': {'count': {'$gt': 1}}},
+    ], allowDiskUse=True).to_list(None)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Recompute the rating_summary of service providers from their reviews.
+
+The API maintains the summaries with $inc on each review; run this after
+restoring or editing reviews by hand, or to check them. It also reports
+(job_id, customer_id) pairs reviewed more than once and, once there are
+none, makes the reviews index on that pair unique (databases created
+before create_review relied on it have a non-unique index of that name).
+
+Usage:
+    python repair_rating_summaries.py [--provider ID ...] [--batch-size 500]
+"""
+
+import os
+import asyncio
+import argparse
+from pathlib import Path
+from motor.motor_asyncio import AsyncIOMotorClient
+from dotenv import load_dotenv
+
+# Load environment
+load_dotenv(Path(__file__).parent / '.env')
+
+from indexes import INDEX_SPEC, ensure_indexes
+from ratings import RATING_REPAIR_BATCH_SIZE, recompute_rating_summaries, duplicate_reviews
+
+# MongoDB connection
+mongo_url = os.environ['MONGO_URL']
+client = AsyncIOMotorClient(mongo_url)
+db = client[os.environ['DB_NAME']]
+
+
+async def ensure_unique_review_index():
+    report = await ensure_indexes(db, {'reviews': INDEX_SPEC['reviews']})
+    if report['failed']:
+        print(f"✗ Not created: {report['failed']}")
+    else:
+        print("Unique review index in place")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Recompute provider rating summaries from reviews")
+    parser.add_argument('--provider', action='append', help="Only this provider id (repeatable)")
+    parser.add_argument('--batch-size', type=int, default=RATING_REPAIR_BATCH_SIZE)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Recomputing rating summaries")
+    print("=" * 60)
+
+    report = await recompute_rating_summaries(db, batch_size=args.batch_size, provider_ids=args.provider)
+    print(f"\n{report['summarized']} providers with reviews, {report['emptied']} without, {report['updated']} summaries changed")
+
+    duplicates = await duplicate_reviews(db)
+    if duplicates:
+        print(f"\n⚠ {len(duplicates)} job/customer pairs reviewed more than once; the unique index can't be built:")
+        for duplicate in duplicates:
+            print(f"  job {duplicate['_id']['job_id']} customer {duplicate['_id']['customer_id']}: reviews {duplicate['ids']}")
+    else:
+        await ensure_unique_review_index()
+
+    print("\n" + "=" * 60)
+    print("Repair complete!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,139 @@
+"""
+Accent- and case-insensitive search over listings and companies.
+
+Searchable documents carry a `search` subdocument maintained on write:
+folded (lowercase, no diacritics) copies of their title, body and location
+text, plus the location split into tokens. A weighted text index over the
+folded fields serves /api/search with relevance ranking; a multikey index
+on `search.location_tokens` serves the location filters of the listing
+endpoints as token prefix matches ("matot" finds "Matotó").
+
+Documents written before the field existed (or with an older
+SEARCH_VERSION) are filled in by backfill_search_fields().
+"""
+
+import os
+import re
+import asyncio
+import unicodedata
+from typing import Dict, List, Optional
+
+from pymongo import IndexModel, UpdateOne
+
+# Bump when SEARCH_FIELDS or fold() change so the backfill recomputes every document
+SEARCH_VERSION = 1
+
+SEARCH_BACKFILL_BATCH_SIZE = int(os.environ.get('SEARCH_BACKFILL_BATCH_SIZE', '500'))
+
+# collection -> source fields of each folded part
+SEARCH_FIELDS: Dict[str, Dict[str, List[str]]] = {
+    'rental_listings': {
+        'title': ['title'],
+        'body': ['description', 'property_type'],
+        'location': ['location', 'quartier', 'commune', 'ville'],
+    },
+    'property_sales': {
+        'title': ['title'],
+        'body': ['description', 'property_type'],
+        'location': ['location', 'quartier', 'commune', 'ville'],
+    },
+    'vehicle_listings': {
+        'title': ['brand', 'model'],
+        'body': ['description', 'vehicle_type'],
+        'location': ['location'],
+    },
+    'companies': {
+        'title': ['company_name'],
+        'body': ['description', 'sector'],
+        'location': ['address', 'city', 'region'],
+    },
+    'company_services': {
+        'title': ['title'],
+        'body': ['description', 'category'],
+        'location': ['location'],
+    },
+    'company_job_offers': {
+        'title': ['title'],
+        'body': ['description', 'requirements'],
+        'location': ['location'],
+    },
+}
+
+SEARCH_TEXT_WEIGHTS = {'search.title': 10, 'search.location': 5, 'search.body': 1}
+
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+
+
+def fold(text: Optional[str]) -> str:
+    """Lowercase, strip diacritics and punctuation: 'Matotó, Conakry' -> 'matoto conakry'"""
+    if not text:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', str(text).casefold())
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return _NON_WORD.sub(' ', stripped).strip()
+
+
+def search_fields(collection: str, doc: dict) -> dict:
+    """The `search` subdocument of a document of a searchable collection"""
+    parts = {
+        part: fold(' '.join(str(doc[field]) for field in fields if doc.get(field)))
+        for part, fields in SEARCH_FIELDS[collection].items()
+    }
+    parts['location_tokens'] = sorted(set(parts['location'].split()))
+    parts['v'] = SEARCH_VERSION
+    return {'search': parts}
+
+
+def location_filter(location: Optional[str]) -> dict:
+    """Index-backed filter: every folded word of `location` prefixes a location token"""
+    tokens = fold(location).split()
+    if not tokens:
+        return {}
+    return {'$and': [{'search.location_tokens': {'$regex': f'^{re.escape(token)}'}} for token in tokens]}
+
+
+def search_indexes() -> List[IndexModel]:
+    """Text and location token indexes every searchable collection carries"""
+    return [
+        IndexModel(
+            [(field, 'text') for field in SEARCH_TEXT_WEIGHTS],
+            weights=SEARCH_TEXT_WEIGHTS,
+            default_language='french',
+            # No document field should switch the stemmer per document
+            language_override='search_language',
+            name='search_text'
+        ),
+        IndexModel([('search.location_tokens', 1)], name='search.location_tokens_1'),
+    ]
+
+
+async def backfill_search_fields(db, batch_size: int = SEARCH_BACKFILL_BATCH_SIZE, pause_seconds: float = 0.0) -> dict:
+    """
+    Set `search` on documents lacking it or built by an older SEARCH_VERSION.
+    Walks each collection in _id order; safe to interrupt and rerun, since
+    finished documents no longer match.
+    """
+    report = {}
+    for name, parts in SEARCH_FIELDS.items():
+        collection = db[name]
+        projection = {'_id': 1, **{field: 1 for fields in parts.values() for field in fields}}
+        query = {'search.v': {'$ne': SEARCH_VERSION}}
+        last_id = None
+        updated = 0
+
+        while True:
+            batch_query = {**query, '_id': {'$gt': last_id}} if last_id is not None else query
+            batch = await collection.find(batch_query, projection).sort('_id', 1).limit(batch_size).to_list(batch_size)
+            if not batch:
+                break
+            # Guarded on the version so a refresh made meanwhile by an edit wins
+            result = await collection.bulk_write([
+                UpdateOne({'_id': doc['_id'], **query}, {'$set': search_fields(name, doc)}) for doc in batch
+            ], ordered=False)
+            updated += result.modified_count
+            last_id = batch[-1]['_id']
+            if pause_seconds:
+                await asyncio.sleep(pause_seconds)
+
+        report[name] = updated
+    return report
@@ -1,26 +1,45 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, status, Query, Body, Request, Form
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, status, Query, Body, Request, Form, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.encoders import jsonable_encoder
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from starlette.middleware.base import BaseHTTPMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import json
+import base64
 import logging
 import re
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, field_validator, model_validator
+from pydantic import BaseModel, Field, ConfigDict, TypeAdapter, field_validator, model_validator
 from typing import List, Optional, Dict
 import uuid
 from datetime import datetime, timezone, timedelta
-from collections import defaultdict
+from collections import OrderedDict
 import asyncio
+import time
+import hmac
+import hashlib
+import mimetypes
+from stat import S_ISREG
+from email.utils import formatdate, parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
+from abc import ABC, abstractmethod
 import bcrypt
 import jwt
+import orjson
 import shutil
 from enum import Enum
 import cloudinary
-import cloudinary.uploader
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, BulkWriteError
+from phones import canonical_phone, find_by_phone, customer_phone_clauses, ensure_phone_indexes, backfill_phone_canonical
+from indexes import ensure_indexes
+from search import search_fields, location_filter, fold, backfill_search_fields
+from ratings import empty_rating_summary, add_review_rating, rating_stats, summarize_provider
+from ranking import ONLINE_RANK, new_provider_rank, online_status_update, refresh_provider_ranks, refresh_stale_ranks
+from versions import CollectionVersions
+from storage import STORAGE_BACKEND, ContentStore, StorageDeletionQueue, UnclosableReader, build_storage_backends
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -46,14 +65,510 @@ cloudinary.config(
 RATE_LIMIT_WINDOW = 300  # 5 minutes window
 RATE_LIMIT_MAX_ATTEMPTS = 5  # Max failed attempts before blocking
 RATE_LIMIT_BLOCK_DURATION = 900  # 15 minutes block
+# "mongo" shares counters between uvicorn workers, "memory" is per-process
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'mongo')
+RATE_LIMIT_EVICTION_INTERVAL = 60  # Seconds between sweeps of idle in-memory entries
 
-# In-memory storage for rate limiting (consider Redis for production)
-login_attempts: Dict[str, list] = defaultdict(list)
-blocked_ips: Dict[str, datetime] = {}
+class RateLimiterBackend(ABC):
+    """
+    Failed-login rate limiter keyed by client IP. After max_attempts failures
+    within window seconds the IP is blocked for block_duration seconds.
+    """
+
+    def __init__(self, window: int, max_attempts: int, block_duration: int):
+        self.window = window
+        self.max_attempts = max_attempts
+        self.block_duration = block_duration
+
+    @property
+    @abstractmethod
+    def name(self) -> str:
+        """Backend identifier reported by config()"""
+
+    async def start(self):
+        pass
+
+    @abstractmethod
+    async def is_blocked(self, ip: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def record_failure(self, ip: str) -> bool:
+        """Record a failed attempt; returns True if the IP just got blocked"""
+
+    @abstractmethod
+    async def clear(self, ip: str):
+        ...
+
+    @abstractmethod
+    async def unblock(self, ip: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def snapshot(self) -> dict:
+        """Currently blocked IPs and IPs with pending failed attempts"""
+
+    def config(self) -> dict:
+        return {
+            "backend": self.name,
+            "window_seconds": self.window,
+            "max_attempts": self.max_attempts,
+            "block_duration_seconds": self.block_duration
+        }
+
+class InMemoryRateLimiter(RateLimiterBackend):
+    """
+    Per-process limiter. Each IP owns a fixed-size ring buffer of the last
+    max_attempts failure timestamps: the window is exceeded exactly when the
+    oldest slot is still inside it, so recording a failure is O(1). Idle IPs
+    and expired blocks are swept every RATE_LIMIT_EVICTION_INTERVAL seconds.
+    """
+
+    name = "memory"
+
+    def __init__(self, window: int, max_attempts: int, block_duration: int, eviction_interval: float = RATE_LIMIT_EVICTION_INTERVAL):
+        super().__init__(window, max_attempts, block_duration)
+        self.eviction_interval = eviction_interval
+        self._attempts: Dict[str, list] = {}  # ip -> [ring of floats, next slot, last attempt]
+        self._blocked: Dict[str, float] = {}  # ip -> blocked until
+        self._next_eviction = time.time() + eviction_interval
+
+    def _maybe_evict(self, now: float):
+        if now < self._next_eviction:
+            return
+        self._next_eviction = now + self.eviction_interval
+        horizon = now - self.window
+        self._attempts = {ip: entry for ip, entry in self._attempts.items() if entry[2] > horizon}
+        self._blocked = {ip: until for ip, until in self._blocked.items() if until > now}
+
+    async def is_blocked(self, ip: str) -> bool:
+        now = time.time()
+        self._maybe_evict(now)
+        until = self._blocked.get(ip)
+        if until is None:
+            return False
+        if now < until:
+            return True
+        del self._blocked[ip]
+        return False
+
+    async def record_failure(self, ip: str) -> bool:
+        now = time.time()
+        self._maybe_evict(now)
+        entry = self._attempts.get(ip)
+        if entry is None:
+            entry = [[0.0] * self.max_attempts, 0, now]
+            self._attempts[ip] = entry
+        ring, slot, _ = entry
+        ring[slot] = now
+        slot = (slot + 1) % self.max_attempts
+        entry[1] = slot
+        entry[2] = now
+        
+        # The slot about to be overwritten holds the oldest of the last max_attempts failures
+        if now - ring[slot] < self.window:
+            self._blocked[ip] = now + self.block_duration
+            del self._attempts[ip]
+            return True
+        return False
+
+    async def clear(self, ip: str):
+        self._attempts.pop(ip, None)
+
+    async def unblock(self, ip: str) -> bool:
+        return self._blocked.pop(ip, None) is not None
+
+    async def snapshot(self) -> dict:
+        now = time.time()
+        horizon = now - self.window
+        blocked = [
+            {"ip": ip, "blocked_until": datetime.fromtimestamp(until, timezone.utc).isoformat()}
+            for ip, until in self._blocked.items()
+            if until > now
+        ]
+        pending = []
+        for ip, (ring, _, last_attempt) in self._attempts.items():
+            count = sum(1 for ts in ring if ts > horizon)
+            if count:
+                pending.append({
+                    "ip": ip,
+                    "attempt_count": count,
+                    "last_attempt": datetime.fromtimestamp(last_attempt, timezone.utc).isoformat()
+                })
+        return {"blocked": blocked, "pending": pending}
+
+class MongoRateLimiter(RateLimiterBackend):
+    """
+    Limiter shared by every worker through the rate_limits collection.
+    Failures are counted with an atomic $inc/upsert into fixed window
+    buckets; the previous bucket is weighted by its remaining overlap to
+    approximate a sliding window. Blocks are separate documents. Every
+    document carries expires_at so a TTL index cleans up idle IPs.
+    """
+
+    name = "mongo"
+
+    def __init__(self, collection, window: int, max_attempts: int, block_duration: int):
+        super().__init__(window, max_attempts, block_duration)
+        self.collection = collection
+
+    async def start(self):
+        await self.collection.create_index('expires_at', expireAfterSeconds=0)
+        await self.collection.create_index([('kind', 1), ('ip', 1)])
+
+    async def is_blocked(self, ip: str) -> bool:
+        block = await self.collection.find_one(
+            {'_id': f'block:{ip}', 'blocked_until': {'$gt': datetime.now(timezone.utc)}},
+            {'_id': 1}
+        )
+        return block is not None
+
+    async def record_failure(self, ip: str) -> bool:
+        now = datetime.now(timezone.utc)
+        ts = now.timestamp()
+        bucket = int(ts // self.window)
+        current = await self.collection.find_one_and_update(
+            {'_id': f'attempts:{ip}:{bucket}'},
+            {
+                '$inc': {'count': 1},
+                '$set': {'last_attempt': now},
+                '$setOnInsert': {
+                    'kind': 'attempts',
+                    'ip': ip,
+                    'bucket': bucket,
+                    'expires_at': datetime.fromtimestamp((bucket + 2) * self.window, timezone.utc)
+                }
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        count = current['count']
+        if count < self.max_attempts:
+            previous = await self.collection.find_one({'_id': f'attempts:{ip}:{bucket - 1}'}, {'count': 1})
+            if previous:
+                overlap = 1 - (ts - bucket * self.window) / self.window
+                count += previous['count'] * overlap
+        
+        if count >= self.max_attempts:
+            blocked_until = now + timedelta(seconds=self.block_duration)
+            await self.collection.update_one(
+                {'_id': f'block:{ip}'},
+                {'$set': {'kind': 'block', 'ip': ip, 'blocked_until': blocked_until, 'expires_at': blocked_until}},
+                upsert=True
+            )
+            await self.clear(ip)
+            return True
+        return False
+
+    async def clear(self, ip: str):
+        await self.collection.delete_many({'kind': 'attempts', 'ip': ip})
+
+    async def unblock(self, ip: str) -> bool:
+        result = await self.collection.delete_one({'_id': f'block:{ip}'})
+        return result.deleted_count > 0
+
+    async def snapshot(self) -> dict:
+        now = datetime.now(timezone.utc)
+        blocks = await self.collection.find(
+            {'kind': 'block', 'blocked_until': {'$gt': now}},
+            {'_id': 0, 'ip': 1, 'blocked_until': 1}
+        ).to_list(500)
+        bucket = int(now.timestamp() // self.window)
+        pending = await self.collection.aggregate([
+            {'$match': {'kind': 'attempts', 'bucket': {'$gte': bucket - 1}}},
+            {'$group': {'_id': '$ip', 'attempt_count': {'$sum': '$count'}, 'last_attempt': {'$max': '$last_attempt'}}},
+            {'$limit': 500}
+        ]).to_list(500)
+        return {
+            "blocked": [
+                {"ip": b['ip'], "blocked_until": b['blocked_until'].replace(tzinfo=timezone.utc).isoformat()}
+                for b in blocks
+            ],
+            "pending": [
+                {"ip": p['_id'], "attempt_count": p['attempt_count'], "last_attempt": p['last_attempt'].replace(tzinfo=timezone.utc).isoformat()}
+                for p in pending
+            ]
+        }
+
+if RATE_LIMIT_BACKEND == 'memory':
+    rate_limiter: RateLimiterBackend = InMemoryRateLimiter(RATE_LIMIT_WINDOW, RATE_LIMIT_MAX_ATTEMPTS, RATE_LIMIT_BLOCK_DURATION)
+else:
+    rate_limiter = MongoRateLimiter(db.rate_limits, RATE_LIMIT_WINDOW, RATE_LIMIT_MAX_ATTEMPTS, RATE_LIMIT_BLOCK_DURATION)
 
 # Audit log collection
 audit_logs_collection = db.audit_logs
 
+# Audit events are written behind the request by a background task
+AUDIT_QUEUE_MAX_SIZE = int(os.environ.get('AUDIT_QUEUE_MAX_SIZE', '10000'))
+AUDIT_FLUSH_SIZE = int(os.environ.get('AUDIT_FLUSH_SIZE', '200'))
+AUDIT_FLUSH_INTERVAL_SECONDS = float(os.environ.get('AUDIT_FLUSH_INTERVAL_SECONDS', '1.0'))
+
+# Seeding of the rollups from existing audit_logs: events per batch, and how
+# long a seeding worker may go without checkpointing before another takes over
+AUDIT_SEED_BATCH_SIZE = 1000
+AUDIT_SEED_LEASE_SECONDS = 300
+
+# Per event type rollups: minute buckets kept 2 days, hours 35 days, days ~13 months
+AUDIT_COUNTER_RETENTION = {
+    'minute': timedelta(days=2),
+    'hour': timedelta(days=35),
+    'day': timedelta(days=400)
+}
+
+def audit_bucket(granularity: str, ts: datetime) -> datetime:
+    """Start of the minute/hour/day bucket containing ts"""
+    if granularity == 'minute':
+        return ts.replace(second=0, microsecond=0)
+    if granularity == 'hour':
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+class AuditCounters:
+    """
+    Rollups of audit events in the audit_counters collection, incremented
+    with $inc as events are written: one document per event type and
+    minute/hour/day bucket, plus an all-time total per event type. Each
+    document counts events and failed events (success=False). Admin
+    statistics read these instead of counting audit_logs.
+    """
+
+    def __init__(self, collection, logs_collection):
+        self.collection = collection
+        self.logs_collection = logs_collection
+
+    async def start(self):
+        await self.collection.create_index('expires_at', expireAfterSeconds=0)
+        await self.collection.create_index([('granularity', 1), ('bucket', 1)])
+        await self.logs_collection.create_index([('timestamp', -1)])
+        await self.logs_collection.create_index([('event_type', 1), ('timestamp', -1)])
+        # Earliest start of a worker counting events as it writes them, set
+        # before this worker's sink starts: events from then on are counted by
+        # the sinks (including those still in a write-behind buffer), events
+        # before it by the seed
+        await self.collection.update_one(
+            {'_id': 'counting_since'},
+            {'$min': {'at': datetime.now(timezone.utc)}},
+            upsert=True
+        )
+        asyncio.create_task(self._seed_from_logs())
+
+    async def record(self, entries: list):
+        increments: Dict[tuple, list] = {}
+        for entry in entries:
+            failed = 0 if entry.get('success', True) else 1
+            keys = [('total', None, entry['event_type'])]
+            keys += [(g, audit_bucket(g, entry['timestamp']), entry['event_type']) for g in AUDIT_COUNTER_RETENTION]
+            for key in keys:
+                counts = increments.setdefault(key, [0, 0])
+                counts[0] += 1
+                counts[1] += failed
+        
+        operations = []
+        for (granularity, bucket, event_type), (count, failures) in increments.items():
+            on_insert = {'granularity': granularity, 'bucket': bucket, 'event_type': event_type}
+            if bucket is not None:
+                on_insert['expires_at'] = bucket + AUDIT_COUNTER_RETENTION[granularity]
+            operations.append(UpdateOne(
+                {'_id': f"{granularity}|{bucket.isoformat() if bucket else '*'}|{event_type}"},
+                {'$inc': {'count': count, 'failures': failures}, '$setOnInsert': on_insert},
+                upsert=True
+            ))
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+
+    async def _claim_seed(self) -> Optional[dict]:
+        """Claim the seeding job, or take over one whose worker stopped renewing it"""
+        now = datetime.now(timezone.utc)
+        if await self.collection.find_one({'_id': 'seeded'}, {'_id': 1}):
+            return None
+        try:
+            await self.collection.insert_one({'_id': 'seeding', 'claimed_at': now})
+            return {'_id': 'seeding'}
+        except DuplicateKeyError:
+            return await self.collection.find_one_and_update(
+                {'_id': 'seeding', 'claimed_at': {'$lt': now - timedelta(seconds=AUDIT_SEED_LEASE_SECONDS)}},
+                {'$set': {'claimed_at': now}},
+                return_document=ReturnDocument.AFTER
+            )
+
+    async def _seed_from_logs(self):
+        """
+        Build the rollups once (by a single worker) from events logged before
+        counters existed. Progress is checkpointed per batch so a worker taking
+        over an abandoned job resumes after the last recorded batch, and the
+        'seeded' marker is only written once every event has been counted.
+        """
+        try:
+            claim = await self._claim_seed()
+            if claim is None:
+                return
+            cutoff = (await self.collection.find_one({'_id': 'counting_since'}))['at']
+            query = {'timestamp': {'$lt': cutoff}}
+            if claim.get('last_id') is not None:
+                query['_id'] = {'$gt': claim['last_id']}
+            cursor = self.logs_collection.find(
+                query,
+                {'event_type': 1, 'success': 1, 'timestamp': 1}
+            ).sort('_id', 1).batch_size(AUDIT_SEED_BATCH_SIZE)
+            batch = []
+            last_id = None
+            async for entry in cursor:
+                last_id = entry['_id']
+                if entry.get('event_type') and entry.get('timestamp'):
+                    entry['timestamp'] = entry['timestamp'].replace(tzinfo=timezone.utc)
+                    batch.append(entry)
+                if len(batch) >= AUDIT_SEED_BATCH_SIZE:
+                    await self._record_seed_batch(batch, last_id)
+                    batch = []
+            await self._record_seed_batch(batch, last_id)
+            await self.collection.insert_one({'_id': 'seeded', 'created_at': datetime.now(timezone.utc), 'cutoff': cutoff})
+            await self.collection.delete_one({'_id': 'seeding'})
+        except Exception as e:
+            logger.error(f"Failed to seed audit counters: {e}")
+
+    async def _record_seed_batch(self, batch: list, last_id):
+        await self.record(batch)
+        if last_id is not None:
+            await self.collection.update_one(
+                {'_id': 'seeding'},
+                {'$set': {'last_id': last_id, 'claimed_at': datetime.now(timezone.utc)}}
+            )
+
+    async def totals(self) -> Dict[str, dict]:
+        """All-time count and failures per event type"""
+        docs = await self.collection.find({'granularity': 'total'}, {'_id': 0, 'event_type': 1, 'count': 1, 'failures': 1}).to_list(1000)
+        return {d['event_type']: {'count': d['count'], 'failures': d['failures']} for d in docs}
+
+    async def window(self, since: datetime) -> Dict[str, dict]:
+        """Count and failures per event type since a given instant (minute precision)"""
+        first_full_hour = audit_bucket('hour', since)
+        if first_full_hour < since:
+            first_full_hour += timedelta(hours=1)
+        hours = await self.collection.find(
+            {'granularity': 'hour', 'bucket': {'$gte': first_full_hour}},
+            {'_id': 0, 'event_type': 1, 'count': 1, 'failures': 1}
+        ).to_list(10000)
+        minutes = await self.collection.find(
+            {'granularity': 'minute', 'bucket': {'$gte': audit_bucket('minute', since), '$lt': first_full_hour}},
+            {'_id': 0, 'event_type': 1, 'count': 1, 'failures': 1}
+        ).to_list(10000)
+        
+        result: Dict[str, dict] = {}
+        for d in hours + minutes:
+            counts = result.setdefault(d['event_type'], {'count': 0, 'failures': 0})
+            counts['count'] += d['count']
+            counts['failures'] += d['failures']
+        return result
+
+audit_counters = AuditCounters(db.audit_counters, audit_logs_collection)
+
+class AuditSink:
+    """
+    Write-behind sink for audit events. Events go into a bounded in-memory
+    queue and a background task writes them with insert_many(ordered=False)
+    whenever flush_size events are waiting or flush_interval elapses, then
+    updates the audit counters rollups for the written events.
+    When the queue is full new events are dropped and counted rather than
+    slowing down the request. stop() flushes whatever is still queued.
+    """
+
+    def __init__(self, collection, max_queue_size: int, flush_size: int, flush_interval: float, counters: Optional[AuditCounters] = None):
+        self.collection = collection
+        self.counters = counters
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._enqueued = 0
+        self._written = 0
+        self._dropped = 0
+        self._failed = 0
+        self._flushes = 0
+
+    def submit(self, entry: dict):
+        try:
+            self._queue.put_nowait(entry)
+            self._enqueued += 1
+        except asyncio.QueueFull:
+            self._dropped += 1
+
+    def _drain(self, batch: list):
+        while len(batch) < self.flush_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+
+    async def _write(self, batch: list):
+        if not batch:
+            return
+        self._flushes += 1
+        written = batch
+        try:
+            result = await self.collection.insert_many(batch, ordered=False)
+            self._written += len(result.inserted_ids)
+        except BulkWriteError as e:
+            failed_indexes = {error['index'] for error in e.details.get('writeErrors', [])}
+            written = [entry for i, entry in enumerate(batch) if i not in failed_indexes]
+            self._written += len(written)
+            self._failed += len(failed_indexes)
+            logger.error(f"Failed to write {len(failed_indexes)} audit events")
+        except Exception as e:
+            self._failed += len(batch)
+            logger.error(f"Failed to write {len(batch)} audit events: {e}")
+            return
+        
+        if self.counters is not None:
+            try:
+                await self.counters.record(written)
+            except Exception as e:
+                logger.error(f"Failed to update audit counters: {e}")
+
+    async def _run(self):
+        while not self._closing or not self._queue.empty():
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.flush_size:
+                self._drain(batch)
+                remaining = deadline - time.monotonic()
+                if len(batch) >= self.flush_size or remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            await self._write(batch)
+
+    def start(self):
+        if self._task is None:
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background writer once every queued event is flushed"""
+        self._closing = True
+        if self._task:
+            await self._task
+            self._task = None
+        while not self._queue.empty():
+            batch = []
+            self._drain(batch)
+            await self._write(batch)
+
+    def metrics(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "max_queue_size": self._queue.maxsize,
+            "enqueued": self._enqueued,
+            "written": self._written,
+            "dropped": self._dropped,
+            "failed": self._failed,
+            "flushes": self._flushes
+        }
+
+audit_sink = AuditSink(audit_logs_collection, AUDIT_QUEUE_MAX_SIZE, AUDIT_FLUSH_SIZE, AUDIT_FLUSH_INTERVAL_SECONDS, audit_counters)
+
 async def log_audit_event(
     event_type: str,
     user_id: str = None,
@@ -62,21 +577,18 @@ async def log_audit_event(
     details: dict = None,
     success: bool = True
 ):
-    """Log security-relevant events to the database"""
-    try:
-        audit_entry = {
-            "event_type": event_type,
-            "user_id": user_id,
-            "user_type": user_type,
-            "ip_address": ip_address,
-            "details": details or {},
-            "success": success,
-            "timestamp": datetime.now(timezone.utc),
-            "created_at": datetime.now(timezone.utc).isoformat()
-        }
-        await audit_logs_collection.insert_one(audit_entry)
-    except Exception as e:
-        logger.error(f"Failed to log audit event: {e}")
+    """Queue a security-relevant event for the audit log"""
+    now = datetime.now(timezone.utc)
+    audit_sink.submit({
+        "event_type": event_type,
+        "user_id": user_id,
+        "user_type": user_type,
+        "ip_address": ip_address,
+        "details": details or {},
+        "success": success,
+        "timestamp": now,
+        "created_at": now.isoformat()
+    })
 
 def get_client_ip(request: Request) -> str:
     """Extract client IP from request, considering proxies"""
@@ -85,97 +597,109 @@ def get_client_ip(request: Request) -> str:
         return forwarded.split(",")[0].strip()
     return request.client.host if request.client else "unknown"
 
-def is_ip_blocked(ip: str) -> bool:
+async def is_ip_blocked(ip: str) -> bool:
     """Check if an IP is currently blocked"""
-    if ip in blocked_ips:
-        if datetime.now(timezone.utc) < blocked_ips[ip]:
-            return True
-        else:
-            del blocked_ips[ip]
-    return False
+    return await rate_limiter.is_blocked(ip)
 
-def record_failed_attempt(ip: str):
+async def record_failed_attempt(ip: str) -> bool:
     """Record a failed login attempt"""
-    now = datetime.now(timezone.utc)
-    # Clean old attempts
-    login_attempts[ip] = [
-        attempt for attempt in login_attempts[ip]
-        if (now - attempt).total_seconds() < RATE_LIMIT_WINDOW
-    ]
-    login_attempts[ip].append(now)
-    
-    # Block IP if too many attempts
-    if len(login_attempts[ip]) >= RATE_LIMIT_MAX_ATTEMPTS:
-        blocked_ips[ip] = now + timedelta(seconds=RATE_LIMIT_BLOCK_DURATION)
-        login_attempts[ip] = []
-        return True
-    return False
+    return await rate_limiter.record_failure(ip)
 
-def clear_failed_attempts(ip: str):
+async def clear_failed_attempts(ip: str):
     """Clear failed attempts on successful login"""
-    if ip in login_attempts:
-        del login_attempts[ip]
+    await rate_limiter.clear(ip)
+
+# Security headers added to every response, encoded once at import time
+SECURITY_HEADERS = [
+    # Strict Transport Security (HSTS)
+    (b"strict-transport-security", b"max-age=31536000; includeSubDomains"),
+    # Content Security Policy
+    (b"content-security-policy", b"default-src 'self'; script-src 'self' 'unsafe-inline' 'unsafe-eval'; style-src 'self' 'unsafe-inline'; img-src 'self' data: https:; font-src 'self' data:; connect-src 'self' https:;"),
+    # Prevent clickjacking
+    (b"x-frame-options", b"SAMEORIGIN"),
+    # Prevent MIME type sniffing
+    (b"x-content-type-options", b"nosniff"),
+    # XSS Protection
+    (b"x-xss-protection", b"1; mode=block"),
+    # Referrer Policy
+    (b"referrer-policy", b"strict-origin-when-cross-origin"),
+    # Permissions Policy
+    (b"permissions-policy", b"geolocation=(), microphone=(), camera=()"),
+]
 
-# Security Headers Middleware
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
-        
-        # Strict Transport Security (HSTS)
-        response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
-        
-        # Content Security Policy
-        response.headers["Content-Security-Policy"] = "default-src 'self'; script-src 'self' 'unsafe-inline' 'unsafe-eval'; style-src 'self' 'unsafe-inline'; img-src 'self' data: https:; font-src 'self' data:; connect-src 'self' https:;"
-        
-        # Prevent clickjacking
-        response.headers["X-Frame-Options"] = "SAMEORIGIN"
-        
-        # Prevent MIME type sniffing
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        
-        # XSS Protection
-        response.headers["X-XSS-Protection"] = "1; mode=block"
-        
-        # Referrer Policy
-        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
+# Security Headers Middleware (pure ASGI: no task or stream per request, response is not re-wrapped)
+class SecurityHeadersMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
         
-        # Permissions Policy
-        response.headers["Permissions-Policy"] = "geolocation=(), microphone=(), camera=()"
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), *SECURITY_HEADERS]
+            await send(message)
         
-        return response
+        await self.app(scope, receive, send_with_headers)
+
+# Authentication endpoints guarded by the rate limiter
+RATE_LIMITED_PATHS = frozenset({
+    "/api/auth/login",
+    "/api/auth/company/login",
+    "/api/admin/login",
+    "/api/customer/login",
+    "/api/company/login",
+})
+
+RATE_LIMITED_BODY = json.dumps({
+    "detail": "Trop de tentatives de connexion. Veuillez réessayer dans 15 minutes.",
+    "error_code": "RATE_LIMITED"
+}, ensure_ascii=False).encode("utf-8")
+
+RATE_LIMITED_HEADERS = [
+    (b"content-type", b"application/json"),
+    (b"content-length", str(len(RATE_LIMITED_BODY)).encode("latin-1")),
+]
 
-# Rate Limiting Middleware for login endpoints
-class RateLimitMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        # Only apply rate limiting to authentication endpoints
-        login_paths = ["/api/auth/login", "/api/admin/login", "/api/customer/login", "/api/company/login"]
+def get_scope_client_ip(scope) -> str:
+    """Extract client IP from an ASGI scope, considering proxies"""
+    for name, value in scope.get("headers", ()):
+        if name == b"x-forwarded-for":
+            return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+# Rate Limiting Middleware for login endpoints (pure ASGI)
+class RateLimitMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in RATE_LIMITED_PATHS:
+            await self.app(scope, receive, send)
+            return
         
-        if request.method == "POST" and any(request.url.path.endswith(path) for path in login_paths):
-            client_ip = get_client_ip(request)
-            
-            # Check if IP is blocked
-            if is_ip_blocked(client_ip):
-                await log_audit_event(
-                    event_type="RATE_LIMIT_BLOCKED",
-                    ip_address=client_ip,
-                    details={"path": str(request.url.path)},
-                    success=False
-                )
-                return JSONResponse(
-                    status_code=429,
-                    content={
-                        "detail": "Trop de tentatives de connexion. Veuillez réessayer dans 15 minutes.",
-                        "error_code": "RATE_LIMITED"
-                    }
-                )
+        client_ip = get_scope_client_ip(scope)
+        
+        # Check if IP is blocked
+        if await is_ip_blocked(client_ip):
+            await log_audit_event(
+                event_type="RATE_LIMIT_BLOCKED",
+                ip_address=client_ip,
+                details={"path": scope["path"]},
+                success=False
+            )
+            await send({"type": "http.response.start", "status": 429, "headers": RATE_LIMITED_HEADERS})
+            await send({"type": "http.response.body", "body": RATE_LIMITED_BODY})
+            return
         
-        response = await call_next(request)
-        return response
+        await self.app(scope, receive, send)
 
 # JWT Configuration
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
-JWT_EXPIRATION_HOURS = 24
 
 # Admin accounts configuration (multiple admins supported)
 ADMIN_ACCOUNTS = [
@@ -200,28 +724,299 @@ ADMIN_ACCOUNTS = [
 ADMIN_INVITE_CODE = os.environ.get('ADMIN_INVITE_CODE', 'SERVISPRO2024')
 
 # File upload configuration
-UPLOAD_DIR = Path("/app/backend/uploads")
+UPLOAD_DIR = Path(os.environ.get('UPLOAD_DIR', '/app/backend/uploads'))
 UPLOAD_DIR.mkdir(exist_ok=True)
 
 # ============================================
-# CLOUDINARY UPLOAD HELPER
+# FILE STORAGE (local / Cloudinary / S3)
 # ============================================
 
-async def upload_to_cloudinary(file: UploadFile, folder: str = "servispro") -> dict:
+# Storage SDKs are blocking, so uploads run on a dedicated I/O thread pool
+CLOUDINARY_UPLOAD_WORKERS = int(os.environ.get('CLOUDINARY_UPLOAD_WORKERS', '8'))
+# Connect/read timeout of each storage SDK network call; a stalled attempt fails in its own thread
+CLOUDINARY_UPLOAD_TIMEOUT_SECONDS = float(os.environ.get('CLOUDINARY_UPLOAD_TIMEOUT_SECONDS', '60'))
+CLOUDINARY_UPLOAD_RETRIES = int(os.environ.get('CLOUDINARY_UPLOAD_RETRIES', '2'))
+CLOUDINARY_RETRY_BACKOFF_SECONDS = 0.5
+# Max concurrent uploads for a single multi-file request
+UPLOAD_CONCURRENCY_PER_REQUEST = int(os.environ.get('UPLOAD_CONCURRENCY_PER_REQUEST', '3'))
+
+storage_io_executor = ThreadPoolExecutor(max_workers=CLOUDINARY_UPLOAD_WORKERS, thread_name_prefix="storage-io")
+
+# Uploads are stored once per content hash (stored_files registry) with the
+# STORAGE_BACKEND selected backend; local and Cloudinary stay available to
+# delete files uploaded before a switch
+storage_backends = build_storage_backends(UPLOAD_DIR, STORAGE_BACKEND, signing_secret=JWT_SECRET)
+content_store = ContentStore(
+    db,
+    storage_backends,
+    STORAGE_BACKEND,
+    storage_io_executor,
+    timeout=CLOUDINARY_UPLOAD_TIMEOUT_SECONDS,
+    retries=CLOUDINARY_UPLOAD_RETRIES,
+    backoff=CLOUDINARY_RETRY_BACKOFF_SECONDS
+)
+# Objects left unreferenced are deleted by a background worker (storage_deletions outbox)
+storage_deletions = StorageDeletionQueue(db, content_store, storage_io_executor)
+
+# Uploads are streamed from Starlette's spooled temp file, never read whole into memory
+MAX_UPLOAD_SIZE_BYTES = int(os.environ.get('MAX_UPLOAD_SIZE_MB', '20')) * 1024 * 1024
+MAX_UPLOAD_REQUEST_BYTES = int(os.environ.get('MAX_UPLOAD_REQUEST_MB', '100')) * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+class UploadTooLarge(Exception):
+    pass
+
+def upload_too_large_error(max_size: int = MAX_UPLOAD_SIZE_BYTES) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"Fichier trop volumineux (maximum {max_size // (1024 * 1024)} Mo)"
+    )
+
+def upload_size(file: UploadFile) -> int:
+    """Size of an uploaded file, from its spooled temp file (no read)"""
+    if file.size is not None:
+        return file.size
+    position = file.file.tell()
+    file.file.seek(0, os.SEEK_END)
+    size = file.file.tell()
+    file.file.seek(position)
+    return size
+
+def _copy_upload(source, destination: Path, max_size: int) -> int:
+    """Copy a spooled upload to disk chunk by chunk, enforcing max_size as bytes flow"""
+    written = 0
+    source.seek(0)
+    try:
+        with open(destination, 'wb') as out:
+            while True:
+                chunk = source.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > max_size:
+                    raise UploadTooLarge()
+                out.write(chunk)
+    except BaseException:
+        destination.unlink(missing_ok=True)
+        raise
+    finally:
+        source.seek(0)
+    return written
+
+async def save_upload_to_path(file: UploadFile, destination: Path, max_size: int = MAX_UPLOAD_SIZE_BYTES) -> int:
+    """Stream an upload to a local file off the event loop; raises 413 if it exceeds max_size"""
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(storage_io_executor, _copy_upload, file.file, destination, max_size)
+    except UploadTooLarge:
+        raise upload_too_large_error(max_size)
+
+# Request body limit for multipart uploads (pure ASGI): rejects on Content-Length
+# before anything is read, and counts bytes as they arrive for chunked bodies
+class UploadSizeLimitMiddleware:
+    def __init__(self, app, max_body_size: int = MAX_UPLOAD_REQUEST_BYTES):
+        self.app = app
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH"):
+            await self.app(scope, receive, send)
+            return
+        
+        content_type = b""
+        content_length = None
+        for name, value in scope.get("headers", ()):
+            if name == b"content-type":
+                content_type = value
+            elif name == b"content-length":
+                content_length = int(value) if value.isdigit() else None
+        
+        if not content_type.startswith(b"multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+        
+        if content_length is not None and content_length > self.max_body_size:
+            response = JSONResponse(
+                status_code=413,
+                content={"detail": f"Requête trop volumineuse (maximum {self.max_body_size // (1024 * 1024)} Mo)"}
+            )
+            await response(scope, receive, send)
+            return
+        
+        received = 0
+        max_body_size = self.max_body_size
+        
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body_size:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Requête trop volumineuse (maximum {max_body_size // (1024 * 1024)} Mo)"
+                    )
+            return message
+        
+        await self.app(scope, limited_receive, send)
+
+# Uploaded files are immutable (UUID or content-hash names), so /api/uploads
+# serves them with a one-year immutable Cache-Control, a strong ETag derived
+# from the content hash, conditional 304s and single byte ranges
+UPLOADS_CACHE_CONTROL = b"public, max-age=31536000, immutable"
+UPLOADS_READ_CHUNK_SIZE = 64 * 1024
+UPLOADS_ETAG_CACHE_MAX_ENTRIES = 10000
+_CONTENT_HASH_NAME = re.compile(r'^[0-9a-f]{64}$')
+_RANGE_HEADER = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class UploadedFilesApp:
     """
-    Upload a file to Cloudinary and return the secure URL.
-    Works for images and documents (PDF).
+    Pure ASGI app for UPLOAD_DIR. Files stored by the content store are named
+    after their SHA-256, which is used as the ETag directly; older files are
+    hashed once and the result cached by (path, mtime, size). When the server
+    supports the ASGI zero-copy send extension the body is sent with
+    sendfile, otherwise it is streamed in chunks read off the event loop.
     """
-    try:
-        # Read file content
-        file_content = await file.read()
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory).resolve()
+        self._etags: "OrderedDict[tuple, str]" = OrderedDict()
+
+    async def _etag(self, path: Path, stat: os.stat_result) -> str:
+        if _CONTENT_HASH_NAME.match(path.stem):
+            return f'"{path.stem}"'
+        key = (str(path), stat.st_mtime_ns, stat.st_size)
+        etag = self._etags.get(key)
+        if etag is None:
+            loop = asyncio.get_running_loop()
+            etag = f'"{await loop.run_in_executor(None, _hash_file, str(path))}"'
+            self._etags[key] = etag
+            if len(self._etags) > UPLOADS_ETAG_CACHE_MAX_ENTRIES:
+                self._etags.popitem(last=False)
+        else:
+            self._etags.move_to_end(key)
+        return etag
+
+    @staticmethod
+    async def _send_empty(send, status_code: int, headers: list):
+        await send({"type": "http.response.start", "status": status_code, "headers": headers})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        if scope["method"] not in ("GET", "HEAD"):
+            await self._send_empty(send, 405, [(b"allow", b"GET, HEAD"), (b"content-length", b"0")])
+            return
         
-        # Reset file position for potential reuse
-        await file.seek(0)
+        # Path relative to the mount point, confined to the upload directory
+        relative = scope["path"][len(scope.get("root_path", "")):].lstrip("/")
+        path = (self.directory / relative).resolve()
+        try:
+            if not relative or not path.is_relative_to(self.directory):
+                raise FileNotFoundError
+            stat = await asyncio.get_running_loop().run_in_executor(None, os.stat, path)
+            if not S_ISREG(stat.st_mode):
+                raise FileNotFoundError
+        except (FileNotFoundError, NotADirectoryError):
+            await send({"type": "http.response.start", "status": 404,
+                        "headers": [(b"content-type", b"text/plain; charset=utf-8"), (b"content-length", b"9")]})
+            await send({"type": "http.response.body", "body": b"Not Found"})
+            return
         
-        # Generate unique public_id
+        request_headers = {name: value for name, value in scope["headers"]}
+        etag = await self._etag(path, stat)
+        last_modified = formatdate(stat.st_mtime, usegmt=True)
+        headers = [
+            (b"cache-control", UPLOADS_CACHE_CONTROL),
+            (b"etag", etag.encode()),
+            (b"last-modified", last_modified.encode()),
+            (b"accept-ranges", b"bytes"),
+        ]
+        
+        # Conditional GET: If-None-Match takes precedence over If-Modified-Since
+        if_none_match = request_headers.get(b"if-none-match")
+        if if_none_match is not None:
+            candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.decode("latin-1").split(",")]
+            if "*" in candidates or etag in candidates:
+                await self._send_empty(send, 304, headers)
+                return
+        elif b"if-modified-since" in request_headers:
+            try:
+                since = parsedate_to_datetime(request_headers[b"if-modified-since"].decode("latin-1"))
+                if int(stat.st_mtime) <= since.timestamp():
+                    await self._send_empty(send, 304, headers)
+                    return
+            except (TypeError, ValueError):
+                pass
+        
+        size = stat.st_size
+        start, end, status_code = 0, size - 1, 200
+        range_header = request_headers.get(b"range")
+        if_range = request_headers.get(b"if-range")
+        if range_header is not None and (if_range is None or if_range.decode("latin-1") in (etag, last_modified)):
+            # Single ranges only; multi-range requests get the whole file
+            match = _RANGE_HEADER.match(range_header.decode("latin-1").strip())
+            if match and (match.group(1) or match.group(2)):
+                first, last = match.groups()
+                if first:
+                    start = int(first)
+                    end = min(int(last), size - 1) if last else size - 1
+                else:
+                    start = max(size - int(last), 0)
+                if start >= size or start > end:
+                    await self._send_empty(send, 416, headers + [(b"content-range", f"bytes */{size}".encode())])
+                    return
+                status_code = 206
+                headers.append((b"content-range", f"bytes {start}-{end}/{size}".encode()))
+        
+        length = end - start + 1 if size else 0
+        content_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        headers += [(b"content-type", content_type.encode()), (b"content-length", str(length).encode())]
+        await send({"type": "http.response.start", "status": status_code, "headers": headers})
+        if scope["method"] == "HEAD" or length == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        
+        loop = asyncio.get_running_loop()
+        f = await loop.run_in_executor(None, open, path, "rb")
+        try:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({"type": "http.response.zerocopysend", "file": f.fileno(), "offset": start, "count": length})
+                return
+            await loop.run_in_executor(None, f.seek, start)
+            remaining = length
+            while remaining > 0:
+                chunk = await loop.run_in_executor(None, f.read, min(UPLOADS_READ_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            await loop.run_in_executor(None, f.close)
+
+async def store_upload(file: UploadFile, folder: str = "servispro") -> dict:
+    """
+    Store an uploaded file and return its URL.
+    Works for images and documents (PDF). Identical content is stored once:
+    a file already in the registry is not transferred again. Storage runs
+    off the event loop with a timeout and bounded retries.
+    Raises 413 if the file exceeds MAX_UPLOAD_SIZE_BYTES.
+    """
+    if upload_size(file) > MAX_UPLOAD_SIZE_BYTES:
+        raise upload_too_large_error()
+    
+    try:
         file_ext = file.filename.split('.')[-1].lower() if '.' in file.filename else 'jpg'
-        unique_id = str(uuid.uuid4())
         
         # Determine resource type based on file extension
         if file_ext in ['pdf', 'doc', 'docx']:
@@ -229,150 +1024,55 @@ async def upload_to_cloudinary(file: UploadFile, folder: str = "servispro") -> d
         else:
             resource_type = "image"
         
-        # Upload to Cloudinary (folder is set via public_id path)
-        result = cloudinary.uploader.upload(
-            file_content,
-            public_id=f"{folder}/{unique_id}",
-            resource_type=resource_type,
-            overwrite=True
+        # Streams from the spooled temp file in chunks, never the whole file in memory
+        stored = await content_store.put(
+            UnclosableReader(file.file, file.filename),
+            folder=folder,
+            ext=file_ext,
+            resource_type=resource_type
         )
         
         return {
             "success": True,
-            "url": result.get("secure_url"),
-            "public_id": result.get("public_id"),
-            "resource_type": resource_type
+            "url": stored["url"],
+            "public_id": stored["ref"],
+            "resource_type": stored["resource_type"],
+            "sha256": stored["_id"],
+            "deduplicated": stored["deduplicated"]
         }
     except Exception as e:
-        logging.error(f"Cloudinary upload error: {str(e)}")
+        logging.error(f"Storage upload error: {e!r}")
         return {
             "success": False,
-            "error": str(e)
+            "error": str(e) or type(e).__name__
         }
 
-def delete_from_cloudinary(url: str) -> dict:
+async def store_uploads(files: List[UploadFile], folder: str = "servispro",
+                        semaphore: Optional[asyncio.Semaphore] = None) -> List[dict]:
     """
-    Delete a file from Cloudinary using its URL.
-    Extracts the public_id from the URL and deletes the resource.
+    Store several files concurrently (capped per request); results keep the
+    input order. Pass the same semaphore to calls of one request so the cap
+    covers all of its files.
     """
-    if not url or not url.startswith('https://res.cloudinary.com'):
-        return {"success": False, "error": "Invalid Cloudinary URL"}
+    semaphore = semaphore or asyncio.Semaphore(UPLOAD_CONCURRENCY_PER_REQUEST)
     
-    try:
-        # Extract public_id from URL
-        # URL format: https://res.cloudinary.com/{cloud_name}/{resource_type}/upload/v{version}/{public_id}.{extension}
-        parts = url.split('/upload/')
-        if len(parts) < 2:
-            return {"success": False, "error": "Could not parse URL"}
-        
-        # Get the part after /upload/ and remove version prefix and extension
-        path_with_version = parts[1]
-        # Remove version (v1234567890/)
-        if path_with_version.startswith('v'):
-            path_parts = path_with_version.split('/', 1)
-            if len(path_parts) > 1:
-                path_with_version = path_parts[1]
-        
-        # Remove file extension
-        public_id = path_with_version.rsplit('.', 1)[0]
-        
-        # Determine resource type from URL
-        if '/raw/upload/' in url:
-            resource_type = 'raw'
-        else:
-            resource_type = 'image'
-        
-        logging.info(f"Deleting from Cloudinary: {public_id} (type: {resource_type})")
-        
-        # Delete from Cloudinary
-        result = cloudinary.uploader.destroy(public_id, resource_type=resource_type)
-        
-        # Consider 'ok' and 'not found' as success (file is gone either way)
-        if result.get('result') in ['ok', 'not found']:
-            return {"success": True, "public_id": public_id}
-        else:
-            return {"success": False, "error": f"Cloudinary returned: {result}"}
-            
-    except Exception as e:
-        logging.error(f"Cloudinary delete error: {str(e)}")
-        return {"success": False, "error": str(e)}
-
-async def delete_provider_cloudinary_files(provider: dict):
-    """
-    Delete all Cloudinary files associated with a provider.
-    """
-    deleted_count = 0
-    failed_count = 0
-    
-    # Delete profile picture
-    if provider.get('profile_picture') and 'cloudinary.com' in str(provider.get('profile_picture', '')):
-        result = delete_from_cloudinary(provider['profile_picture'])
-        if result['success']:
-            deleted_count += 1
-            logging.info(f"Deleted profile picture for provider {provider.get('id')}")
-        else:
-            failed_count += 1
-            logging.warning(f"Failed to delete profile picture: {result.get('error')}")
-    
-    # Delete ID verification picture
-    if provider.get('id_verification_picture') and 'cloudinary.com' in str(provider.get('id_verification_picture', '')):
-        result = delete_from_cloudinary(provider['id_verification_picture'])
-        if result['success']:
-            deleted_count += 1
-        else:
-            failed_count += 1
-    
-    # Delete documents
-    if provider.get('documents'):
-        for doc in provider['documents']:
-            doc_path = doc.get('path', '')
-            if doc_path and 'cloudinary.com' in doc_path:
-                result = delete_from_cloudinary(doc_path)
-                if result['success']:
-                    deleted_count += 1
-                else:
-                    failed_count += 1
+    async def upload_one(file: UploadFile) -> dict:
+        async with semaphore:
+            return await store_upload(file, folder=folder)
     
-    logging.info(f"Cloudinary cleanup for provider {provider.get('id')}: {deleted_count} deleted, {failed_count} failed")
-    return {"deleted": deleted_count, "failed": failed_count}
+    return await asyncio.gather(*(upload_one(file) for file in files))
 
-async def delete_company_cloudinary_files(company: dict):
-    """
-    Delete all Cloudinary files associated with a company.
-    """
-    deleted_count = 0
-    failed_count = 0
-    
-    # Delete logo
-    if company.get('logo') and 'cloudinary.com' in str(company.get('logo', '')):
-        result = delete_from_cloudinary(company['logo'])
-        if result['success']:
-            deleted_count += 1
-        else:
-            failed_count += 1
-    
-    # Delete documents (licence, rccm, nif, attestation)
-    doc_fields = ['licence_exploitation', 'rccm_document', 'nif_document', 'attestation_fiscale']
-    for field in doc_fields:
-        if company.get(field) and 'cloudinary.com' in str(company.get(field, '')):
-            result = delete_from_cloudinary(company[field])
-            if result['success']:
-                deleted_count += 1
-            else:
-                failed_count += 1
-    
-    # Delete additional documents
-    if company.get('documents_additionnels'):
-        for doc_url in company['documents_additionnels']:
-            if doc_url and 'cloudinary.com' in doc_url:
-                result = delete_from_cloudinary(doc_url)
-                if result['success']:
-                    deleted_count += 1
-                else:
-                    failed_count += 1
-    
-    logging.info(f"Cloudinary cleanup for company {company.get('id')}: {deleted_count} deleted, {failed_count} failed")
-    return {"deleted": deleted_count, "failed": failed_count}
+def provider_file_urls(provider: dict) -> List[str]:
+    """Stored files referenced by a provider (profile picture, ID verification, documents)"""
+    urls = [provider.get('profile_picture'), provider.get('id_verification_picture')]
+    urls += [doc.get('path') for doc in provider.get('documents') or []]
+    return [url for url in urls if content_store.owns(url)]
+
+def company_file_urls(company: dict) -> List[str]:
+    """Stored files referenced by a company (logo, licence, rccm, nif, attestation, additional documents)"""
+    urls = [company.get(field) for field in ['logo', 'licence_exploitation', 'rccm_document', 'nif_document', 'attestation_fiscale']]
+    urls += company.get('documents_additionnels') or []
+    return [url for url in urls if content_store.owns(url)]
 
 # Contact filtering for messages - blocks phone numbers and emails
 def filter_contact_info(message: str) -> tuple[str, bool]:
@@ -407,7 +1107,7 @@ def filter_contact_info(message: str) -> tuple[str, bool]:
     return message, was_filtered
 
 # Create the main app
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 api_router = APIRouter(prefix="/api")
 security = HTTPBearer()
 
@@ -506,6 +1206,7 @@ class CreditTransaction(BaseModel):
 class AuthResponse(BaseModel):
     token: str
     user: dict
+    refresh_token: Optional[str] = None
 
 class ProfileUpdate(BaseModel):
     first_name: Optional[str] = None
@@ -1119,67 +1820,659 @@ class CompanyJobOffer(BaseModel):
     applications_count: int = 0
     created_at: str
 
+# ============================================
+# PASSWORD HASHING SERVICE
+# ============================================
+
+# bcrypt work factor and worker pool sizing
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '4'))
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', '64'))
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a dedicated, size-limited thread pool so hashing never
+    blocks the event loop. When too many hashes are queued, new requests are
+    rejected immediately with a 503 instead of piling up.
+    """
+
+    def __init__(self, rounds: int, max_workers: int, max_pending: int):
+        self.rounds = rounds
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+        self._max_workers = max_workers
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._rehashed = 0
+        self._queue_wait_total = 0.0
+        self._queue_wait_max = 0.0
+        self._hash_time_total = 0.0
+        self._hash_time_max = 0.0
+
+    async def _run(self, fn, *args):
+        if self._pending >= self.max_pending:
+            self._rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Le serveur est très sollicité. Veuillez réessayer dans quelques instants.",
+                headers={"Retry-After": "1"}
+            )
+        
+        self._pending += 1
+        submitted_at = time.perf_counter()
+        
+        def timed_call():
+            started_at = time.perf_counter()
+            result = fn(*args)
+            return result, started_at - submitted_at, time.perf_counter() - started_at
+        
+        try:
+            loop = asyncio.get_running_loop()
+            result, queue_wait, hash_time = await loop.run_in_executor(self._executor, timed_call)
+        finally:
+            self._pending -= 1
+        
+        self._completed += 1
+        self._queue_wait_total += queue_wait
+        self._queue_wait_max = max(self._queue_wait_max, queue_wait)
+        self._hash_time_total += hash_time
+        self._hash_time_max = max(self._hash_time_max, hash_time)
+        return result
+
+    async def hash(self, password: str) -> str:
+        hashed = await self._run(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(rounds=self.rounds))
+        return hashed.decode('utf-8')
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(bcrypt.checkpw, plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        """True when a stored hash was made with a different work factor"""
+        try:
+            return int(hashed_password.split('$')[2]) != self.rounds
+        except (AttributeError, IndexError, ValueError):
+            return False
+
+    def record_rehash(self):
+        self._rehashed += 1
+
+    def metrics(self) -> dict:
+        completed = self._completed or 1
+        return {
+            "rounds": self.rounds,
+            "workers": self._max_workers,
+            "max_pending": self.max_pending,
+            "pending": self._pending,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "rehashed": self._rehashed,
+            "queue_wait_avg_ms": round(self._queue_wait_total / completed * 1000, 2),
+            "queue_wait_max_ms": round(self._queue_wait_max * 1000, 2),
+            "hash_time_avg_ms": round(self._hash_time_total / completed * 1000, 2),
+            "hash_time_max_ms": round(self._hash_time_max * 1000, 2)
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+password_hasher = PasswordHasher(BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
+
 # Helper Functions
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+async def hash_password(password: str) -> str:
+    return await password_hasher.hash(password)
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await password_hasher.verify(plain_password, hashed_password)
+
+async def rehash_password_if_needed(collection, doc_id: str, plain_password: str, hashed_password: str):
+    """Transparently upgrade a stored hash after a successful login when the work factor changed"""
+    if not password_hasher.needs_rehash(hashed_password):
+        return
+    try:
+        new_hash = await hash_password(plain_password)
+        await collection.update_one({'id': doc_id}, {'$set': {'password': new_hash}})
+        password_hasher.record_rehash()
+    except Exception as e:
+        logger.warning(f"Password rehash failed for {doc_id}: {e}")
+
+# ============================================
+# ACCESS TOKENS & REVOCATION
+# ============================================
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+ACCESS_TOKEN_EXPIRATION_MINUTES = int(os.environ.get('ACCESS_TOKEN_EXPIRATION_MINUTES', '30'))
+REFRESH_TOKEN_EXPIRATION_DAYS = int(os.environ.get('REFRESH_TOKEN_EXPIRATION_DAYS', '30'))
+TOKEN_DENYLIST_REFRESH_SECONDS = float(os.environ.get('TOKEN_DENYLIST_REFRESH_SECONDS', '15'))
+# created_at is taken before the insert, so a revocation can land behind one
+# already synced: each sync re-reads this far back
+TOKEN_DENYLIST_SYNC_OVERLAP_SECONDS = float(os.environ.get('TOKEN_DENYLIST_SYNC_OVERLAP_SECONDS', '60'))
 
-def create_token(user_id: str) -> str:
-    expiration = datetime.now(timezone.utc) + timedelta(hours=JWT_EXPIRATION_HOURS)
+def principal_claims(principal_type: str, principal: dict) -> dict:
+    """
+    Claims embedded in access tokens so hot endpoints can authorize without
+    loading the principal. Principal type is one of provider, customer,
+    company, admin.
+    """
+    claims = {
+        'user_id': principal['id'],
+        'pt': principal_type,
+        'role': principal.get('role', principal_type)
+    }
+    if principal.get('verification_status'):
+        claims['vs'] = principal['verification_status']
+    if principal_type == 'customer' and principal.get('phone_number'):
+        claims['phone'] = principal['phone_number']
+    return claims
+
+def create_token(claims: dict, token_type: str = 'access') -> str:
+    now = time.time()
+    if token_type == 'refresh':
+        lifetime = REFRESH_TOKEN_EXPIRATION_DAYS * 86400
+    elif token_type == 'upload':
+        lifetime = UPLOAD_TICKET_EXPIRATION_SECONDS
+    else:
+        lifetime = ACCESS_TOKEN_EXPIRATION_MINUTES * 60
     payload = {
-        'user_id': user_id,
-        'exp': expiration
+        **claims,
+        'typ': token_type,
+        'jti': uuid.uuid4().hex,
+        'iat': now,
+        'exp': now + lifetime
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def issue_token_pair(principal_type: str, principal: dict) -> tuple:
+    """Create an (access_token, refresh_token) pair for a principal"""
+    claims = principal_claims(principal_type, principal)
+    refresh_claims = {'user_id': claims['user_id'], 'pt': principal_type}
+    return create_token(claims), create_token(refresh_claims, 'refresh')
+
+class TokenDenyList:
+    """
+    Compact in-memory deny-list of revoked tokens, mirrored in the
+    revoked_tokens collection so every worker sees revocations.
+    Two kinds of entries: a single token (jti) or every token of a
+    principal issued before a given instant (logout everywhere, password
+    reset, account deletion). Entries expire with the tokens they cover.
+    """
+
+    def __init__(self, refresh_interval: float):
+        self.refresh_interval = refresh_interval
+        self._jtis: dict = {}       # jti -> expiry timestamp
+        self._subjects: dict = {}   # user_id -> (revoked_before, expiry timestamp)
+        self._synced_at: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def is_revoked(self, payload: dict) -> bool:
+        if payload.get('jti') in self._jtis:
+            return True
+        subject = self._subjects.get(payload.get('user_id'))
+        return subject is not None and payload.get('iat', 0) <= subject[0]
+
+    def _add(self, doc: dict):
+        expires_at = doc['expires_at']
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        expiry = expires_at.timestamp()
+        if doc.get('jti'):
+            self._jtis[doc['jti']] = expiry
+        elif doc.get('user_id'):
+            revoked_before = doc['revoked_before']
+            current = self._subjects.get(doc['user_id'])
+            if current is None or current[0] < revoked_before:
+                self._subjects[doc['user_id']] = (revoked_before, expiry)
+
+    async def revoke_token(self, payload: dict) -> bool:
+        """
+        Revoke a single decoded token until it expires. Returns False if it
+        was already revoked, by this worker or another: single-use tokens
+        are claimed by the first caller that gets True.
+        """
+        doc = {
+            'jti': payload['jti'],
+            'user_id': payload.get('user_id'),
+            'expires_at': datetime.fromtimestamp(payload['exp'], timezone.utc),
+            'created_at': datetime.now(timezone.utc)
+        }
+        try:
+            await db.revoked_tokens.insert_one(doc)
+        except DuplicateKeyError:
+            return False
+        finally:
+            self._add(doc)
+        return True
+
+    async def revoke_subject(self, user_id: str):
+        """Revoke every token issued so far to a principal"""
+        now = datetime.now(timezone.utc)
+        doc = {
+            'user_id': user_id,
+            'revoked_before': now.timestamp(),
+            'expires_at': now + timedelta(days=REFRESH_TOKEN_EXPIRATION_DAYS),
+            'created_at': now
+        }
+        self._add(doc)
+        await db.revoked_tokens.insert_one(doc)
+
+    def _evict_expired(self):
+        now = time.time()
+        self._jtis = {jti: exp for jti, exp in self._jtis.items() if exp > now}
+        self._subjects = {uid: entry for uid, entry in self._subjects.items() if entry[1] > now}
+
+    async def sync(self):
+        """Pull revocations written since the last sync (by any worker); _add is idempotent"""
+        query = {'expires_at': {'$gt': datetime.now(timezone.utc)}}
+        if self._synced_at is not None:
+            query['created_at'] = {'$gt': self._synced_at - timedelta(seconds=TOKEN_DENYLIST_SYNC_OVERLAP_SECONDS)}
+        cursor = db.revoked_tokens.find(query, {'_id': 0}).sort('created_at', 1)
+        async for doc in cursor:
+            self._add(doc)
+            created_at = doc['created_at']
+            if created_at.tzinfo is None:
+                created_at = created_at.replace(tzinfo=timezone.utc)
+            self._synced_at = max(created_at, self._synced_at or created_at)
+        self._evict_expired()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.warning(f"Token deny-list sync failed: {e}")
+
+    async def _create_jti_index(self):
+        await db.revoked_tokens.create_index(
+            'jti', name='jti_unique', unique=True, partialFilterExpression={'jti': {'$exists': True}}
+        )
+
+    async def start(self):
+        await db.revoked_tokens.create_index('expires_at', expireAfterSeconds=0)
+        await db.revoked_tokens.create_index('created_at')
+        # One entry per token: concurrent redemptions of a single-use token race on the insert
+        try:
+            await self._create_jti_index()
+        except DuplicateKeyError:
+            # Tokens revoked twice before the index existed (logout after refresh)
+            duplicates = db.revoked_tokens.aggregate([
+                {'$match': {'jti': {'$exists': True}}},
+                {'$group': {'_id': '$jti', 'ids': {'$push': '$_id'}, 'count': {'$sum': 1}}},
+                {'$match': {'count': {'$gt': 1}}}
+            ])
+            async for group in duplicates:
+                await db.revoked_tokens.delete_many({'_id': {'$in': group['ids'][1:]}})
+            await self._create_jti_index()
+        await self.sync()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def metrics(self) -> dict:
+        return {
+            "revoked_tokens": len(self._jtis),
+            "revoked_principals": len(self._subjects),
+            "refresh_interval_seconds": self.refresh_interval
+        }
+
+token_deny_list = TokenDenyList(TOKEN_DENYLIST_REFRESH_SECONDS)
+
+def decode_token(token: str, token_type: str = 'access') -> dict:
+    """Decode and validate a token, rejecting revoked ones"""
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user_id = payload.get('user_id')
-        
-        user = await db.service_providers.find_one({'id': user_id}, {'_id': 0, 'password': 0})
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    
+    # Tokens issued before claims were introduced carry no type and are access tokens
+    if payload.get('typ', 'access') != token_type or not payload.get('user_id'):
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if token_deny_list.is_revoked(payload):
+        raise HTTPException(status_code=401, detail="Token revoked")
+    return payload
 
-async def get_current_company(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """Get current authenticated company"""
+async def get_token_claims(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    """Authenticate from the access token claims alone, without a database lookup"""
+    return decode_token(credentials.credentials)
+
+def require_principal(principal_type: str, not_found_detail: str):
+    """Dependency that only accepts access tokens of a given principal type"""
+    async def dependency(claims: dict = Depends(get_token_claims)) -> dict:
+        if claims.get('pt') != principal_type:
+            raise HTTPException(status_code=401, detail=not_found_detail)
+        return claims
+    return dependency
+
+provider_claims = require_principal('provider', "User not found")
+customer_claims = require_principal('customer', "Customer not found")
+
+# ============================================
+# KEYSET PAGINATION
+# ============================================
+
+# Public listings are paged newest first on (created_at, id): the next page
+# starts strictly after the last item returned, so any page is one index
+# range scan whatever its depth. The body stays a plain list; the opaque
+# cursor of the next page comes in the X-Next-Cursor header (absent on the
+# last page).
+LISTING_PAGE_SIZE = int(os.environ.get('LISTING_PAGE_SIZE', '100'))
+LISTING_MAX_PAGE_SIZE = int(os.environ.get('LISTING_MAX_PAGE_SIZE', '100'))
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+KEYSET_SORT = [('created_at', -1), ('id', -1)]
+
+def encode_cursor(doc: dict) -> str:
+    created_at = doc.get('created_at')
+    if isinstance(created_at, datetime):
+        position = ['d', created_at.isoformat(), doc.get('id')]
+    else:
+        position = ['s', created_at, doc.get('id')]
+    return base64.urlsafe_b64encode(json.dumps(position, separators=(',', ':')).encode()).decode().rstrip('=')
+
+def cursor_filter(cursor: str) -> dict:
+    """Filter matching the documents after a cursor in KEYSET_SORT order"""
     try:
-        token = credentials.credentials
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        company_id = payload.get('user_id')
+        kind, created_at, item_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if kind == 'd':
+            created_at = datetime.fromisoformat(created_at)
+        elif kind != 's':
+            raise ValueError(kind)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Curseur invalide")
+    return {'$or': [
+        {'created_at': {'$lt': created_at}},
+        {'created_at': created_at, 'id': {'$lt': item_id}}
+    ]}
+
+async def fetch_page(collection, query: dict, projection: dict, limit: int, cursor: Optional[str], response: Response) -> List[dict]:
+    """One page of a listing; sets the next page cursor header when there is more"""
+    if cursor:
+        query = {'$and': [query, cursor_filter(cursor)]} if query else cursor_filter(cursor)
+    docs = await collection.find(query, projection).sort(KEYSET_SORT).limit(limit + 1).to_list(limit + 1)
+    if len(docs) > limit:
+        docs = docs[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(docs[-1])
+    return docs
+
+def page_limit(default: int = LISTING_PAGE_SIZE):
+    return Query(default, ge=1, le=LISTING_MAX_PAGE_SIZE)
+
+# ============================================
+# FAST RESPONSES
+# ============================================
+
+# List endpoints returning hundreds of documents bypass FastAPI's response
+# pipeline (a model per document, dumped, validated again against
+# response_model, then jsonable_encoder). Documents of a response model go
+# through a precompiled TypeAdapter that validates and serializes the whole
+# list in pydantic-core; plain documents go straight to orjson.
+# response_model stays on the routes for the OpenAPI schema.
+RENTAL_LIST = TypeAdapter(List[RentalListing])
+PROVIDER_LIST = TypeAdapter(List[ServiceProvider])
+REVIEW_LIST = TypeAdapter(List[Review])
+
+def json_body_response(body: bytes, response: Optional[Response] = None) -> Response:
+    """JSON response keeping the headers set on the endpoint's `response` (cursor)"""
+    headers = dict(response.headers) if response is not None else None
+    return Response(body, media_type='application/json', headers=headers)
+
+def model_list_response(adapter: TypeAdapter, docs: List[dict], response: Optional[Response] = None) -> Response:
+    return json_body_response(adapter.dump_json(adapter.validate_python(docs)), response)
+
+def documents_response(docs, response: Optional[Response] = None) -> Response:
+    try:
+        body = orjson.dumps(docs, option=orjson.OPT_NON_STR_KEYS)
+    except TypeError:
+        # Values orjson doesn't know (ObjectId, Decimal128...) in legacy documents
+        body = orjson.dumps(jsonable_encoder(docs), option=orjson.OPT_NON_STR_KEYS)
+    return json_body_response(body, response)
+
+# ============================================
+# SPARSE FIELDSETS
+# ============================================
+
+# List endpoints take `fields=`: comma separated view names and/or field
+# names, turned into an inclusion projection so the other fields never leave
+# the database. `card` is what a listing card shows (first photo only),
+# `detail` the public document (what public endpoints return without
+# `fields`), `admin` the whole stored document (what admin endpoints return).
+# Public endpoints only offer `card` and `detail`, and only fields of their
+# `detail` view. A view of None is the whole document.
+FIELD_VIEWS: Dict[str, Dict[str, Optional[dict]]] = {
+    'rental_listings': {
+        'card': {
+            'id': 1, 'title': 1, 'property_type': 1, 'rental_type': 1, 'location': 1,
+            'rental_price': 1, 'price_per_night': 1, 'is_available': 1, 'approval_status': 1,
+            'photos': {'$slice': 1}, 'created_at': 1
+        },
+        'detail': dict.fromkeys(RentalListing.model_fields, 1),
+        'admin': None,
+    },
+    'property_sales': {
+        'card': {
+            'id': 1, 'title': 1, 'property_type': 1, 'location': 1, 'sale_price': 1,
+            'surface_area': 1, 'num_rooms': 1, 'is_negotiable': 1, 'is_available': 1, 'status': 1,
+            'photos': {'$slice': 1}, 'created_at': 1
+        },
+        'detail': None,
+        'admin': None,
+    },
+    'vehicle_listings': {
+        'card': {
+            'id': 1, 'vehicle_type': 1, 'brand': 1, 'model': 1, 'year': 1, 'location': 1,
+            'price_per_day': 1, 'is_available': 1, 'photos': {'$slice': 1}, 'created_at': 1
+        },
+        'detail': dict.fromkeys(VehicleListing.model_fields, 1),
+        'admin': None,
+    },
+    'service_providers': {
+        'card': {
+            'id': 1, 'first_name': 1, 'last_name': 1, 'profession': 1, 'custom_profession': 1,
+            'profile_picture': 1, 'online_status': 1, 'price': 1, 'region': 1, 'ville': 1,
+            'commune': 1, 'verification_status': 1, 'created_at': 1
+        },
+        'detail': dict.fromkeys(ServiceProvider.model_fields, 1),
+        'admin': None,
+    },
+}
+PUBLIC_VIEWS = ('card', 'detail')
+ADMIN_VIEWS = ('card', 'detail', 'admin')
+# Never projected, whatever the view
+HIDDEN_FIELDS = {'_id', 'password', 'search'}
+FIELD_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+def fieldset_projection(collection: str, fields: Optional[str], views: tuple = PUBLIC_VIEWS) -> Optional[dict]:
+    """Inclusion projection for a `fields` parameter; None when it asks for the endpoint's default"""
+    if not fields:
+        return None
+    collection_views = FIELD_VIEWS[collection]
+    detail = collection_views['detail'] if 'admin' not in views else None
+    projection = {}
+    for name in (part.strip() for part in fields.split(',')):
+        if not name:
+            continue
+        if name in collection_views:
+            if name not in views:
+                raise HTTPException(status_code=400, detail=f"Vue non disponible: {name}")
+            view = collection_views[name]
+            if view is None or (name == 'detail' and 'admin' not in views):
+                # What the endpoint returns without `fields`
+                return None
+            projection.update(view)
+        elif FIELD_NAME.match(name) and name not in HIDDEN_FIELDS and (detail is None or name in detail):
+            projection[name] = 1
+        else:
+            raise HTTPException(status_code=400, detail=f"Champ inconnu: {name}")
+    if not projection:
+        return None
+    # id and created_at carry the cursor of paged listings
+    return {**projection, 'id': 1, 'created_at': 1, '_id': 0}
+
+def fieldset_response(docs: list, response: Response) -> Response:
+    """Sparse documents skip the endpoint's response model, which requires the omitted fields"""
+    return documents_response(docs, response)
+
+# ============================================
+# CONDITIONAL GET
+# ============================================
+
+# Catalog endpoints polled by the landing page answer with a weak ETag and
+# Last-Modified derived from the version counters of the collections they
+# read (bumped by every write path), and with a 304 before any query when
+# the client's copy is current. Other workers' writes are seen within
+# CATALOG_VERSION_REFRESH_SECONDS.
+CATALOG_COLLECTIONS = ('service_fees', 'admin_settings', 'companies', 'company_job_offers', 'rental_listings', 'property_sales')
+CATALOG_VERSION_REFRESH_SECONDS = float(os.environ.get('CATALOG_VERSION_REFRESH_SECONDS', '2'))
+CATALOG_CACHE_CONTROL = "no-cache"
+
+collection_versions = CollectionVersions(db, CATALOG_COLLECTIONS, CATALOG_VERSION_REFRESH_SECONDS)
+
+def conditional_get(*collections: str):
+    """Dependency validating the client's cached copy of a response built from these collections"""
+    async def dependency(request: Request, response: Response):
+        etag, last_modified = collection_versions.validators(collections, f"{request.url.path}?{request.url.query}")
+        headers = {'ETag': etag, 'Last-Modified': last_modified, 'Cache-Control': CATALOG_CACHE_CONTROL}
+        # If-None-Match takes precedence over If-Modified-Since
+        if_none_match = request.headers.get('if-none-match')
+        if if_none_match is not None:
+            candidates = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+            if '*' in candidates or etag.removeprefix('W/') in candidates:
+                raise HTTPException(status_code=304, headers=headers)
+        elif 'if-modified-since' in request.headers:
+            try:
+                since = parsedate_to_datetime(request.headers['if-modified-since'])
+                if parsedate_to_datetime(last_modified) <= since:
+                    raise HTTPException(status_code=304, headers=headers)
+            except (TypeError, ValueError):
+                pass
+        response.headers.update(headers)
+    return Depends(dependency)
+
+# ============================================
+# PRINCIPAL CACHE
+# ============================================
+
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.environ.get('PRINCIPAL_CACHE_TTL_SECONDS', '30'))
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.environ.get('PRINCIPAL_CACHE_MAX_ENTRIES', '5000'))
+
+class PrincipalCache:
+    """
+    In-process TTL + LRU cache of authenticated principals (provider, company,
+    customer documents without password) keyed by user id. Every write path
+    that changes a principal must call invalidate().
+    """
+
+    KINDS = ('provider', 'company', 'customer')
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        # Bumped on every invalidation so a lookup that raced with a write never caches stale data
+        self.epoch = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def get(self, kind: str, principal_id: str) -> Optional[dict]:
+        key = (kind, principal_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            self._misses += 1
+            return None
         
-        company = await db.companies.find_one({'id': company_id}, {'_id': 0, 'password': 0})
-        if not company:
-            raise HTTPException(status_code=401, detail="Company not found")
-        return company
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+        expires_at, doc = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self._misses += 1
+            return None
+        
+        self._entries.move_to_end(key)
+        self._hits += 1
+        return dict(doc)
+
+    def set(self, kind: str, principal_id: str, doc: dict, epoch: int):
+        if epoch != self.epoch or self.max_entries <= 0:
+            return
+        key = (kind, principal_id)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, dict(doc))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def invalidate(self, principal_id: str):
+        self.epoch += 1
+        self._invalidations += 1
+        for kind in self.KINDS:
+            self._entries.pop((kind, principal_id), None)
+
+    def clear(self):
+        self.epoch += 1
+        self._entries.clear()
+
+    def metrics(self) -> dict:
+        lookups = self._hits + self._misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_ratio": round(self._hits / lookups, 3) if lookups else 0,
+            "evictions": self._evictions,
+            "invalidations": self._invalidations
+        }
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_MAX_ENTRIES, PRINCIPAL_CACHE_TTL_SECONDS)
+
+async def load_principal(kind: str, collection, principal_id: str) -> Optional[dict]:
+    """Fetch a principal by id, going through the principal cache"""
+    cached = principal_cache.get(kind, principal_id)
+    if cached is not None:
+        return cached
+    
+    epoch = principal_cache.epoch
+    doc = await collection.find_one({'id': principal_id}, {'_id': 0, 'password': 0, 'search': 0})
+    if doc:
+        principal_cache.set(kind, principal_id, doc, epoch)
+    return doc
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    payload = decode_token(credentials.credentials)
+    if payload.get('pt', 'provider') != 'provider':
+        raise HTTPException(status_code=401, detail="User not found")
+    
+    user = await load_principal('provider', db.service_providers, payload['user_id'])
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    return user
+
+async def get_current_company(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Get current authenticated company"""
+    payload = decode_token(credentials.credentials)
+    if payload.get('pt', 'company') != 'company':
+        raise HTTPException(status_code=401, detail="Company not found")
+    
+    company = await load_principal('company', db.companies, payload['user_id'])
+    if not company:
+        raise HTTPException(status_code=401, detail="Company not found")
+    return company
 
 async def get_current_customer(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """Get current authenticated customer"""
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        customer_id = payload.get('user_id')
-        
-        customer = await db.customers.find_one({'id': customer_id}, {'_id': 0, 'password': 0})
-        if not customer:
-            raise HTTPException(status_code=401, detail="Customer not found")
-        return customer
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    payload = decode_token(credentials.credentials)
+    if payload.get('pt', 'customer') != 'customer':
+        raise HTTPException(status_code=401, detail="Customer not found")
+    
+    customer = await load_principal('customer', db.customers, payload['user_id'])
+    if not customer:
+        raise HTTPException(status_code=401, detail="Customer not found")
+    return customer
 
 # Auth Routes
 @api_router.post("/auth/register", response_model=AuthResponse)
@@ -1258,55 +2551,54 @@ async def register(
     else:
         base_phone = phone
     
-    # Create all possible variants to check
-    phone_variants = [
-        phone,                    # As provided (normalized)
-        base_phone,               # Without country code
-        '224' + base_phone,       # With 224 prefix
-        '+224' + base_phone,      # With +224 prefix
-    ]
-    
-    # Check all variants in the database
-    for variant in phone_variants:
-        existing = await db.service_providers.find_one({'phone_number': variant})
-        if existing:
-            raise HTTPException(status_code=400, detail="Ce numéro de téléphone est déjà enregistré comme prestataire")
+    phone_canonical = canonical_phone(phone_number)
+    existing = await find_by_phone(db.service_providers, phone_canonical, {'_id': 1})
+    if existing:
+        raise HTTPException(status_code=400, detail="Ce numéro de téléphone est déjà enregistré comme prestataire")
     
     # Create user
     user_id = str(uuid.uuid4())
-    hashed_pwd = hash_password(password)
+    hashed_pwd = await hash_password(password)
     
     # Normalized phone number for storage
     normalized_phone = '224' + base_phone if not phone.startswith('224') else phone
     
-    # Handle profile photo upload to Cloudinary
-    profile_photo_path = None
+    # Upload profile photo and documents to storage concurrently, under one per-request cap
+    profile_photos = []
     if profile_photo and profile_photo.filename:
         file_ext = profile_photo.filename.split('.')[-1].lower()
         if file_ext in ['jpg', 'jpeg', 'png', 'webp']:
-            result = await upload_to_cloudinary(profile_photo, folder="servispro/profiles")
-            if result["success"]:
-                profile_photo_path = result["url"]
+            profile_photos.append(profile_photo)
+    
+    valid_documents = [
+        doc for doc in documents
+        if doc and doc.filename and doc.filename.split('.')[-1].lower() in ['jpg', 'jpeg', 'png', 'pdf', 'webp']
+    ]
+    
+    upload_slots = asyncio.Semaphore(UPLOAD_CONCURRENCY_PER_REQUEST)
+    profile_results, document_results = await asyncio.gather(
+        store_uploads(profile_photos, folder="servispro/profiles", semaphore=upload_slots),
+        store_uploads(valid_documents, folder="servispro/documents", semaphore=upload_slots)
+    )
+    profile_result = profile_results[0] if profile_results else None
+    
+    profile_photo_path = profile_result["url"] if profile_result and profile_result["success"] else None
     
-    # Handle documents upload to Cloudinary
     uploaded_documents = []
-    for idx, doc in enumerate(documents):
-        if doc and doc.filename:
-            file_ext = doc.filename.split('.')[-1].lower()
-            if file_ext in ['jpg', 'jpeg', 'png', 'pdf', 'webp']:
-                result = await upload_to_cloudinary(doc, folder="servispro/documents")
-                if result["success"]:
-                    uploaded_documents.append({
-                        "filename": doc.filename,
-                        "path": result["url"],
-                        "uploaded_at": datetime.now(timezone.utc).isoformat()
-                    })
+    for doc, result in zip(valid_documents, document_results):
+        if result["success"]:
+            uploaded_documents.append({
+                "filename": doc.filename,
+                "path": result["url"],
+                "uploaded_at": datetime.now(timezone.utc).isoformat()
+            })
     
     user_doc = {
         'id': user_id,
         'first_name': first_name,
         'last_name': last_name,
         'phone_number': normalized_phone,
+        'phone_canonical': phone_canonical,
         'password': hashed_pwd,
         'profession': profession,
         'profession_group': profession_group,
@@ -1328,22 +2620,31 @@ async def register(
         'created_at': datetime.now(timezone.utc).isoformat()
     }
     
-    await db.service_providers.insert_one(user_doc)
+    try:
+        await db.service_providers.insert_one({
+            **user_doc,
+            **new_provider_rank(user_doc['created_at']),
+            'rating_summary': empty_rating_summary()
+        })
+    except DuplicateKeyError:
+        # Release the photo and documents stored for the registration that lost the race
+        await storage_deletions.enqueue(provider_file_urls(user_doc), reason="duplicate provider registration")
+        raise HTTPException(status_code=400, detail="Ce numéro de téléphone est déjà enregistré comme prestataire")
     
     # Generate token
-    token = create_token(user_id)
+    token, refresh_token = issue_token_pair('provider', user_doc)
     
     # Get user from database without _id and password
     user_response = await db.service_providers.find_one({'id': user_id}, {'_id': 0, 'password': 0})
     
-    return AuthResponse(token=token, user=user_response)
+    return AuthResponse(token=token, user=user_response, refresh_token=refresh_token)
 
 @api_router.post("/auth/login", response_model=AuthResponse)
 async def login(input_data: LoginInput, request: Request):
     client_ip = get_client_ip(request)
     
     # Check if IP is blocked
-    if is_ip_blocked(client_ip):
+    if await is_ip_blocked(client_ip):
         await log_audit_event(
             event_type="LOGIN_BLOCKED",
             ip_address=client_ip,
@@ -1363,10 +2664,10 @@ async def login(input_data: LoginInput, request: Request):
         collection = db.customers
     
     # Find user
-    user = await collection.find_one({'phone_number': input_data.phone_number})
+    user = await find_by_phone(collection, input_data.phone_number)
     if not user:
         # Record failed attempt
-        was_blocked = record_failed_attempt(client_ip)
+        was_blocked = await record_failed_attempt(client_ip)
         await log_audit_event(
             event_type="LOGIN_FAILED",
             ip_address=client_ip,
@@ -1377,9 +2678,9 @@ async def login(input_data: LoginInput, request: Request):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     # Verify password
-    if not verify_password(input_data.password, user['password']):
+    if not await verify_password(input_data.password, user['password']):
         # Record failed attempt
-        was_blocked = record_failed_attempt(client_ip)
+        was_blocked = await record_failed_attempt(client_ip)
         await log_audit_event(
             event_type="LOGIN_FAILED",
             user_id=user['id'],
@@ -1391,10 +2692,11 @@ async def login(input_data: LoginInput, request: Request):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     # Clear failed attempts on successful login
-    clear_failed_attempts(client_ip)
+    await clear_failed_attempts(client_ip)
+    await rehash_password_if_needed(collection, user['id'], input_data.password, user['password'])
     
     # Generate token
-    token = create_token(user['id'])
+    token, refresh_token = issue_token_pair(input_data.user_type.value, user)
     
     # Log successful login
     await log_audit_event(
@@ -1410,7 +2712,7 @@ async def login(input_data: LoginInput, request: Request):
     user_response = {k: v for k, v in user.items() if k not in ['password', '_id']}
     user_response['user_type'] = input_data.user_type.value
     
-    return AuthResponse(token=token, user=user_response)
+    return AuthResponse(token=token, user=user_response, refresh_token=refresh_token)
 
 @api_router.post("/auth/customer/register", response_model=AuthResponse)
 async def register_customer(input_data: CustomerRegisterInput):
@@ -1423,23 +2725,14 @@ async def register_customer(input_data: CustomerRegisterInput):
     else:
         base_phone = phone
     
-    # Create all possible variants to check
-    phone_variants = [
-        phone,                    # As provided (normalized)
-        base_phone,               # Without country code
-        '224' + base_phone,       # With 224 prefix
-        '+224' + base_phone,      # With +224 prefix
-    ]
-    
-    # Check all variants in the database
-    for variant in phone_variants:
-        existing = await db.customers.find_one({'phone_number': variant})
-        if existing:
-            raise HTTPException(status_code=400, detail="Ce numéro de téléphone est déjà enregistré comme client")
+    phone_canonical = canonical_phone(input_data.phone_number)
+    existing = await find_by_phone(db.customers, phone_canonical, {'_id': 1})
+    if existing:
+        raise HTTPException(status_code=400, detail="Ce numéro de téléphone est déjà enregistré comme client")
     
     # Create customer
     customer_id = str(uuid.uuid4())
-    hashed_pwd = hash_password(input_data.password)
+    hashed_pwd = await hash_password(input_data.password)
     
     # Store phone number in normalized format (with 224 prefix)
     normalized_phone = '224' + base_phone if not phone.startswith('224') else phone
@@ -1449,20 +2742,24 @@ async def register_customer(input_data: CustomerRegisterInput):
         'first_name': input_data.first_name,
         'last_name': input_data.last_name,
         'phone_number': normalized_phone,
+        'phone_canonical': phone_canonical,
         'password': hashed_pwd,
         'created_at': datetime.now(timezone.utc).isoformat()
     }
     
-    await db.customers.insert_one(customer_doc)
+    try:
+        await db.customers.insert_one(customer_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Ce numéro de téléphone est déjà enregistré comme client")
     
     # Generate token
-    token = create_token(customer_id)
+    token, refresh_token = issue_token_pair('customer', customer_doc)
     
     # Return customer without password and _id
     customer_response = {k: v for k, v in customer_doc.items() if k not in ['password', '_id']}
     customer_response['user_type'] = 'customer'
     
-    return AuthResponse(token=token, user=customer_response)
+    return AuthResponse(token=token, user=customer_response, refresh_token=refresh_token)
 
 # Company Auth Routes
 @api_router.post("/auth/company/register", response_model=AuthResponse)
@@ -1474,13 +2771,14 @@ async def register_company(input_data: CompanyRegisterInput):
         raise HTTPException(status_code=400, detail="Ce numéro RCCM est déjà enregistré")
     
     # Check if phone number already exists
-    existing_phone = await db.companies.find_one({'phone_number': input_data.phone_number})
+    phone_canonical = canonical_phone(input_data.phone_number)
+    existing_phone = await find_by_phone(db.companies, phone_canonical, {'_id': 1})
     if existing_phone:
         raise HTTPException(status_code=400, detail="Ce numéro de téléphone est déjà enregistré")
     
     # Create company
     company_id = str(uuid.uuid4())
-    hashed_pwd = hash_password(input_data.password)
+    hashed_pwd = await hash_password(input_data.password)
     now = datetime.now(timezone.utc).isoformat()
     
     company_doc = {
@@ -1493,6 +2791,7 @@ async def register_company(input_data: CompanyRegisterInput):
         'city': input_data.city,
         'region': input_data.region,
         'phone_number': input_data.phone_number,
+        'phone_canonical': phone_canonical,
         'email': input_data.email,
         'website': input_data.website,
         'description': input_data.description,
@@ -1513,16 +2812,20 @@ async def register_company(input_data: CompanyRegisterInput):
         'updated_at': now
     }
     
-    await db.companies.insert_one(company_doc)
+    try:
+        await db.companies.insert_one({**company_doc, **search_fields('companies', company_doc)})
+        await collection_versions.bump('companies')
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Ce numéro de téléphone est déjà enregistré")
     
     # Generate token
-    token = create_token(company_id)
+    token, refresh_token = issue_token_pair('company', company_doc)
     
     # Return company without password and _id
     company_response = {k: v for k, v in company_doc.items() if k not in ['password', '_id']}
     company_response['user_type'] = 'company'
     
-    return AuthResponse(token=token, user=company_response)
+    return AuthResponse(token=token, user=company_response, refresh_token=refresh_token)
 
 @api_router.post("/auth/company/login", response_model=AuthResponse)
 async def login_company(input_data: CompanyLoginInput, request: Request):
@@ -1530,7 +2833,7 @@ async def login_company(input_data: CompanyLoginInput, request: Request):
     client_ip = get_client_ip(request)
     
     # Check if IP is blocked
-    if is_ip_blocked(client_ip):
+    if await is_ip_blocked(client_ip):
         await log_audit_event(
             event_type="COMPANY_LOGIN_BLOCKED",
             ip_address=client_ip,
@@ -1545,7 +2848,7 @@ async def login_company(input_data: CompanyLoginInput, request: Request):
     
     company = await db.companies.find_one({'rccm_number': input_data.rccm_number})
     if not company:
-        was_blocked = record_failed_attempt(client_ip)
+        was_blocked = await record_failed_attempt(client_ip)
         await log_audit_event(
             event_type="COMPANY_LOGIN_FAILED",
             ip_address=client_ip,
@@ -1555,8 +2858,8 @@ async def login_company(input_data: CompanyLoginInput, request: Request):
         )
         raise HTTPException(status_code=401, detail="Numéro RCCM ou mot de passe incorrect")
     
-    if not verify_password(input_data.password, company['password']):
-        was_blocked = record_failed_attempt(client_ip)
+    if not await verify_password(input_data.password, company['password']):
+        was_blocked = await record_failed_attempt(client_ip)
         await log_audit_event(
             event_type="COMPANY_LOGIN_FAILED",
             user_id=company['id'],
@@ -1568,10 +2871,11 @@ async def login_company(input_data: CompanyLoginInput, request: Request):
         raise HTTPException(status_code=401, detail="Numéro RCCM ou mot de passe incorrect")
     
     # Clear failed attempts on successful login
-    clear_failed_attempts(client_ip)
+    await clear_failed_attempts(client_ip)
+    await rehash_password_if_needed(db.companies, company['id'], input_data.password, company['password'])
     
     # Generate token
-    token = create_token(company['id'])
+    token, refresh_token = issue_token_pair('company', company)
     
     # Log successful login
     await log_audit_event(
@@ -1584,10 +2888,66 @@ async def login_company(input_data: CompanyLoginInput, request: Request):
     )
     
     # Return company without password and _id
-    company_response = {k: v for k, v in company.items() if k not in ['password', '_id']}
+    company_response = {k: v for k, v in company.items() if k not in ['password', '_id', 'search']}
     company_response['user_type'] = 'company'
     
-    return AuthResponse(token=token, user=company_response)
+    return AuthResponse(token=token, user=company_response, refresh_token=refresh_token)
+
+class RefreshTokenInput(BaseModel):
+    refresh_token: str
+
+class LogoutInput(BaseModel):
+    refresh_token: Optional[str] = None
+
+async def load_token_principal(principal_type: str, principal_id: str) -> Optional[dict]:
+    """Load the principal a refresh token was issued to, to mint fresh claims"""
+    if principal_type == 'provider':
+        return await load_principal('provider', db.service_providers, principal_id)
+    if principal_type == 'customer':
+        return await load_principal('customer', db.customers, principal_id)
+    if principal_type == 'company':
+        return await load_principal('company', db.companies, principal_id)
+    if principal_type == 'admin':
+        for admin_account in ADMIN_ACCOUNTS:
+            if admin_account["username"] == principal_id:
+                return {'id': admin_account["username"], 'role': admin_account["role"]}
+        return await db.admins.find_one({'id': principal_id}, {'_id': 0, 'password': 0})
+    return None
+
+@api_router.post("/auth/refresh")
+async def refresh_access_token(input_data: RefreshTokenInput):
+    """Exchange a refresh token for a new access/refresh token pair"""
+    payload = decode_token(input_data.refresh_token, 'refresh')
+    principal_type = payload.get('pt')
+    principal = await load_token_principal(principal_type, payload['user_id'])
+    if not principal:
+        raise HTTPException(status_code=401, detail="Compte introuvable")
+    
+    # Refresh tokens are single use: claimed before the new pair is issued
+    if not await token_deny_list.revoke_token(payload):
+        raise HTTPException(status_code=401, detail="Token revoked")
+    token, refresh_token = issue_token_pair(principal_type, principal)
+    return {'token': token, 'refresh_token': refresh_token}
+
+@api_router.post("/auth/logout")
+async def logout(
+    input_data: Optional[LogoutInput] = None,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Revoke the current access token and, if provided, its refresh token"""
+    payload = decode_token(credentials.credentials)
+    if payload.get('jti'):
+        await token_deny_list.revoke_token(payload)
+    
+    if input_data and input_data.refresh_token:
+        try:
+            refresh_payload = decode_token(input_data.refresh_token, 'refresh')
+        except HTTPException:
+            refresh_payload = None
+        if refresh_payload and refresh_payload['user_id'] == payload['user_id']:
+            await token_deny_list.revoke_token(refresh_payload)
+    
+    return {'message': 'Déconnexion réussie'}
 
 # Company Profile Routes
 @api_router.get("/company/profile/me")
@@ -1607,8 +2967,132 @@ class PasswordResetVerify(BaseModel):
     otp: str
     new_password: str
 
-# Store OTPs temporarily (in production, use Redis or similar)
-password_reset_otps = {}
+# OTPs are stored in MongoDB so any worker can verify them
+OTP_EXPIRATION_MINUTES = 10
+OTP_MAX_ATTEMPTS = int(os.environ.get('OTP_MAX_ATTEMPTS', '5'))
+OTP_CACHE_MAX_ENTRIES = int(os.environ.get('OTP_CACHE_MAX_ENTRIES', '256'))
+
+class OtpStore:
+    """
+    Password reset OTPs shared by every worker through the
+    password_reset_otps collection. One document per (user type, canonical
+    phone) stored under that key as _id, holding a keyed hash of the OTP,
+    an attempt counter and expires_at (TTL index). A tiny read-through cache
+    of the hash lets verify() decide locally and then issue a single
+    conditional write; a stale cache entry makes that write miss, in which
+    case the document is re-read once.
+    """
+
+    MISSING = 'missing'
+    EXPIRED = 'expired'
+    INVALID = 'invalid'
+    TOO_MANY_ATTEMPTS = 'too_many_attempts'
+    OK = 'ok'
+
+    def __init__(self, collection, ttl_minutes: int, max_attempts: int, cache_size: int):
+        self.collection = collection
+        self.ttl_minutes = ttl_minutes
+        self.max_attempts = max_attempts
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (otp_hash, expires_at)
+
+    @staticmethod
+    def key(user_type: str, phone_canonical: str) -> str:
+        return f"{user_type}:{phone_canonical}"
+
+    @staticmethod
+    def _hash(key: str, otp: str) -> str:
+        return hmac.new(JWT_SECRET.encode('utf-8'), f"{key}:{otp}".encode('utf-8'), hashlib.sha256).hexdigest()
+
+    def _remember(self, key: str, otp_hash: str, expires_at: datetime):
+        self._cache[key] = (otp_hash, expires_at)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def start(self):
+        await self.collection.create_index('expires_at', expireAfterSeconds=0)
+
+    async def issue(self, user_type: str, phone_canonical: str, otp: str, original_phone: str):
+        """Store a new OTP, replacing any pending one for the same account"""
+        key = self.key(user_type, phone_canonical)
+        now = datetime.now(timezone.utc)
+        expires_at = now + timedelta(minutes=self.ttl_minutes)
+        otp_hash = self._hash(key, otp)
+        await self.collection.replace_one(
+            {'_id': key},
+            {
+                'user_type': user_type,
+                'phone_canonical': phone_canonical,
+                'otp_hash': otp_hash,
+                'attempts': 0,
+                'original_phone': original_phone,
+                'expires_at': expires_at,
+                'created_at': now
+            },
+            upsert=True
+        )
+        self._remember(key, otp_hash, expires_at)
+
+    async def _load(self, key: str) -> Optional[tuple]:
+        doc = await self.collection.find_one({'_id': key}, {'otp_hash': 1, 'expires_at': 1})
+        if not doc:
+            self._cache.pop(key, None)
+            return None
+        expires_at = doc['expires_at'].replace(tzinfo=timezone.utc)
+        self._remember(key, doc['otp_hash'], expires_at)
+        return doc['otp_hash'], expires_at
+
+    async def verify(self, user_type: str, phone_canonical: str, otp: str) -> str:
+        """Check an OTP and consume it on success. Returns one of the status constants."""
+        key = self.key(user_type, phone_canonical)
+        otp_hash = self._hash(key, otp)
+        
+        entry = self._cache.get(key)
+        for _ in range(2):
+            if entry is None:
+                entry = await self._load(key)
+                if entry is None:
+                    return self.MISSING
+            
+            stored_hash, expires_at = entry
+            now = datetime.now(timezone.utc)
+            if now > expires_at:
+                self._cache.pop(key, None)
+                await self.collection.delete_one({'_id': key, 'otp_hash': stored_hash})
+                return self.EXPIRED
+            
+            if hmac.compare_digest(stored_hash, otp_hash):
+                consumed = await self.collection.find_one_and_delete({
+                    '_id': key,
+                    'otp_hash': otp_hash,
+                    'expires_at': {'$gt': now},
+                    'attempts': {'$lt': self.max_attempts}
+                }, projection={'_id': 1})
+                if consumed:
+                    self._cache.pop(key, None)
+                    return self.OK
+            else:
+                failed = await self.collection.find_one_and_update(
+                    {'_id': key, 'otp_hash': {'$ne': otp_hash}},
+                    {'$inc': {'attempts': 1}},
+                    projection={'attempts': 1},
+                    return_document=ReturnDocument.AFTER
+                )
+                if failed:
+                    if failed['attempts'] >= self.max_attempts:
+                        self._cache.pop(key, None)
+                        await self.collection.delete_one({'_id': key})
+                        return self.TOO_MANY_ATTEMPTS
+                    return self.INVALID
+            
+            # Cached entry was stale (OTP reissued, consumed or locked by another worker)
+            entry = None
+            self._cache.pop(key, None)
+        
+        return self.TOO_MANY_ATTEMPTS
+
+otp_store = OtpStore(db.password_reset_otps, OTP_EXPIRATION_MINUTES, OTP_MAX_ATTEMPTS, OTP_CACHE_MAX_ENTRIES)
 
 @api_router.post("/auth/forgot-password")
 async def request_password_reset(request: PasswordResetRequest):
@@ -1616,46 +3100,21 @@ async def request_password_reset(request: PasswordResetRequest):
     phone = request.phone_number
     user_type = request.user_type
     
-    # Normalize phone number - remove + and spaces
-    phone_clean = phone.replace('+', '').replace(' ', '').replace('-', '')
-    
-    # Extract base number (last 9 digits for Guinea)
-    if len(phone_clean) >= 9:
-        base_phone = phone_clean[-9:]
-    else:
-        base_phone = phone_clean
-    
-    # Create multiple search patterns
-    phone_patterns = [
-        phone,  # Original
-        phone_clean,  # Without special chars
-        f"+224{base_phone}",  # With +224
-        f"224{base_phone}",  # With 224
-        base_phone,  # Just the base number
-    ]
-    
-    # Find user based on type - try multiple phone formats
-    user = None
-    matched_phone = None
+    phone_canonical = canonical_phone(phone)
     
+    # Find user based on type
     if user_type == 'provider':
-        for p in phone_patterns:
-            user = await db.service_providers.find_one({'phone_number': p})
-            if user:
-                matched_phone = p
-                break
+        collection = db.service_providers
     elif user_type == 'customer':
-        for p in phone_patterns:
-            user = await db.customers.find_one({'phone_number': p})
-            if user:
-                matched_phone = p
-                break
+        collection = db.customers
     elif user_type == 'company':
-        for p in phone_patterns:
-            user = await db.companies.find_one({'phone_number': p})
-            if user:
-                matched_phone = p
-                break
+        collection = db.companies
+    else:
+        collection = None
+    
+    user = None
+    if collection is not None:
+        user = await find_by_phone(collection, phone_canonical, {'_id': 0, 'id': 1})
     
     if not user:
         raise HTTPException(status_code=404, detail="Aucun compte trouvé avec ce numéro de téléphone")
@@ -1664,19 +3123,14 @@ async def request_password_reset(request: PasswordResetRequest):
     import random
     otp = ''.join([str(random.randint(0, 9)) for _ in range(6)])
     
-    # Store OTP with expiration (10 minutes) - use matched phone for consistency
-    password_reset_otps[f"{user_type}_{matched_phone}"] = {
-        'otp': otp,
-        'expires_at': datetime.now(timezone.utc) + timedelta(minutes=10),
-        'original_phone': phone,
-        'matched_phone': matched_phone
-    }
+    # Store OTP with expiration, keyed on user type and canonical phone
+    await otp_store.issue(user_type, phone_canonical, otp, phone)
     
     # In production, send SMS here. For now, return OTP in response (dev mode)
     return {
         'message': f'Code OTP envoyé au {phone}',
         'otp_for_testing': otp,  # Remove this in production!
-        'expires_in_minutes': 10
+        'expires_in_minutes': OTP_EXPIRATION_MINUTES
     }
 
 @api_router.post("/auth/reset-password")
@@ -1687,66 +3141,42 @@ async def reset_password(request: PasswordResetVerify):
     otp = request.otp
     new_password = request.new_password
     
-    # Normalize phone number
-    phone_clean = phone.replace('+', '').replace(' ', '').replace('-', '')
-    if len(phone_clean) >= 9:
-        base_phone = phone_clean[-9:]
-    else:
-        base_phone = phone_clean
-    
-    # Try multiple phone formats to find the OTP
-    phone_patterns = [
-        phone,
-        phone_clean,
-        f"+224{base_phone}",
-        f"224{base_phone}",
-        base_phone,
-    ]
-    
-    stored_otp = None
-    otp_key = None
-    matched_phone = None
+    phone_canonical = canonical_phone(phone)
     
-    for p in phone_patterns:
-        key = f"{user_type}_{p}"
-        if key in password_reset_otps:
-            stored_otp = password_reset_otps[key]
-            otp_key = key
-            matched_phone = stored_otp.get('matched_phone', p)
-            break
+    # Hash before consuming the OTP so a saturated hasher (503) leaves it usable
+    hashed_pwd = await hash_password(new_password)
     
-    if not stored_otp:
+    # Verify and consume the OTP
+    otp_status = await otp_store.verify(user_type, phone_canonical, otp)
+    if otp_status == OtpStore.MISSING:
         raise HTTPException(status_code=400, detail="Aucune demande de réinitialisation en cours")
-    
-    if datetime.now(timezone.utc) > stored_otp['expires_at']:
-        del password_reset_otps[otp_key]
+    if otp_status == OtpStore.EXPIRED:
         raise HTTPException(status_code=400, detail="Le code OTP a expiré")
-    
-    if stored_otp['otp'] != otp:
+    if otp_status == OtpStore.TOO_MANY_ATTEMPTS:
+        raise HTTPException(status_code=400, detail="Trop de tentatives. Veuillez demander un nouveau code OTP")
+    if otp_status != OtpStore.OK:
         raise HTTPException(status_code=400, detail="Code OTP incorrect")
     
-    # Hash new password
-    hashed_pwd = hash_password(new_password)
-    
-    # Update password based on user type - use matched_phone from DB
+    # Update password based on user type
     if user_type == 'provider':
-        await db.service_providers.update_one(
-            {'phone_number': matched_phone},
-            {'$set': {'password': hashed_pwd, 'updated_at': datetime.now(timezone.utc).isoformat()}}
-        )
+        collection = db.service_providers
     elif user_type == 'customer':
-        await db.customers.update_one(
-            {'phone_number': matched_phone},
-            {'$set': {'password': hashed_pwd, 'updated_at': datetime.now(timezone.utc).isoformat()}}
-        )
+        collection = db.customers
     elif user_type == 'company':
-        await db.companies.update_one(
-            {'phone_number': matched_phone},
-            {'$set': {'password': hashed_pwd, 'updated_at': datetime.now(timezone.utc).isoformat()}}
+        collection = db.companies
+    else:
+        collection = None
+    
+    if collection is not None:
+        user = await find_by_phone(collection, phone_canonical, {'_id': 0, 'id': 1})
+        updated_user = user and await collection.find_one_and_update(
+            {'id': user['id']},
+            {'$set': {'password': hashed_pwd, 'updated_at': datetime.now(timezone.utc).isoformat()}},
+            projection={'_id': 0, 'id': 1}
         )
-    
-    # Remove used OTP
-    del password_reset_otps[otp_key]
+        if updated_user:
+            principal_cache.invalidate(updated_user['id'])
+            await token_deny_list.revoke_subject(updated_user['id'])
     
     return {'message': 'Mot de passe réinitialisé avec succès'}
 
@@ -1754,15 +3184,23 @@ async def reset_password(request: PasswordResetVerify):
 async def update_company_profile(update_data: CompanyProfileUpdate, current_company: dict = Depends(get_current_company)):
     """Update company profile"""
     update_dict = {k: v for k, v in update_data.model_dump().items() if v is not None}
+    if 'phone_number' in update_dict:
+        update_dict['phone_canonical'] = canonical_phone(update_dict['phone_number'])
     
     if update_dict:
         update_dict['updated_at'] = datetime.now(timezone.utc).isoformat()
-        await db.companies.update_one(
-            {'id': current_company['id']},
-            {'$set': update_dict}
-        )
+        update_dict.update(search_fields('companies', {**current_company, **update_dict}))
+        try:
+            await db.companies.update_one(
+                {'id': current_company['id']},
+                {'$set': update_dict}
+            )
+            await collection_versions.bump('companies')
+        except DuplicateKeyError:
+            raise HTTPException(status_code=400, detail="Ce numéro de téléphone est déjà enregistré")
+        principal_cache.invalidate(current_company['id'])
     
-    updated_company = await db.companies.find_one({'id': current_company['id']}, {'_id': 0, 'password': 0})
+    updated_company = await db.companies.find_one({'id': current_company['id']}, {'_id': 0, 'password': 0, 'search': 0})
     return updated_company
 
 @api_router.post("/company/upload-logo")
@@ -1771,8 +3209,8 @@ async def upload_company_logo(file: UploadFile = File(...), current_company: dic
     if not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="Le fichier doit être une image")
     
-    # Upload to Cloudinary
-    result = await upload_to_cloudinary(file, folder="servispro/company_logos")
+    # Upload to storage
+    result = await store_upload(file, folder="servispro/company_logos")
     
     if not result["success"]:
         raise HTTPException(status_code=500, detail=f"Upload failed: {result.get('error')}")
@@ -1782,6 +3220,8 @@ async def upload_company_logo(file: UploadFile = File(...), current_company: dic
         {'id': current_company['id']},
         {'$set': {'logo': logo_url, 'updated_at': datetime.now(timezone.utc).isoformat()}}
     )
+    await collection_versions.bump('companies')
+    principal_cache.invalidate(current_company['id'])
     
     return {'logo': logo_url}
 
@@ -1801,8 +3241,8 @@ async def upload_company_document(
     if file.content_type not in allowed_types:
         raise HTTPException(status_code=400, detail="Le fichier doit être une image (JPG, PNG) ou un PDF")
     
-    # Upload to Cloudinary
-    result = await upload_to_cloudinary(file, folder="servispro/company_documents")
+    # Upload to storage
+    result = await store_upload(file, folder="servispro/company_documents")
     
     if not result["success"]:
         raise HTTPException(status_code=500, detail=f"Upload failed: {result.get('error')}")
@@ -1823,6 +3263,8 @@ async def upload_company_document(
             {'id': current_company['id']},
             {'$set': {document_type: document_url, 'updated_at': datetime.now(timezone.utc).isoformat()}}
         )
+    await collection_versions.bump('companies')
+    principal_cache.invalidate(current_company['id'])
     
     return {'document_url': document_url, 'document_type': document_type}
 
@@ -1847,7 +3289,7 @@ async def create_company_service(
         'created_at': datetime.now(timezone.utc).isoformat()
     }
     
-    await db.company_services.insert_one(service_doc)
+    await db.company_services.insert_one({**service_doc, **search_fields('company_services', service_doc)})
     
     return {k: v for k, v in service_doc.items() if k != '_id'}
 
@@ -1856,23 +3298,26 @@ async def get_my_company_services(current_company: dict = Depends(get_current_co
     """Get all services of current company"""
     services = await db.company_services.find(
         {'company_id': current_company['id']},
-        {'_id': 0}
+        {'_id': 0, 'search': 0}
     ).to_list(100)
     return services
 
 @api_router.get("/company-services")
 async def get_all_company_services(
+    response: Response,
     category: Optional[str] = None,
-    location: Optional[str] = None
+    location: Optional[str] = None,
+    limit: int = page_limit(),
+    cursor: Optional[str] = None
 ):
-    """Get all company services (public)"""
+    """Get all company services (public), newest first, paged by cursor"""
     query = {}
     if category:
         query['category'] = category
     if location:
-        query['location'] = {'$regex': location, '$options': 'i'}
+        query.update(location_filter(location))
     
-    services = await db.company_services.find(query, {'_id': 0}).to_list(100)
+    services = await fetch_page(db.company_services, query, {'_id': 0, 'search': 0}, limit, cursor, response)
     return services
 
 # Company Job Offers Routes
@@ -1898,7 +3343,8 @@ async def create_company_job_offer(
         'created_at': datetime.now(timezone.utc).isoformat()
     }
     
-    await db.company_job_offers.insert_one(job_doc)
+    await db.company_job_offers.insert_one({**job_doc, **search_fields('company_job_offers', job_doc)})
+    await collection_versions.bump('company_job_offers')
     
     return {k: v for k, v in job_doc.items() if k != '_id'}
 
@@ -1907,29 +3353,32 @@ async def get_my_company_job_offers(current_company: dict = Depends(get_current_
     """Get all job offers of current company"""
     jobs = await db.company_job_offers.find(
         {'company_id': current_company['id']},
-        {'_id': 0}
+        {'_id': 0, 'search': 0}
     ).to_list(100)
     return jobs
 
-@api_router.get("/job-offers")
+@api_router.get("/job-offers", dependencies=[conditional_get('company_job_offers')])
 async def get_all_job_offers(
+    response: Response,
     contract_type: Optional[str] = None,
-    location: Optional[str] = None
+    location: Optional[str] = None,
+    limit: int = page_limit(),
+    cursor: Optional[str] = None
 ):
-    """Get all active job offers (public)"""
+    """Get all active job offers (public), newest first, paged by cursor"""
     query = {'is_active': True}
     if contract_type:
         query['contract_type'] = contract_type
     if location:
-        query['location'] = {'$regex': location, '$options': 'i'}
+        query.update(location_filter(location))
     
-    jobs = await db.company_job_offers.find(query, {'_id': 0}).sort('created_at', -1).to_list(100)
+    jobs = await fetch_page(db.company_job_offers, query, {'_id': 0, 'search': 0}, limit, cursor, response)
     return jobs
 
 @api_router.get("/job-offers/{job_id}")
 async def get_job_offer(job_id: str):
     """Get a specific job offer"""
-    job = await db.company_job_offers.find_one({'id': job_id}, {'_id': 0})
+    job = await db.company_job_offers.find_one({'id': job_id}, {'_id': 0, 'search': 0})
     if not job:
         raise HTTPException(status_code=404, detail="Offre d'emploi non trouvée")
     return job
@@ -1988,7 +3437,8 @@ async def create_company_rental(
         'updated_at': now
     }
     
-    await db.rental_listings.insert_one(listing_doc)
+    await db.rental_listings.insert_one({**listing_doc, **search_fields('rental_listings', listing_doc)})
+    await collection_versions.bump('rental_listings')
     return {k: v for k, v in listing_doc.items() if k != '_id'}
 
 @api_router.get("/company/rentals/my")
@@ -1996,7 +3446,7 @@ async def get_company_rentals(current_company: dict = Depends(get_current_compan
     """Get all rental listings for the current company"""
     rentals = await db.rental_listings.find(
         {'service_provider_id': current_company['id']},
-        {'_id': 0}
+        {'_id': 0, 'search': 0}
     ).sort('created_at', -1).to_list(100)
     return rentals
 
@@ -2017,8 +3467,8 @@ async def upload_company_rental_photo(
     if not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="Le fichier doit être une image")
     
-    # Upload to Cloudinary
-    result = await upload_to_cloudinary(file, folder="servispro/rentals")
+    # Upload to storage
+    result = await store_upload(file, folder="servispro/rentals")
     
     if not result["success"]:
         raise HTTPException(status_code=500, detail=f"Upload failed: {result.get('error')}")
@@ -2031,9 +3481,47 @@ async def upload_company_rental_photo(
             '$set': {'updated_at': datetime.now(timezone.utc).isoformat()}
         }
     )
+    await collection_versions.bump('rental_listings')
     
     return {'photo_url': photo_url, 'message': 'Photo uploadée avec succès'}
 
+@api_router.post("/company/rentals/{rental_id}/upload-photos")
+async def upload_company_rental_photos(
+    rental_id: str,
+    files: List[UploadFile] = File(...),
+    current_company: dict = Depends(get_current_company)
+):
+    """Upload several photos for a company rental listing at once"""
+    rental = await db.rental_listings.find_one({'id': rental_id}, {'_id': 0, 'service_provider_id': 1})
+    if not rental:
+        raise HTTPException(status_code=404, detail="Annonce non trouvée")
+    
+    if rental['service_provider_id'] != current_company['id']:
+        raise HTTPException(status_code=403, detail="Non autorisé")
+    
+    if any(not (file.content_type or '').startswith('image/') for file in files):
+        raise HTTPException(status_code=400, detail="Le fichier doit être une image")
+    
+    results = await store_uploads(files, folder="servispro/rentals")
+    photo_urls = [result["url"] for result in results if result["success"]]
+    if not photo_urls:
+        raise HTTPException(status_code=500, detail=f"Upload failed: {results[0].get('error') if results else 'aucun fichier'}")
+    
+    await db.rental_listings.update_one(
+        {'id': rental_id},
+        {
+            '$push': {'photos': {'$each': photo_urls}},
+            '$set': {'updated_at': datetime.now(timezone.utc).isoformat()}
+        }
+    )
+    await collection_versions.bump('rental_listings')
+    
+    return {
+        'photo_urls': photo_urls,
+        'failed_count': len(results) - len(photo_urls),
+        'message': 'Photos uploadées avec succès'
+    }
+
 @api_router.post("/company/rentals/{rental_id}/upload-document/{doc_type}")
 async def upload_company_rental_document(
     rental_id: str,
@@ -2053,8 +3541,8 @@ async def upload_company_rental_document(
     if doc_type not in valid_doc_types:
         raise HTTPException(status_code=400, detail=f"Type de document invalide. Types valides: {valid_doc_types}")
     
-    # Upload to Cloudinary
-    result = await upload_to_cloudinary(file, folder="servispro/rental_documents")
+    # Upload to storage
+    result = await store_upload(file, folder="servispro/rental_documents")
     
     if not result["success"]:
         raise HTTPException(status_code=500, detail=f"Upload failed: {result.get('error')}")
@@ -2074,6 +3562,7 @@ async def upload_company_rental_document(
             {'id': rental_id},
             {'$set': {doc_type: doc_url, 'updated_at': datetime.now(timezone.utc).isoformat()}}
         )
+    await collection_versions.bump('rental_listings')
     
     return {'document_url': doc_url, 'document_type': doc_type, 'message': 'Document uploadé avec succès'}
 
@@ -2091,6 +3580,7 @@ async def delete_company_rental(
         raise HTTPException(status_code=403, detail="Non autorisé")
     
     await db.rental_listings.delete_one({'id': rental_id})
+    await collection_versions.bump('rental_listings')
     await db.chat_messages.delete_many({'rental_id': rental_id})
     
     return {'message': 'Annonce supprimée avec succès'}
@@ -2144,7 +3634,8 @@ async def create_company_property_sale(
         'updated_at': now
     }
     
-    await db.property_sales.insert_one(sale_doc)
+    await db.property_sales.insert_one({**sale_doc, **search_fields('property_sales', sale_doc)})
+    await collection_versions.bump('property_sales')
     return {k: v for k, v in sale_doc.items() if k != '_id'}
 
 @api_router.get("/company/property-sales/my")
@@ -2152,7 +3643,7 @@ async def get_company_property_sales(current_company: dict = Depends(get_current
     """Get all property sales for the current company"""
     sales = await db.property_sales.find(
         {'agent_id': current_company['id']},
-        {'_id': 0}
+        {'_id': 0, 'search': 0}
     ).sort('created_at', -1).to_list(100)
     return sales
 
@@ -2170,8 +3661,8 @@ async def upload_company_sale_photo(
     if sale['agent_id'] != current_company['id']:
         raise HTTPException(status_code=403, detail="Non autorisé")
     
-    # Upload to Cloudinary
-    result = await upload_to_cloudinary(file, folder="servispro/property_sales")
+    # Upload to storage
+    result = await store_upload(file, folder="servispro/property_sales")
     
     if not result["success"]:
         raise HTTPException(status_code=500, detail=f"Upload failed: {result.get('error')}")
@@ -2184,6 +3675,7 @@ async def upload_company_sale_photo(
             '$set': {'updated_at': datetime.now(timezone.utc).isoformat()}
         }
     )
+    await collection_versions.bump('property_sales')
     
     return {"photo_url": photo_url, "message": "Photo uploadée avec succès"}
 
@@ -2206,8 +3698,8 @@ async def upload_company_sale_document(
     if doc_type not in valid_doc_types:
         raise HTTPException(status_code=400, detail=f"Type de document invalide. Types valides: {valid_doc_types}")
     
-    # Upload to Cloudinary
-    result = await upload_to_cloudinary(file, folder="servispro/sale_documents")
+    # Upload to storage
+    result = await store_upload(file, folder="servispro/sale_documents")
     
     if not result["success"]:
         raise HTTPException(status_code=500, detail=f"Upload failed: {result.get('error')}")
@@ -2227,6 +3719,7 @@ async def upload_company_sale_document(
             {'id': sale_id},
             {'$set': {doc_type: doc_url, 'updated_at': datetime.now(timezone.utc).isoformat()}}
         )
+    await collection_versions.bump('property_sales')
     
     return {'document_url': doc_url, 'document_type': doc_type, 'message': 'Document uploadé avec succès'}
 
@@ -2244,22 +3737,26 @@ async def delete_company_property_sale(
         raise HTTPException(status_code=403, detail="Non autorisé")
     
     await db.property_sales.delete_one({'id': sale_id})
+    await collection_versions.bump('property_sales')
     return {'message': 'Propriété supprimée avec succès'}
 
 # Public Companies Route
-@api_router.get("/companies")
+@api_router.get("/companies", dependencies=[conditional_get('companies')])
 async def get_all_companies(
+    response: Response,
     sector: Optional[str] = None,
-    region: Optional[str] = None
+    region: Optional[str] = None,
+    limit: int = page_limit(),
+    cursor: Optional[str] = None
 ):
-    """Get all approved companies (public)"""
+    """Get all approved companies (public), newest first, paged by cursor"""
     query = {'verification_status': 'approved'}
     if sector:
         query['sector'] = sector
     if region:
         query['region'] = region
     
-    companies = await db.companies.find(query, {'_id': 0, 'password': 0}).to_list(100)
+    companies = await fetch_page(db.companies, query, {'_id': 0, 'password': 0, 'search': 0}, limit, cursor, response)
     return companies
 
 @api_router.get("/companies/{company_id}")
@@ -2267,7 +3764,7 @@ async def get_company(company_id: str):
     """Get a specific company (public)"""
     company = await db.companies.find_one(
         {'id': company_id, 'verification_status': 'approved'},
-        {'_id': 0, 'password': 0}
+        {'_id': 0, 'password': 0, 'search': 0}
     )
     if not company:
         raise HTTPException(status_code=404, detail="Entreprise non trouvée")
@@ -2290,6 +3787,9 @@ async def update_profile(update_data: ProfileUpdate, current_user: dict = Depend
             {'id': current_user['id']},
             {'$set': update_dict}
         )
+        if 'online_status' in update_dict:
+            await db.service_providers.update_one({'id': current_user['id']}, [{'$set': {'rank': ONLINE_RANK}}])
+        principal_cache.invalidate(current_user['id'])
     
     updated_user = await db.service_providers.find_one({'id': current_user['id']}, {'_id': 0, 'password': 0})
     return updated_user
@@ -2300,18 +3800,19 @@ async def upload_profile_picture(file: UploadFile = File(...), current_user: dic
     if not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="File must be an image")
     
-    # Upload to Cloudinary
-    result = await upload_to_cloudinary(file, folder="servispro/profiles")
+    # Upload to storage
+    result = await store_upload(file, folder="servispro/profiles")
     
     if not result["success"]:
         raise HTTPException(status_code=500, detail=f"Upload failed: {result.get('error')}")
     
-    # Update user profile with Cloudinary URL
+    # Update user profile with the stored file URL
     profile_picture_url = result["url"]
     await db.service_providers.update_one(
         {'id': current_user['id']},
         {'$set': {'profile_picture': profile_picture_url}}
     )
+    principal_cache.invalidate(current_user['id'])
     
     return {'profile_picture': profile_picture_url}
 
@@ -2321,18 +3822,19 @@ async def upload_id_verification(file: UploadFile = File(...), current_user: dic
     if not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="File must be an image")
     
-    # Upload to Cloudinary
-    result = await upload_to_cloudinary(file, folder="servispro/id_verification")
+    # Upload to storage
+    result = await store_upload(file, folder="servispro/id_verification")
     
     if not result["success"]:
         raise HTTPException(status_code=500, detail=f"Upload failed: {result.get('error')}")
     
-    # Update user profile with Cloudinary URL
+    # Update user profile with the stored file URL
     id_verification_url = result["url"]
     await db.service_providers.update_one(
         {'id': current_user['id']},
         {'$set': {'id_verification_picture': id_verification_url}}
     )
+    principal_cache.invalidate(current_user['id'])
     
     return {'id_verification_picture': id_verification_url}
 
@@ -2344,8 +3846,9 @@ async def update_online_status(current_user: dict = Depends(get_current_user)):
     
     await db.service_providers.update_one(
         {'id': current_user['id']},
-        {'$set': {'online_status': new_status}}
+        online_status_update(new_status)
     )
+    principal_cache.invalidate(current_user['id'])
     
     return {'online_status': new_status}
 
@@ -2354,8 +3857,9 @@ async def set_online(current_user: dict = Depends(get_current_user)):
     """Set provider as online"""
     await db.service_providers.update_one(
         {'id': current_user['id']},
-        {'$set': {'online_status': True}}
+        online_status_update(True)
     )
+    principal_cache.invalidate(current_user['id'])
     return {'online_status': True}
 
 @api_router.put("/profile/set-offline")
@@ -2363,14 +3867,120 @@ async def set_offline(current_user: dict = Depends(get_current_user)):
     """Set provider as offline"""
     await db.service_providers.update_one(
         {'id': current_user['id']},
-        {'$set': {'online_status': False}}
+        online_status_update(False)
     )
+    principal_cache.invalidate(current_user['id'])
     return {'online_status': False}
 
+# ============================================
+# PROVIDER DISCOVERY
+# ============================================
+
+# Providers filtered server-side and sorted by their precomputed rank
+# (ranking.py), best first. Pages follow a (rank, id) cursor returned in the
+# X-Next-Cursor header. Facet counts per profession and region come back with
+# the page; each facet ignores its own field's filter so the other values
+# stay selectable. The page, the total and each facet are separate queries
+# run concurrently, each on a compound (filters..., rank, id) index.
+DISCOVERY_PAGE_SIZE = int(os.environ.get('DISCOVERY_PAGE_SIZE', '20'))
+DISCOVERY_SORT = [('rank', -1), ('id', -1)]
+DISCOVERY_FACETS = ('profession', 'region')
+
+class FacetCount(BaseModel):
+    value: Optional[str] = None
+    count: int
+
+class ProviderDiscovery(BaseModel):
+    results: List[ServiceProvider]
+    facets: Dict[str, List[FacetCount]]
+    total: int
+
+def encode_rank_cursor(doc: dict) -> str:
+    position = [doc.get('rank'), doc.get('id')]
+    return base64.urlsafe_b64encode(json.dumps(position, separators=(',', ':')).encode()).decode().rstrip('=')
+
+def rank_cursor_filter(cursor: str) -> dict:
+    """Filter matching the providers after a cursor in DISCOVERY_SORT order"""
+    try:
+        rank, provider_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if rank is not None and not isinstance(rank, (int, float)):
+            raise ValueError(rank)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Curseur invalide")
+    if rank is None:
+        # Providers not ranked yet come last
+        return {'rank': None, 'id': {'$lt': provider_id}}
+    return {'$or': [
+        {'rank': {'$lt': rank}},
+        {'rank': rank, 'id': {'$lt': provider_id}},
+        {'rank': None}
+    ]}
+
+@api_router.get("/providers/discover", response_model=ProviderDiscovery)
+async def discover_providers(
+    response: Response,
+    profession: Optional[str] = None,
+    region: Optional[str] = None,
+    ville: Optional[str] = None,
+    commune: Optional[str] = None,
+    online: Optional[bool] = None,
+    verified: Optional[bool] = None,
+    limit: int = page_limit(DISCOVERY_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
+    """Providers matching the filters, best ranked first, with profession and region counts"""
+    query = {
+        field: value
+        for field, value in (('profession', profession), ('region', region), ('ville', ville), ('commune', commune))
+        if value
+    }
+    if online is not None:
+        query['online_status'] = online
+    if verified is not None:
+        query['verification_status'] = 'approved' if verified else {'$ne': 'approved'}
+
+    page_query = {**query, **rank_cursor_filter(cursor)} if cursor else query
+
+    def facet_counts(field: str):
+        facet_query = {key: value for key, value in query.items() if key != field}
+        return db.service_providers.aggregate([
+            {'$match': facet_query},
+            {'$group': {'_id': f'${field}', 'count': {'$sum': 1}}},
+            {'$sort': {'count': -1, '_id': 1}}
+        ]).to_list(None)
+
+    providers, total, *facets = await asyncio.gather(
+        db.service_providers.find(page_query, {'_id': 0, 'password': 0}).sort(DISCOVERY_SORT).limit(limit + 1).to_list(limit + 1),
+        db.service_providers.count_documents(query),
+        *(facet_counts(field) for field in DISCOVERY_FACETS)
+    )
+
+    if len(providers) > limit:
+        providers = providers[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_rank_cursor(providers[-1])
+    return ProviderDiscovery(
+        results=[ServiceProvider(**p) for p in providers],
+        facets={
+            field: [FacetCount(value=row['_id'], count=row['count']) for row in rows]
+            for field, rows in zip(DISCOVERY_FACETS, facets)
+        },
+        total=total
+    )
+
+# Provider Routes
 @api_router.get("/providers", response_model=List[ServiceProvider])
-async def get_all_providers():
-    providers = await db.service_providers.find({}, {'_id': 0, 'password': 0}).to_list(100)
-    return [ServiceProvider(**p) for p in providers]
+async def get_all_providers(
+    response: Response,
+    fields: Optional[str] = None,
+    limit: int = page_limit(),
+    cursor: Optional[str] = None
+):
+    """Get all providers, newest first, paged by cursor"""
+    projection = fieldset_projection('service_providers', fields)
+    providers = await fetch_page(db.service_providers, {}, projection or {'_id': 0, 'password': 0}, limit, cursor, response)
+    if projection:
+        return fieldset_response(providers, response)
+    return model_list_response(PROVIDER_LIST, providers, response)
 
 @api_router.get("/providers/{provider_id}", response_model=ServiceProvider)
 async def get_provider_by_id(provider_id: str):
@@ -2399,17 +4009,6 @@ async def delete_provider_document(provider_id: str, doc_index: int, current_use
     # Get the document to delete
     doc_to_delete = documents[doc_index]
     
-    # Try to delete the physical file
-    try:
-        file_path = doc_to_delete.get('path', '')
-        if file_path.startswith('/api/uploads/'):
-            file_name = file_path.replace('/api/uploads/', '')
-            full_path = os.path.join(UPLOAD_DIR, file_name)
-            if os.path.exists(full_path):
-                os.remove(full_path)
-    except Exception as e:
-        print(f"Error deleting file: {e}")
-    
     # Remove the document from the array
     documents.pop(doc_index)
     
@@ -2418,6 +4017,10 @@ async def delete_provider_document(provider_id: str, doc_index: int, current_use
         {'id': provider_id},
         {'$set': {'documents': documents}}
     )
+    principal_cache.invalidate(provider_id)
+    
+    # Release the stored file (deleted in the background once no other document uses the same content)
+    await storage_deletions.enqueue([doc_to_delete.get('path')], reason=f"provider {provider_id} document removed")
     
     return {"message": "Document supprimé avec succès", "remaining_documents": len(documents)}
 
@@ -2443,9 +4046,9 @@ async def add_provider_document(
     if len(documents) >= 10:
         raise HTTPException(status_code=400, detail="Vous ne pouvez pas télécharger plus de 10 documents")
     
-    # Upload to Cloudinary
+    # Upload to storage
     try:
-        result = await upload_to_cloudinary(document, folder="servispro/documents")
+        result = await store_upload(document, folder="servispro/documents")
         
         if not result["success"]:
             raise HTTPException(status_code=500, detail=f"Erreur upload: {result.get('error')}")
@@ -2461,11 +4064,261 @@ async def add_provider_document(
             {'id': provider_id},
             {'$push': {'documents': new_doc}}
         )
+        principal_cache.invalidate(provider_id)
         
         return {"message": "Document ajouté avec succès", "document": new_doc}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors du téléchargement: {str(e)}")
 
+# ============================================
+# SEARCH
+# ============================================
+
+# type -> (collection, filter of publicly visible documents)
+SEARCH_TARGETS = {
+    'rentals': ('rental_listings', {'approval_status': ListingApprovalStatus.APPROVED.value}),
+    'property_sales': ('property_sales', {'status': 'approved'}),
+    'vehicles': ('vehicle_listings', {}),
+    'companies': ('companies', {'verification_status': 'approved'}),
+}
+SEARCH_MAX_RESULTS = int(os.environ.get('SEARCH_MAX_RESULTS', '50'))
+
+@api_router.get("/search")
+async def search_listings(
+    q: str = Query(..., min_length=2, max_length=100),
+    types: Optional[str] = None,  # comma separated: rentals,property_sales,vehicles,companies
+    location: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=SEARCH_MAX_RESULTS)
+):
+    """
+    Full-text search across listings and companies, accent and case
+    insensitive, best matches first (title matches weigh more than location,
+    location more than description).
+    """
+    terms = fold(q)
+    if not terms:
+        raise HTTPException(status_code=400, detail="Recherche invalide")
+    kinds = [kind.strip() for kind in types.split(',') if kind.strip()] if types else list(SEARCH_TARGETS)
+    unknown = [kind for kind in kinds if kind not in SEARCH_TARGETS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Type invalide. Types valides: {list(SEARCH_TARGETS)}")
+    
+    async def search_one(kind: str) -> List[dict]:
+        collection, visible = SEARCH_TARGETS[kind]
+        query = {'$text': {'$search': terms}, **visible, **location_filter(location)}
+        projection = {'_id': 0, 'password': 0, 'search': 0, 'score': {'$meta': 'textScore'}}
+        docs = await db[collection].find(query, projection).sort([('score', {'$meta': 'textScore'})]).limit(limit).to_list(limit)
+        return [{'type': kind, 'score': round(doc.pop('score'), 4), 'item': doc} for doc in docs]
+    
+    # Each collection returns at most `limit` best matches from its text index
+    matches = [match for found in await asyncio.gather(*(search_one(kind) for kind in kinds)) for match in found]
+    matches.sort(key=lambda match: match['score'], reverse=True)
+    results = matches[:limit]
+    
+    return {
+        'query': q,
+        'results': results,
+        'counts': {kind: sum(1 for match in results if match['type'] == kind) for kind in kinds}
+    }
+
+# ============================================
+# DIRECT UPLOADS (signed tickets)
+# ============================================
+
+# Clients upload bytes straight to the storage backend with a short-lived
+# signed ticket, then commit the ticket to attach the URL. The multipart
+# upload endpoints above stay as a fallback.
+UPLOAD_TICKET_EXPIRATION_SECONDS = int(os.environ.get('UPLOAD_TICKET_EXPIRATION_SECONDS', '900'))
+
+DIRECT_UPLOAD_DOCUMENT_EXTENSIONS = {'pdf', 'doc', 'docx', 'jpg', 'jpeg', 'png', 'webp'}
+LISTING_DOCUMENT_TYPES = ['titre_foncier', 'registration_ministere', 'seller_id_document', 'document_ministere_habitat', 'document_batiment', 'documents_additionnels', 'autres_documents']
+
+# entity -> collection, owner field and storage folder per kind of file
+DIRECT_UPLOAD_TARGETS = {
+    'rental': {
+        'collection': 'rental_listings',
+        'owner_field': 'service_provider_id',
+        'folders': {'photo': 'servispro/rentals', 'document': 'servispro/rental_documents'}
+    },
+    'property_sale': {
+        'collection': 'property_sales',
+        'owner_field': 'agent_id',
+        'folders': {'photo': 'servispro/property_sales', 'document': 'servispro/sale_documents'}
+    },
+    'vehicle': {
+        'collection': 'vehicle_listings',
+        'owner_field': 'owner_id',
+        'folders': {'photo': 'servispro/vehicles'}
+    },
+    'provider_document': {
+        'collection': 'service_providers',
+        'owner_field': 'id',
+        'folders': {'document': 'servispro/documents'}
+    },
+}
+
+class DirectUploadTicketRequest(BaseModel):
+    entity: str  # rental, property_sale, vehicle, provider_document
+    entity_id: str
+    kind: str = 'photo'  # photo or document
+    doc_type: Optional[str] = None  # listing documents only
+    filename: str
+    content_type: str
+    size: int
+
+class DirectUploadCommit(BaseModel):
+    ticket: str
+
+async def load_upload_target(entity: str, entity_id: str, user_id: str) -> dict:
+    """Entity a direct upload is attached to, checking the caller owns it"""
+    target = DIRECT_UPLOAD_TARGETS[entity]
+    document = await db[target['collection']].find_one(
+        {'id': entity_id},
+        {'_id': 0, target['owner_field']: 1, 'documents': 1}
+    )
+    if not document:
+        raise HTTPException(status_code=404, detail="Élément non trouvé")
+    if document.get(target['owner_field']) != user_id:
+        raise HTTPException(status_code=403, detail="Non autorisé")
+    return document
+
+@api_router.post("/direct-uploads/tickets")
+async def create_direct_upload_ticket(request: DirectUploadTicketRequest, claims: dict = Depends(provider_claims)):
+    """Issue a signed ticket to upload one file directly to storage"""
+    target = DIRECT_UPLOAD_TARGETS.get(request.entity)
+    if not target:
+        raise HTTPException(status_code=400, detail=f"Type d'élément invalide. Types valides: {list(DIRECT_UPLOAD_TARGETS)}")
+    if request.kind not in target['folders']:
+        raise HTTPException(status_code=400, detail=f"Type de fichier invalide. Types valides: {list(target['folders'])}")
+    if request.entity in ('rental', 'property_sale') and request.kind == 'document' and request.doc_type not in LISTING_DOCUMENT_TYPES:
+        raise HTTPException(status_code=400, detail=f"Type de document invalide. Types valides: {LISTING_DOCUMENT_TYPES}")
+    
+    file_ext = request.filename.split('.')[-1].lower() if '.' in request.filename else ''
+    if request.kind == 'photo':
+        if not request.content_type.startswith('image/'):
+            raise HTTPException(status_code=400, detail="Le fichier doit être une image")
+        file_ext = file_ext or 'jpg'
+    elif file_ext not in DIRECT_UPLOAD_DOCUMENT_EXTENSIONS:
+        raise HTTPException(status_code=400, detail=f"Extension invalide. Extensions valides: {sorted(DIRECT_UPLOAD_DOCUMENT_EXTENSIONS)}")
+    if request.size <= 0:
+        raise HTTPException(status_code=400, detail="Taille de fichier invalide")
+    if request.size > MAX_UPLOAD_SIZE_BYTES:
+        raise upload_too_large_error()
+    
+    document = await load_upload_target(request.entity, request.entity_id, claims['user_id'])
+    if request.entity == 'provider_document' and len(document.get('documents') or []) >= 10:
+        raise HTTPException(status_code=400, detail="Vous ne pouvez pas télécharger plus de 10 documents")
+    
+    backend = storage_backends[STORAGE_BACKEND]
+    resource_type = "raw" if file_ext in ['pdf', 'doc', 'docx'] else "image"
+    key = f"{target['folders'][request.kind]}/{uuid.uuid4().hex}"
+    ticket = create_token({
+        'user_id': claims['user_id'],
+        'entity': request.entity,
+        'entity_id': request.entity_id,
+        'kind': request.kind,
+        'doc_type': request.doc_type,
+        'filename': request.filename,
+        'backend': backend.name,
+        'ref': backend.object_ref(key, file_ext),
+        'resource_type': resource_type,
+        'max_size': request.size
+    }, 'upload')
+    expires_at = int(time.time()) + UPLOAD_TICKET_EXPIRATION_SECONDS
+    
+    upload = await asyncio.get_running_loop().run_in_executor(
+        storage_io_executor,
+        backend.sign_upload, key, file_ext, resource_type, request.content_type, request.size, expires_at
+    )
+    return {
+        'ticket': ticket,
+        'upload': upload,
+        'expires_at': datetime.fromtimestamp(expires_at, timezone.utc).isoformat()
+    }
+
+@api_router.post("/direct-uploads/local", status_code=204)
+async def receive_local_direct_upload(
+    key: str = Form(...),
+    ext: str = Form(...),
+    max_size: int = Form(...),
+    expires: int = Form(...),
+    signature: str = Form(...),
+    file: UploadFile = File(...)
+):
+    """Upload target signed by the local backend (development and tests)"""
+    backend = storage_backends['local']
+    if not backend.verify_upload_signature(key, ext, max_size, expires, signature):
+        raise HTTPException(status_code=403, detail="Signature invalide ou expirée")
+    if upload_size(file) > max_size:
+        raise upload_too_large_error(max_size)
+    
+    resource_type = "raw" if ext in ['pdf', 'doc', 'docx'] else "image"
+    await asyncio.get_running_loop().run_in_executor(
+        storage_io_executor,
+        backend.put, UnclosableReader(file.file, file.filename), key, ext, resource_type, None
+    )
+
+@api_router.post("/direct-uploads/commit")
+async def commit_direct_upload(commit: DirectUploadCommit, claims: dict = Depends(provider_claims)):
+    """Attach a file uploaded with a ticket to its entity; a ticket can be committed once"""
+    ticket = decode_token(commit.ticket, 'upload')
+    if ticket['user_id'] != claims['user_id']:
+        raise HTTPException(status_code=403, detail="Non autorisé")
+    
+    backend = storage_backends.get(ticket['backend'])
+    if backend is None:
+        raise HTTPException(status_code=400, detail="Stockage inconnu")
+    stored = await asyncio.get_running_loop().run_in_executor(
+        storage_io_executor, backend.head, ticket['ref'], ticket['resource_type']
+    )
+    if stored is None:
+        raise HTTPException(status_code=400, detail="Fichier non trouvé dans le stockage")
+    # Claimed atomically: concurrent commits of one ticket (on any worker) attach the file once
+    if not await token_deny_list.revoke_token(ticket):
+        raise HTTPException(status_code=401, detail="Token revoked")
+    if stored['size'] > ticket['max_size'] or stored['size'] > MAX_UPLOAD_SIZE_BYTES:
+        await storage_deletions.enqueue([stored['url']], reason="direct upload too large")
+        raise upload_too_large_error()
+    
+    await load_upload_target(ticket['entity'], ticket['entity_id'], claims['user_id'])
+    
+    target = DIRECT_UPLOAD_TARGETS[ticket['entity']]
+    collection = db[target['collection']]
+    file_url = stored['url']
+    now = datetime.now(timezone.utc).isoformat()
+    
+    if ticket['entity'] == 'provider_document':
+        new_doc = {
+            "path": file_url,
+            "filename": ticket['filename'],
+            "uploaded_at": now
+        }
+        # The limit is part of the update, so concurrent commits can't exceed it
+        result = await collection.update_one(
+            {'id': ticket['entity_id'], 'documents.9': {'$exists': False}},
+            {'$push': {'documents': new_doc}}
+        )
+        if result.matched_count == 0:
+            await storage_deletions.enqueue([file_url], reason="provider document limit")
+            raise HTTPException(status_code=400, detail="Vous ne pouvez pas télécharger plus de 10 documents")
+        principal_cache.invalidate(ticket['entity_id'])
+        return {"message": "Document ajouté avec succès", "document": new_doc}
+    
+    if ticket['kind'] == 'photo':
+        update = {'$push': {'photos': file_url}}
+    elif ticket['doc_type'] in ['documents_additionnels', 'autres_documents']:
+        update = {'$push': {'documents_additionnels': file_url}}
+    else:
+        update = {'$set': {ticket['doc_type']: file_url}}
+    if ticket['entity'] != 'vehicle':
+        update.setdefault('$set', {})['updated_at'] = now
+    await collection.update_one({'id': ticket['entity_id']}, update)
+    await collection_versions.bump(target['collection'])
+    
+    if ticket['kind'] == 'photo':
+        return {"photo_url": file_url, "message": "Photo uploadée avec succès"}
+    return {"document_url": file_url, "document_type": ticket['doc_type'], "message": "Document uploadé avec succès"}
+
 # Job Offer Routes
 @api_router.post("/jobs", response_model=JobOffer)
 async def create_job_offer(job_data: JobOfferCreate):
@@ -2495,8 +4348,8 @@ async def create_job_offer(job_data: JobOfferCreate):
     return JobOffer(**job_response)
 
 @api_router.get("/jobs/my-jobs", response_model=List[JobOffer])
-async def get_my_jobs(current_user: dict = Depends(get_current_user)):
-    jobs = await db.job_offers.find({'service_provider_id': current_user['id']}, {'_id': 0}).to_list(100)
+async def get_my_jobs(claims: dict = Depends(provider_claims)):
+    jobs = await db.job_offers.find({'service_provider_id': claims['user_id']}, {'_id': 0}).to_list(100)
     return [JobOffer(**job) for job in jobs]
 
 @api_router.put("/jobs/{job_id}")
@@ -2559,28 +4412,39 @@ async def create_rental_listing(listing_data: RentalListingCreate, current_user:
         'updated_at': now
     }
     
-    await db.rental_listings.insert_one(listing_doc)
+    await db.rental_listings.insert_one({**listing_doc, **search_fields('rental_listings', listing_doc)})
+    await collection_versions.bump('rental_listings')
     
     listing_response = {k: v for k, v in listing_doc.items() if k != '_id'}
     return RentalListing(**listing_response)
 
-@api_router.get("/rentals", response_model=List[RentalListing])
-async def get_all_rentals(rental_type: Optional[str] = None, is_available: Optional[bool] = None):
-    """Get all APPROVED rentals with optional filters (public endpoint)"""
+@api_router.get("/rentals", response_model=List[RentalListing], dependencies=[conditional_get('rental_listings')])
+async def get_all_rentals(
+    response: Response,
+    rental_type: Optional[str] = None,
+    is_available: Optional[bool] = None,
+    fields: Optional[str] = None,
+    limit: int = page_limit(),
+    cursor: Optional[str] = None
+):
+    """Get all APPROVED rentals with optional filters (public endpoint), newest first, paged by cursor"""
     query = {'approval_status': ListingApprovalStatus.APPROVED.value}  # Only show approved listings
     if rental_type:
         query['rental_type'] = rental_type
     if is_available is not None:
         query['is_available'] = is_available
     
-    rentals = await db.rental_listings.find(query, {'_id': 0}).to_list(100)
-    return [RentalListing(**r) for r in rentals]
+    projection = fieldset_projection('rental_listings', fields)
+    rentals = await fetch_page(db.rental_listings, query, projection or {'_id': 0, 'search': 0}, limit, cursor, response)
+    if projection:
+        return fieldset_response(rentals, response)
+    return model_list_response(RENTAL_LIST, rentals, response)
 
 @api_router.get("/rentals/my-listings", response_model=List[RentalListing])
 async def get_my_rental_listings(current_user: dict = Depends(get_current_user)):
     """Get all rental listings for the current provider (including pending/rejected)"""
-    rentals = await db.rental_listings.find({'service_provider_id': current_user['id']}, {'_id': 0}).to_list(100)
-    return [RentalListing(**r) for r in rentals]
+    rentals = await db.rental_listings.find({'service_provider_id': current_user['id']}, {'_id': 0, 'search': 0}).to_list(100)
+    return model_list_response(RENTAL_LIST, rentals)
 
 @api_router.put("/rentals/{rental_id}/availability")
 async def update_rental_availability(rental_id: str, is_available: bool, current_user: dict = Depends(get_current_user)):
@@ -2596,6 +4460,7 @@ async def update_rental_availability(rental_id: str, is_available: bool, current
         {'id': rental_id},
         {'$set': {'is_available': is_available, 'updated_at': datetime.now(timezone.utc).isoformat()}}
     )
+    await collection_versions.bump('rental_listings')
     
     return {'is_available': is_available}
 
@@ -2628,14 +4493,16 @@ async def update_rental_listing(rental_id: str, listing_data: RentalListingCreat
         'updated_at': datetime.now(timezone.utc).isoformat()
     }
     
+    update_doc.update(search_fields('rental_listings', {**rental, **update_doc}))
     await db.rental_listings.update_one({'id': rental_id}, {'$set': update_doc})
+    await collection_versions.bump('rental_listings')
     
-    updated_rental = await db.rental_listings.find_one({'id': rental_id}, {'_id': 0})
+    updated_rental = await db.rental_listings.find_one({'id': rental_id}, {'_id': 0, 'search': 0})
     return RentalListing(**updated_rental)
 
 @api_router.get("/rentals/{rental_id}", response_model=RentalListing)
 async def get_rental_by_id(rental_id: str):
-    rental = await db.rental_listings.find_one({'id': rental_id}, {'_id': 0})
+    rental = await db.rental_listings.find_one({'id': rental_id}, {'_id': 0, 'search': 0})
     if not rental:
         raise HTTPException(status_code=404, detail="Rental listing not found")
     return RentalListing(**rental)
@@ -2654,8 +4521,8 @@ async def upload_rental_photo(rental_id: str, file: UploadFile = File(...), curr
     if not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="File must be an image")
     
-    # Upload to Cloudinary
-    result = await upload_to_cloudinary(file, folder="servispro/rentals")
+    # Upload to storage
+    result = await store_upload(file, folder="servispro/rentals")
     
     if not result["success"]:
         raise HTTPException(status_code=500, detail=f"Upload failed: {result.get('error')}")
@@ -2669,9 +4536,39 @@ async def upload_rental_photo(rental_id: str, file: UploadFile = File(...), curr
             '$set': {'updated_at': datetime.now(timezone.utc).isoformat()}
         }
     )
+    await collection_versions.bump('rental_listings')
     
     return {'photo_url': photo_url}
 
+@api_router.post("/rentals/{rental_id}/upload-photos")
+async def upload_rental_photos(rental_id: str, files: List[UploadFile] = File(...), current_user: dict = Depends(get_current_user)):
+    """Upload several photos for a rental listing at once"""
+    rental = await db.rental_listings.find_one({'id': rental_id}, {'_id': 0, 'service_provider_id': 1})
+    if not rental:
+        raise HTTPException(status_code=404, detail="Rental listing not found")
+    
+    if rental['service_provider_id'] != current_user['id']:
+        raise HTTPException(status_code=403, detail="Not authorized to update this listing")
+    
+    if any(not (file.content_type or '').startswith('image/') for file in files):
+        raise HTTPException(status_code=400, detail="File must be an image")
+    
+    results = await store_uploads(files, folder="servispro/rentals")
+    photo_urls = [result["url"] for result in results if result["success"]]
+    if not photo_urls:
+        raise HTTPException(status_code=500, detail=f"Upload failed: {results[0].get('error') if results else 'no file'}")
+    
+    await db.rental_listings.update_one(
+        {'id': rental_id},
+        {
+            '$push': {'photos': {'$each': photo_urls}},
+            '$set': {'updated_at': datetime.now(timezone.utc).isoformat()}
+        }
+    )
+    await collection_versions.bump('rental_listings')
+    
+    return {'photo_urls': photo_urls, 'failed_count': len(results) - len(photo_urls)}
+
 @api_router.delete("/rentals/{rental_id}")
 async def delete_rental_listing(rental_id: str, current_user: dict = Depends(get_current_user)):
     # Find rental and verify ownership
@@ -2683,6 +4580,7 @@ async def delete_rental_listing(rental_id: str, current_user: dict = Depends(get
         raise HTTPException(status_code=403, detail="Not authorized to delete this listing")
     
     await db.rental_listings.delete_one({'id': rental_id})
+    await collection_versions.bump('rental_listings')
     return {'message': 'Rental listing deleted successfully'}
 
 # Document Upload Routes for Rentals
@@ -2705,8 +4603,8 @@ async def upload_rental_document(
     if doc_type not in valid_doc_types:
         raise HTTPException(status_code=400, detail=f"Type de document invalide. Types valides: {valid_doc_types}")
     
-    # Upload to Cloudinary
-    result = await upload_to_cloudinary(file, folder="servispro/rental_documents")
+    # Upload to storage
+    result = await store_upload(file, folder="servispro/rental_documents")
     
     if not result["success"]:
         raise HTTPException(status_code=500, detail=f"Upload failed: {result.get('error')}")
@@ -2732,6 +4630,7 @@ async def upload_rental_document(
                 }
             }
         )
+    await collection_versions.bump('rental_listings')
     
     return {'document_url': doc_url, 'document_type': doc_type, 'message': 'Document uploadé avec succès'}
 
@@ -2741,7 +4640,7 @@ async def upload_rental_document(
 async def create_visit_request(request_data: VisitRequestCreate):
     """Create a visit request for a rental property"""
     # Verify rental exists
-    rental = await db.rental_listings.find_one({'id': request_data.rental_id}, {'_id': 0})
+    rental = await db.rental_listings.find_one({'id': request_data.rental_id}, {'_id': 0, 'search': 0})
     if not rental:
         raise HTTPException(status_code=404, detail="Location non trouvée")
     
@@ -2765,6 +4664,7 @@ async def create_visit_request(request_data: VisitRequestCreate):
         'owner_type': owner_type,
         'customer_name': request_data.customer_name,
         'customer_phone': request_data.customer_phone,
+        'customer_phone_canonical': canonical_phone(request_data.customer_phone),
         'customer_email': request_data.customer_email,
         'preferred_date': request_data.preferred_date,
         'preferred_time': request_data.preferred_time,
@@ -2817,7 +4717,7 @@ async def get_my_visit_requests(current_user: dict = Depends(get_current_user)):
 async def get_customer_visit_requests(customer_phone: str):
     """Get visit requests for a customer by phone number"""
     requests = await db.visit_requests.find(
-        {'customer_phone': customer_phone},
+        {'$or': customer_phone_clauses(customer_phone)},
         {'_id': 0}
     ).sort('created_at', -1).to_list(50)
     
@@ -2866,7 +4766,7 @@ async def update_visit_request(visit_id: str, update_data: VisitRequestUpdate, c
         provider_name = f"{current_user.get('first_name', '')} {current_user.get('last_name', '')}".strip()
         
         # Find customer by phone to create notification
-        customer = await db.customers.find_one({'phone_number': request.get('customer_phone')}, {'_id': 0})
+        customer = await find_by_phone(db.customers, request.get('customer_phone'), {'_id': 0})
         
         notification_message = (
             f"🎉 Bonne nouvelle ! Votre demande de visite pour '{request.get('rental_title', 'la propriété')}' "
@@ -2890,12 +4790,12 @@ async def update_visit_request(visit_id: str, update_data: VisitRequestUpdate, c
             'is_read': False,
             'created_at': now
         }
-        await db.customer_notifications.insert_one(notification_doc)
+        await insert_customer_notification(notification_doc)
     
     elif update_data.status.value == 'rejected':
         # Check if payment was made - if so, credit the customer
         if request.get('payment_status') == 'paid':
-            customer = await db.customers.find_one({'phone_number': request.get('customer_phone')}, {'_id': 0})
+            customer = await find_by_phone(db.customers, request.get('customer_phone'), {'_id': 0})
             if customer:
                 credit_amount = request.get('frais_visite', 0) or 0
                 if credit_amount > 0:
@@ -2908,6 +4808,7 @@ async def update_visit_request(visit_id: str, update_data: VisitRequestUpdate, c
                         {'id': customer['id']},
                         {'$set': {'balance': new_balance}}
                     )
+                    principal_cache.invalidate(customer['id'])
                     
                     # Create credit transaction record
                     credit_transaction = {
@@ -2937,7 +4838,7 @@ async def update_visit_request(visit_id: str, update_data: VisitRequestUpdate, c
                         'is_read': False,
                         'created_at': now
                     }
-                    await db.customer_notifications.insert_one(notification_doc)
+                    await insert_customer_notification(notification_doc)
                 else:
                     # Standard rejection notification (no credit to add)
                     notification_doc = {
@@ -2951,7 +4852,7 @@ async def update_visit_request(visit_id: str, update_data: VisitRequestUpdate, c
                         'is_read': False,
                         'created_at': now
                     }
-                    await db.customer_notifications.insert_one(notification_doc)
+                    await insert_customer_notification(notification_doc)
             else:
                 # No customer found - standard notification
                 notification_doc = {
@@ -2965,7 +4866,7 @@ async def update_visit_request(visit_id: str, update_data: VisitRequestUpdate, c
                     'is_read': False,
                     'created_at': now
                 }
-                await db.customer_notifications.insert_one(notification_doc)
+                await insert_customer_notification(notification_doc)
         else:
             # No payment was made - standard rejection notification
             notification_doc = {
@@ -2979,7 +4880,7 @@ async def update_visit_request(visit_id: str, update_data: VisitRequestUpdate, c
                 'is_read': False,
                 'created_at': now
             }
-            await db.customer_notifications.insert_one(notification_doc)
+            await insert_customer_notification(notification_doc)
     
     status_messages = {
         'accepted': f"Demande acceptée ! Le client a reçu votre numéro de téléphone.",
@@ -3059,7 +4960,7 @@ async def update_visit_payment_status(visit_id: str, payment_data: VisitPaymentU
 async def get_rental_visit_requests(rental_id: str, current_user: dict = Depends(get_current_user)):
     """Get all visit requests for a specific rental"""
     # Verify user owns this rental
-    rental = await db.rental_listings.find_one({'id': rental_id}, {'_id': 0})
+    rental = await db.rental_listings.find_one({'id': rental_id}, {'_id': 0, 'search': 0})
     if not rental:
         raise HTTPException(status_code=404, detail="Location non trouvée")
     
@@ -3148,16 +5049,18 @@ async def get_my_vehicle_sales(current_user: dict = Depends(get_current_user)):
     return sales
 
 @api_router.get("/vehicle-sales")
-async def get_approved_vehicle_sales(vehicle_type: str = None, limit: int = 20):
-    """Get all approved vehicle sales (public)"""
+async def get_approved_vehicle_sales(
+    response: Response,
+    vehicle_type: str = None,
+    limit: int = page_limit(20),
+    cursor: Optional[str] = None
+):
+    """Get all approved vehicle sales (public), newest first, paged by cursor"""
     query = {'status': VehicleSaleStatus.APPROVED.value}
     if vehicle_type:
         query['vehicle_type'] = vehicle_type
     
-    sales = await db.vehicle_sales.find(
-        query,
-        {'_id': 0}
-    ).sort('created_at', -1).to_list(limit)
+    sales = await fetch_page(db.vehicle_sales, query, {'_id': 0}, limit, cursor, response)
     
     return sales
 
@@ -3356,21 +5259,22 @@ async def admin_update_vehicle_inquiry(inquiry_id: str, status: str, admin_notes
 # ==================== ADMIN PROPERTY SALES ROUTES ====================
 
 @api_router.get("/admin/property-sales")
-async def admin_get_all_property_sales(status: str = None):
+async def admin_get_all_property_sales(status: str = None, fields: Optional[str] = None):
     """Admin: Get all property sales for management"""
     query = {}
     if status:
         query['status'] = status
     
-    sales = await db.property_sales.find(query, {'_id': 0}).sort('created_at', -1).to_list(100)
-    return sales
+    projection = fieldset_projection('property_sales', fields, ADMIN_VIEWS) or {'_id': 0, 'search': 0}
+    sales = await db.property_sales.find(query, projection).sort('created_at', -1).to_list(100)
+    return documents_response(sales)
 
 @api_router.get("/admin/property-sales/pending")
 async def admin_get_pending_property_sales():
     """Admin: Get all pending property sales"""
     sales = await db.property_sales.find(
         {'status': 'pending'},
-        {'_id': 0}
+        {'_id': 0, 'search': 0}
     ).sort('created_at', -1).to_list(100)
     return sales
 
@@ -3392,6 +5296,7 @@ async def admin_approve_property_sale(sale_id: str):
             'updated_at': now
         }}
     )
+    await collection_versions.bump('property_sales')
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Vente non trouvée")
@@ -3429,6 +5334,7 @@ async def admin_reject_property_sale(sale_id: str, reason: Optional[str] = None)
             'updated_at': now
         }}
     )
+    await collection_versions.bump('property_sales')
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Vente non trouvée")
@@ -3475,6 +5381,7 @@ async def admin_delete_property_sale(sale_id: str):
     
     # Delete the sale
     await db.property_sales.delete_one({'id': sale_id})
+    await collection_versions.bump('property_sales')
     
     return {'message': 'Vente immobilière supprimée', 'sale_id': sale_id}
 
@@ -3490,6 +5397,7 @@ async def admin_mark_property_sold(sale_id: str):
             'updated_at': datetime.now(timezone.utc).isoformat()
         }}
     )
+    await collection_versions.bump('property_sales')
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Vente non trouvée")
@@ -3516,9 +5424,7 @@ async def admin_upload_property_document(sale_id: str, document: UploadFile = Fi
     
     os.makedirs("/app/uploads/property_sales", exist_ok=True)
     
-    content = await document.read()
-    with open(file_path, "wb") as f:
-        f.write(content)
+    await save_upload_to_path(document, Path(file_path))
     
     # Add to admin_documents array
     document_url = f"/uploads/property_sales/{filename}"
@@ -3529,6 +5435,7 @@ async def admin_upload_property_document(sale_id: str, document: UploadFile = Fi
             '$set': {'updated_at': datetime.now(timezone.utc).isoformat()}
         }
     )
+    await collection_versions.bump('property_sales')
     
     return {'message': 'Document téléchargé', 'document_path': document_url}
 
@@ -3548,6 +5455,7 @@ async def admin_delete_property_document(sale_id: str, document_path: str = Body
             '$set': {'updated_at': datetime.now(timezone.utc).isoformat()}
         }
     )
+    await collection_versions.bump('property_sales')
     
     # Delete file from disk
     full_path = f"/app{document_path}"
@@ -3561,7 +5469,7 @@ async def admin_delete_property_document(sale_id: str, document_path: str = Body
 @api_router.post("/property-sales/{sale_id}/inquiries")
 async def create_property_inquiry(sale_id: str, inquiry: PropertySaleInquiry, current_customer: dict = Depends(get_current_customer)):
     """Create an inquiry for a property sale (requires customer login)"""
-    sale = await db.property_sales.find_one({'id': sale_id}, {'_id': 0})
+    sale = await db.property_sales.find_one({'id': sale_id}, {'_id': 0, 'search': 0})
     if not sale:
         raise HTTPException(status_code=404, detail="Propriété non trouvée")
     
@@ -3712,7 +5620,7 @@ async def admin_send_inquiry_message(inquiry_id: str, message_data: InquiryMessa
                 'property_info': inquiry.get('property_info')
             }
         }
-        await db.customer_notifications.insert_one(customer_notification)
+        await insert_customer_notification(customer_notification)
     
     return {'message': 'Message envoyé', 'id': new_message['id']}
 
@@ -3781,7 +5689,7 @@ async def admin_update_property_inquiry(inquiry_id: str, update_data: AdminPrope
                 'admin_response': update_data.admin_response
             }
         }
-        await db.customer_notifications.insert_one(customer_notification)
+        await insert_customer_notification(customer_notification)
     
     return {'message': 'Demande mise à jour', 'inquiry_id': inquiry_id}
 
@@ -3805,9 +5713,7 @@ async def admin_upload_inquiry_document(inquiry_id: str, document: UploadFile =
     
     os.makedirs("/app/uploads/property_inquiries", exist_ok=True)
     
-    content = await document.read()
-    with open(file_path, "wb") as f:
-        f.write(content)
+    await save_upload_to_path(document, Path(file_path))
     
     # Add to admin_documents array
     document_url = f"/uploads/property_inquiries/{filename}"
@@ -3891,25 +5797,30 @@ async def create_property_sale(sale_data: PropertySaleCreate, current_user: dict
         'updated_at': now
     }
     
-    await db.property_sales.insert_one(sale_doc)
+    await db.property_sales.insert_one({**sale_doc, **search_fields('property_sales', sale_doc)})
+    await collection_versions.bump('property_sales')
     return {k: v for k, v in sale_doc.items() if k != '_id'}
 
-@api_router.get("/property-sales")
+@api_router.get("/property-sales", dependencies=[conditional_get('property_sales')])
 async def get_all_property_sales(
+    response: Response,
     property_type: Optional[str] = None,
     location: Optional[str] = None,
     min_price: Optional[int] = None,
     max_price: Optional[int] = None,
     available_only: bool = True,
-    approved_only: bool = True
+    approved_only: bool = True,
+    fields: Optional[str] = None,
+    limit: int = page_limit(),
+    cursor: Optional[str] = None
 ):
-    """Get all property sales with optional filters - only approved ones for public"""
+    """Get all property sales with optional filters - only approved ones for public, newest first, paged by cursor"""
     query = {}
     
     if property_type:
         query['property_type'] = property_type
     if location:
-        query['location'] = {'$regex': location, '$options': 'i'}
+        query.update(location_filter(location))
     if available_only:
         query['is_available'] = True
     if approved_only:
@@ -3922,7 +5833,8 @@ async def get_all_property_sales(
         else:
             query['sale_price'] = {'$lte': max_price}
     
-    sales = await db.property_sales.find(query, {'_id': 0}).sort('created_at', -1).to_list(100)
+    projection = fieldset_projection('property_sales', fields) or {'_id': 0, 'search': 0}
+    sales = await fetch_page(db.property_sales, query, projection, limit, cursor, response)
     return sales
 
 @api_router.get("/property-sales/my-listings")
@@ -3930,14 +5842,14 @@ async def get_my_property_sales(current_user: dict = Depends(get_current_user)):
     """Get all property sales for the current agent"""
     sales = await db.property_sales.find(
         {'agent_id': current_user['id']},
-        {'_id': 0}
+        {'_id': 0, 'search': 0}
     ).sort('created_at', -1).to_list(100)
     return sales
 
 @api_router.get("/property-sales/{sale_id}")
 async def get_property_sale_by_id(sale_id: str):
     """Get a specific property sale by ID"""
-    sale = await db.property_sales.find_one({'id': sale_id}, {'_id': 0})
+    sale = await db.property_sales.find_one({'id': sale_id}, {'_id': 0, 'search': 0})
     if not sale:
         raise HTTPException(status_code=404, detail="Propriété non trouvée")
     return sale
@@ -3945,7 +5857,7 @@ async def get_property_sale_by_id(sale_id: str):
 @api_router.put("/property-sales/{sale_id}")
 async def update_property_sale(sale_id: str, sale_data: PropertySaleCreate, current_user: dict = Depends(get_current_user)):
     """Update a property sale listing"""
-    sale = await db.property_sales.find_one({'id': sale_id}, {'_id': 0})
+    sale = await db.property_sales.find_one({'id': sale_id}, {'_id': 0, 'search': 0})
     if not sale:
         raise HTTPException(status_code=404, detail="Propriété non trouvée")
     
@@ -3954,16 +5866,18 @@ async def update_property_sale(sale_id: str, sale_data: PropertySaleCreate, curr
     
     update_data = sale_data.model_dump(exclude_unset=True)
     update_data['updated_at'] = datetime.now(timezone.utc).isoformat()
+    update_data.update(search_fields('property_sales', {**sale, **update_data}))
     
     await db.property_sales.update_one({'id': sale_id}, {'$set': update_data})
+    await collection_versions.bump('property_sales')
     
-    updated = await db.property_sales.find_one({'id': sale_id}, {'_id': 0})
+    updated = await db.property_sales.find_one({'id': sale_id}, {'_id': 0, 'search': 0})
     return updated
 
 @api_router.delete("/property-sales/{sale_id}")
 async def delete_property_sale(sale_id: str, current_user: dict = Depends(get_current_user)):
     """Delete a property sale listing"""
-    sale = await db.property_sales.find_one({'id': sale_id}, {'_id': 0})
+    sale = await db.property_sales.find_one({'id': sale_id}, {'_id': 0, 'search': 0})
     if not sale:
         raise HTTPException(status_code=404, detail="Propriété non trouvée")
     
@@ -3971,12 +5885,13 @@ async def delete_property_sale(sale_id: str, current_user: dict = Depends(get_cu
         raise HTTPException(status_code=403, detail="Non autorisé")
     
     await db.property_sales.delete_one({'id': sale_id})
+    await collection_versions.bump('property_sales')
     return {"message": "Propriété supprimée avec succès"}
 
 @api_router.put("/property-sales/{sale_id}/availability")
 async def toggle_property_sale_availability(sale_id: str, current_user: dict = Depends(get_current_user)):
     """Toggle property sale availability status"""
-    sale = await db.property_sales.find_one({'id': sale_id}, {'_id': 0})
+    sale = await db.property_sales.find_one({'id': sale_id}, {'_id': 0, 'search': 0})
     if not sale:
         raise HTTPException(status_code=404, detail="Propriété non trouvée")
     
@@ -3988,21 +5903,22 @@ async def toggle_property_sale_availability(sale_id: str, current_user: dict = D
         {'id': sale_id},
         {'$set': {'is_available': new_status, 'updated_at': datetime.now(timezone.utc).isoformat()}}
     )
+    await collection_versions.bump('property_sales')
     
     return {"is_available": new_status}
 
 @api_router.post("/property-sales/{sale_id}/upload-photo")
 async def upload_property_sale_photo(sale_id: str, file: UploadFile = File(...), current_user: dict = Depends(get_current_user)):
     """Upload a photo for a property sale"""
-    sale = await db.property_sales.find_one({'id': sale_id}, {'_id': 0})
+    sale = await db.property_sales.find_one({'id': sale_id}, {'_id': 0, 'search': 0})
     if not sale:
         raise HTTPException(status_code=404, detail="Propriété non trouvée")
     
     if sale['agent_id'] != current_user['id']:
         raise HTTPException(status_code=403, detail="Non autorisé")
     
-    # Upload to Cloudinary
-    result = await upload_to_cloudinary(file, folder="servispro/property_sales")
+    # Upload to storage
+    result = await store_upload(file, folder="servispro/property_sales")
     
     if not result["success"]:
         raise HTTPException(status_code=500, detail=f"Upload failed: {result.get('error')}")
@@ -4015,6 +5931,7 @@ async def upload_property_sale_photo(sale_id: str, file: UploadFile = File(...),
             '$set': {'updated_at': datetime.now(timezone.utc).isoformat()}
         }
     )
+    await collection_versions.bump('property_sales')
     
     return {"photo_url": photo_url, "message": "Photo uploadée avec succès"}
 
@@ -4037,8 +5954,8 @@ async def upload_property_sale_document(
     if doc_type not in valid_doc_types:
         raise HTTPException(status_code=400, detail=f"Type de document invalide. Types valides: {valid_doc_types}")
     
-    # Upload to Cloudinary
-    result = await upload_to_cloudinary(file, folder="servispro/sale_documents")
+    # Upload to storage
+    result = await store_upload(file, folder="servispro/sale_documents")
     
     if not result["success"]:
         raise HTTPException(status_code=500, detail=f"Upload failed: {result.get('error')}")
@@ -4063,6 +5980,7 @@ async def upload_property_sale_document(
                 }
             }
         )
+    await collection_versions.bump('property_sales')
     
     doc_labels = {
         'titre_foncier': 'Titre Foncier',
@@ -4107,8 +6025,7 @@ async def create_review(review_data: ReviewCreate):
     existing_review = await db.reviews.find_one({
         'job_id': review_data.job_id,
         'customer_id': review_data.customer_id
-    })
-    
+    }, {'_id': 1})
     if existing_review:
         raise HTTPException(
             status_code=400,
@@ -4128,7 +6045,17 @@ async def create_review(review_data: ReviewCreate):
         'created_at': datetime.now(timezone.utc).isoformat()
     }
     
-    await db.reviews.insert_one(review_doc)
+    try:
+        # The unique (job_id, customer_id) index settles concurrent submissions;
+        # the check above covers databases where it isn't built yet
+        await db.reviews.insert_one(review_doc)
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=400,
+            detail="Vous avez déjà laissé un avis pour ce travail"
+        )
+    await add_review_rating(db, review_data.service_provider_id, review_data.rating)
+    await refresh_provider_ranks(db, [review_data.service_provider_id])
     
     review_response = {k: v for k, v in review_doc.items() if k != '_id'}
     return Review(**review_response)
@@ -4232,42 +6159,18 @@ async def delete_feedback(feedback_id: str):
 @api_router.get("/reviews/{provider_id}", response_model=List[Review])
 async def get_provider_reviews(provider_id: str):
     reviews = await db.reviews.find({'service_provider_id': provider_id}, {'_id': 0}).sort('created_at', -1).to_list(100)
-    return [Review(**r) for r in reviews]
+    return model_list_response(REVIEW_LIST, reviews)
 
 @api_router.get("/reviews/{provider_id}/stats")
 async def get_provider_rating_stats(provider_id: str):
-    reviews = await db.reviews.find({'service_provider_id': provider_id}, {'_id': 0, 'rating': 1}).to_list(1000)
-    
-    if not reviews:
-        return {
-            'total_reviews': 0,
-            'average_rating': 0,
-            'rating_distribution': {
-                '5': 0,
-                '4': 0,
-                '3': 0,
-                '2': 0,
-                '1': 0
-            }
-        }
-    
-    total = len(reviews)
-    ratings = [r['rating'] for r in reviews]
-    average = sum(ratings) / total
-    
-    distribution = {
-        '5': ratings.count(5),
-        '4': ratings.count(4),
-        '3': ratings.count(3),
-        '2': ratings.count(2),
-        '1': ratings.count(1)
-    }
-    
-    return {
-        'total_reviews': total,
-        'average_rating': round(average, 1),
-        'rating_distribution': distribution
-    }
+    """Rating stats from the provider's rating_summary, maintained on review creation"""
+    provider = await db.service_providers.find_one({'id': provider_id}, {'_id': 0, 'rating_summary': 1})
+    if provider is None:
+        return rating_stats(None)
+    summary = provider.get('rating_summary')
+    if summary is None:
+        summary = await summarize_provider(db, provider_id)
+    return rating_stats(summary)
 
 # ==================== VEHICLE LISTING ROUTES ====================
 
@@ -4307,24 +6210,28 @@ async def create_vehicle_listing(vehicle_data: VehicleListingCreate, current_use
         'created_at': datetime.now(timezone.utc).isoformat()
     }
     
-    await db.vehicle_listings.insert_one(vehicle_doc)
+    await db.vehicle_listings.insert_one({**vehicle_doc, **search_fields('vehicle_listings', vehicle_doc)})
     return {k: v for k, v in vehicle_doc.items() if k != '_id'}
 
 @api_router.get("/vehicles", response_model=List[VehicleListing])
 async def get_all_vehicles(
+    response: Response,
     vehicle_type: Optional[str] = None,
     location: Optional[str] = None,
     min_price: Optional[int] = None,
     max_price: Optional[int] = None,
-    available_only: bool = True
+    available_only: bool = True,
+    fields: Optional[str] = None,
+    limit: int = page_limit(),
+    cursor: Optional[str] = None
 ):
-    """Get all vehicle listings with optional filters"""
+    """Get all vehicle listings with optional filters, newest first, paged by cursor"""
     query = {}
     
     if vehicle_type:
         query['vehicle_type'] = vehicle_type
     if location:
-        query['location'] = {'$regex': location, '$options': 'i'}
+        query.update(location_filter(location))
     if available_only:
         query['is_available'] = True
     if min_price:
@@ -4335,7 +6242,10 @@ async def get_all_vehicles(
         else:
             query['price_per_day'] = {'$lte': max_price}
     
-    vehicles = await db.vehicle_listings.find(query, {'_id': 0}).sort('created_at', -1).to_list(100)
+    projection = fieldset_projection('vehicle_listings', fields)
+    vehicles = await fetch_page(db.vehicle_listings, query, projection or {'_id': 0, 'search': 0}, limit, cursor, response)
+    if projection:
+        return fieldset_response(vehicles, response)
     return vehicles
 
 @api_router.get("/vehicles/my-listings", response_model=List[VehicleListing])
@@ -4343,14 +6253,14 @@ async def get_my_vehicle_listings(current_user: dict = Depends(get_current_user)
     """Get all vehicle listings for the current user"""
     vehicles = await db.vehicle_listings.find(
         {'owner_id': current_user['id']},
-        {'_id': 0}
+        {'_id': 0, 'search': 0}
     ).sort('created_at', -1).to_list(100)
     return vehicles
 
 @api_router.get("/vehicles/{vehicle_id}", response_model=VehicleListing)
 async def get_vehicle_by_id(vehicle_id: str):
     """Get a specific vehicle listing by ID"""
-    vehicle = await db.vehicle_listings.find_one({'id': vehicle_id}, {'_id': 0})
+    vehicle = await db.vehicle_listings.find_one({'id': vehicle_id}, {'_id': 0, 'search': 0})
     if not vehicle:
         raise HTTPException(status_code=404, detail="Véhicule non trouvé")
     return vehicle
@@ -4358,7 +6268,7 @@ async def get_vehicle_by_id(vehicle_id: str):
 @api_router.put("/vehicles/{vehicle_id}")
 async def update_vehicle_listing(vehicle_id: str, vehicle_data: VehicleListingCreate, current_user: dict = Depends(get_current_user)):
     """Update a vehicle listing"""
-    vehicle = await db.vehicle_listings.find_one({'id': vehicle_id}, {'_id': 0})
+    vehicle = await db.vehicle_listings.find_one({'id': vehicle_id}, {'_id': 0, 'search': 0})
     if not vehicle:
         raise HTTPException(status_code=404, detail="Véhicule non trouvé")
     
@@ -4366,18 +6276,19 @@ async def update_vehicle_listing(vehicle_id: str, vehicle_data: VehicleListingCr
         raise HTTPException(status_code=403, detail="Non autorisé")
     
     update_data = vehicle_data.model_dump(exclude_unset=True)
+    update_data.update(search_fields('vehicle_listings', {**vehicle, **update_data}))
     await db.vehicle_listings.update_one(
         {'id': vehicle_id},
         {'$set': update_data}
     )
     
-    updated = await db.vehicle_listings.find_one({'id': vehicle_id}, {'_id': 0})
+    updated = await db.vehicle_listings.find_one({'id': vehicle_id}, {'_id': 0, 'search': 0})
     return updated
 
 @api_router.delete("/vehicles/{vehicle_id}")
 async def delete_vehicle_listing(vehicle_id: str, current_user: dict = Depends(get_current_user)):
     """Delete a vehicle listing"""
-    vehicle = await db.vehicle_listings.find_one({'id': vehicle_id}, {'_id': 0})
+    vehicle = await db.vehicle_listings.find_one({'id': vehicle_id}, {'_id': 0, 'search': 0})
     if not vehicle:
         raise HTTPException(status_code=404, detail="Véhicule non trouvé")
     
@@ -4390,7 +6301,7 @@ async def delete_vehicle_listing(vehicle_id: str, current_user: dict = Depends(g
 @api_router.put("/vehicles/{vehicle_id}/availability")
 async def toggle_vehicle_availability(vehicle_id: str, current_user: dict = Depends(get_current_user)):
     """Toggle vehicle availability status"""
-    vehicle = await db.vehicle_listings.find_one({'id': vehicle_id}, {'_id': 0})
+    vehicle = await db.vehicle_listings.find_one({'id': vehicle_id}, {'_id': 0, 'search': 0})
     if not vehicle:
         raise HTTPException(status_code=404, detail="Véhicule non trouvé")
     
@@ -4408,15 +6319,15 @@ async def toggle_vehicle_availability(vehicle_id: str, current_user: dict = Depe
 @api_router.post("/vehicles/{vehicle_id}/upload-photo")
 async def upload_vehicle_photo(vehicle_id: str, file: UploadFile = File(...), current_user: dict = Depends(get_current_user)):
     """Upload a photo for a vehicle listing"""
-    vehicle = await db.vehicle_listings.find_one({'id': vehicle_id}, {'_id': 0})
+    vehicle = await db.vehicle_listings.find_one({'id': vehicle_id}, {'_id': 0, 'search': 0})
     if not vehicle:
         raise HTTPException(status_code=404, detail="Véhicule non trouvé")
     
     if vehicle['owner_id'] != current_user['id']:
         raise HTTPException(status_code=403, detail="Non autorisé")
     
-    # Upload to Cloudinary
-    result = await upload_to_cloudinary(file, folder="servispro/vehicles")
+    # Upload to storage
+    result = await store_upload(file, folder="servispro/vehicles")
     
     if not result["success"]:
         raise HTTPException(status_code=500, detail=f"Upload failed: {result.get('error')}")
@@ -4433,7 +6344,7 @@ async def upload_vehicle_photo(vehicle_id: str, file: UploadFile = File(...), cu
 @api_router.delete("/vehicles/{vehicle_id}/photo")
 async def delete_vehicle_photo(vehicle_id: str, photo_url: str, current_user: dict = Depends(get_current_user)):
     """Delete a photo from a vehicle listing"""
-    vehicle = await db.vehicle_listings.find_one({'id': vehicle_id}, {'_id': 0})
+    vehicle = await db.vehicle_listings.find_one({'id': vehicle_id}, {'_id': 0, 'search': 0})
     if not vehicle:
         raise HTTPException(status_code=404, detail="Véhicule non trouvé")
     
@@ -4451,7 +6362,7 @@ async def delete_vehicle_photo(vehicle_id: str, photo_url: str, current_user: di
 @api_router.post("/vehicles/{vehicle_id}/book")
 async def create_vehicle_booking(vehicle_id: str, booking_data: VehicleBookingCreate):
     """Create a booking request for a vehicle"""
-    vehicle = await db.vehicle_listings.find_one({'id': vehicle_id}, {'_id': 0})
+    vehicle = await db.vehicle_listings.find_one({'id': vehicle_id}, {'_id': 0, 'search': 0})
     if not vehicle:
         raise HTTPException(status_code=404, detail="Véhicule non trouvé")
     
@@ -4535,7 +6446,7 @@ async def update_vehicle_booking_status(booking_id: str, status: str, current_us
 async def send_chat_message(rental_id: str, message_data: ChatMessageCreate):
     """Send a chat message for a rental listing"""
     # Verify rental exists
-    rental = await db.rental_listings.find_one({'id': rental_id}, {'_id': 0})
+    rental = await db.rental_listings.find_one({'id': rental_id}, {'_id': 0, 'search': 0})
     if not rental:
         raise HTTPException(status_code=404, detail="Annonce non trouvée")
     
@@ -4561,7 +6472,7 @@ async def send_chat_message(rental_id: str, message_data: ChatMessageCreate):
 @api_router.post("/chat/rental/{rental_id}/message/customer")
 async def send_customer_message(rental_id: str, message_data: ChatMessageCreate):
     """Customer sends a message to rental owner"""
-    rental = await db.rental_listings.find_one({'id': rental_id}, {'_id': 0})
+    rental = await db.rental_listings.find_one({'id': rental_id}, {'_id': 0, 'search': 0})
     if not rental:
         raise HTTPException(status_code=404, detail="Annonce non trouvée")
     
@@ -4591,7 +6502,7 @@ async def send_customer_message(rental_id: str, message_data: ChatMessageCreate)
 @api_router.post("/chat/rental/{rental_id}/message/owner")
 async def send_owner_message(rental_id: str, message_data: ChatMessageCreate, current_user: dict = Depends(get_current_user)):
     """Owner sends a message to customer"""
-    rental = await db.rental_listings.find_one({'id': rental_id}, {'_id': 0})
+    rental = await db.rental_listings.find_one({'id': rental_id}, {'_id': 0, 'search': 0})
     if not rental:
         raise HTTPException(status_code=404, detail="Annonce non trouvée")
     
@@ -4654,11 +6565,11 @@ async def get_all_chat_messages_admin():
     return messages
 
 @api_router.get("/chat/my-conversations")
-async def get_my_conversations(current_user: dict = Depends(get_current_user)):
+async def get_my_conversations(claims: dict = Depends(provider_claims)):
     """Get all rental conversations for the logged-in owner"""
     # Get all rentals owned by user
     rentals = await db.rental_listings.find(
-        {'service_provider_id': current_user['id']},
+        {'service_provider_id': claims['user_id']},
         {'_id': 0, 'id': 1, 'title': 1}
     ).to_list(100)
     
@@ -4701,7 +6612,7 @@ async def admin_register(input_data: AdminRegisterInput):
         raise HTTPException(status_code=400, detail="Ce nom d'utilisateur existe déjà")
     
     # Hash password and create admin
-    hashed_pwd = bcrypt.hashpw(input_data.password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    hashed_pwd = await hash_password(input_data.password)
     admin_id = str(uuid.uuid4())
     
     admin_doc = {
@@ -4714,9 +6625,10 @@ async def admin_register(input_data: AdminRegisterInput):
     
     await db.admins.insert_one(admin_doc)
     
-    token = create_token(admin_id)
+    token, refresh_token = issue_token_pair('admin', admin_doc)
     return {
         "token": token, 
+        "refresh_token": refresh_token,
         "user": {
             "id": admin_id, 
             "username": input_data.username,
@@ -4730,7 +6642,7 @@ async def admin_login(input_data: AdminLoginInput, request: Request):
     client_ip = get_client_ip(request)
     
     # Check if IP is blocked
-    if is_ip_blocked(client_ip):
+    if await is_ip_blocked(client_ip):
         await log_audit_event(
             event_type="ADMIN_LOGIN_BLOCKED",
             ip_address=client_ip,
@@ -4746,8 +6658,8 @@ async def admin_login(input_data: AdminLoginInput, request: Request):
     # Check predefined admin accounts
     for admin_account in ADMIN_ACCOUNTS:
         if input_data.username == admin_account["username"] and input_data.password == admin_account["password"]:
-            clear_failed_attempts(client_ip)
-            token = create_token(admin_account["username"])
+            await clear_failed_attempts(client_ip)
+            token, refresh_token = issue_token_pair('admin', {'id': admin_account["username"], 'role': admin_account["role"]})
             await log_audit_event(
                 event_type="ADMIN_LOGIN_SUCCESS",
                 user_id=admin_account["username"],
@@ -4758,6 +6670,7 @@ async def admin_login(input_data: AdminLoginInput, request: Request):
             )
             return {
                 "token": token, 
+                "refresh_token": refresh_token,
                 "user": {
                     "id": admin_account["username"], 
                     "username": admin_account["username"],
@@ -4767,9 +6680,10 @@ async def admin_login(input_data: AdminLoginInput, request: Request):
     
     # Check database admins as fallback
     admin = await db.admins.find_one({'username': input_data.username}, {'_id': 0})
-    if admin and bcrypt.checkpw(input_data.password.encode('utf-8'), admin['password'].encode('utf-8')):
-        clear_failed_attempts(client_ip)
-        token = create_token(admin['id'])
+    if admin and await verify_password(input_data.password, admin['password']):
+        await clear_failed_attempts(client_ip)
+        await rehash_password_if_needed(db.admins, admin['id'], input_data.password, admin['password'])
+        token, refresh_token = issue_token_pair('admin', admin)
         await log_audit_event(
             event_type="ADMIN_LOGIN_SUCCESS",
             user_id=admin['id'],
@@ -4780,6 +6694,7 @@ async def admin_login(input_data: AdminLoginInput, request: Request):
         )
         return {
             "token": token, 
+            "refresh_token": refresh_token,
             "user": {
                 "id": admin['id'], 
                 "username": admin['username'],
@@ -4788,7 +6703,7 @@ async def admin_login(input_data: AdminLoginInput, request: Request):
         }
     
     # Record failed attempt
-    was_blocked = record_failed_attempt(client_ip)
+    was_blocked = await record_failed_attempt(client_ip)
     await log_audit_event(
         event_type="ADMIN_LOGIN_FAILED",
         ip_address=client_ip,
@@ -4810,9 +6725,13 @@ async def get_audit_logs(
     user_type: Optional[str] = None
 ):
     """Get audit logs for admin review"""
+    totals = await audit_counters.totals()
+    
     query = {}
     if event_type:
-        query["event_type"] = {"$regex": event_type, "$options": "i"}
+        # Resolve the substring filter against known event types so the query uses the index
+        needle = event_type.lower()
+        query["event_type"] = {"$in": [t for t in totals if needle in t.lower()]}
     if success is not None:
         query["success"] = success
     if user_type:
@@ -4820,10 +6739,10 @@ async def get_audit_logs(
     
     logs = await db.audit_logs.find(query, {'_id': 0}).sort('timestamp', -1).limit(limit).to_list(limit)
     
-    # Get summary stats
-    total_logs = await db.audit_logs.count_documents({})
-    failed_logins = await db.audit_logs.count_documents({"success": False, "event_type": {"$regex": "LOGIN", "$options": "i"}})
-    blocked_ips = await db.audit_logs.count_documents({"event_type": {"$regex": "BLOCKED", "$options": "i"}})
+    # Summary stats from the counters rollup
+    total_logs = sum(c['count'] for c in totals.values())
+    failed_logins = sum(c['failures'] for t, c in totals.items() if 'LOGIN' in t.upper())
+    blocked_ips = sum(c['count'] for t, c in totals.items() if 'BLOCKED' in t.upper())
     
     return {
         "logs": logs,
@@ -4839,34 +6758,15 @@ async def get_security_status():
     """Get current security status including blocked IPs"""
     now = datetime.now(timezone.utc)
     
-    # Get currently blocked IPs
-    active_blocks = [
-        {"ip": ip, "blocked_until": block_time.isoformat()}
-        for ip, block_time in blocked_ips.items()
-        if block_time > now
-    ]
-    
-    # Get recent failed attempts
-    recent_attempts = []
-    for ip, attempts in login_attempts.items():
-        if attempts:
-            recent_attempts.append({
-                "ip": ip,
-                "attempt_count": len(attempts),
-                "last_attempt": max(attempts).isoformat() if attempts else None
-            })
+    # Get currently blocked IPs and recent failed attempts
+    limiter_state = await rate_limiter.snapshot()
+    active_blocks = limiter_state["blocked"]
+    recent_attempts = limiter_state["pending"]
     
     # Get stats from last 24 hours
-    yesterday = now - timedelta(hours=24)
-    recent_failures = await db.audit_logs.count_documents({
-        "success": False,
-        "timestamp": {"$gte": yesterday}
-    })
-    recent_successes = await db.audit_logs.count_documents({
-        "success": True,
-        "event_type": {"$regex": "LOGIN_SUCCESS", "$options": "i"},
-        "timestamp": {"$gte": yesterday}
-    })
+    last_24h = await audit_counters.window(now - timedelta(hours=24))
+    recent_failures = sum(c['failures'] for c in last_24h.values())
+    recent_successes = sum(c['count'] - c['failures'] for t, c in last_24h.items() if 'LOGIN_SUCCESS' in t.upper())
     
     return {
         "blocked_ips": active_blocks,
@@ -4875,18 +6775,13 @@ async def get_security_status():
             "failed_attempts": recent_failures,
             "successful_logins": recent_successes
         },
-        "rate_limit_config": {
-            "window_seconds": RATE_LIMIT_WINDOW,
-            "max_attempts": RATE_LIMIT_MAX_ATTEMPTS,
-            "block_duration_seconds": RATE_LIMIT_BLOCK_DURATION
-        }
+        "rate_limit_config": rate_limiter.config()
     }
 
 @api_router.delete("/admin/unblock-ip/{ip_address}")
 async def unblock_ip(ip_address: str):
     """Manually unblock an IP address"""
-    if ip_address in blocked_ips:
-        del blocked_ips[ip_address]
+    if await rate_limiter.unblock(ip_address):
         await log_audit_event(
             event_type="IP_UNBLOCKED",
             details={"unblocked_ip": ip_address},
@@ -4895,6 +6790,35 @@ async def unblock_ip(ip_address: str):
         return {"message": f"IP {ip_address} débloquée avec succès"}
     return {"message": f"IP {ip_address} n'était pas bloquée"}
 
+@api_router.get("/admin/runtime-metrics")
+async def get_runtime_metrics():
+    """Get in-process performance metrics for sizing worker pools and caches"""
+    return {
+        "password_hashing": password_hasher.metrics(),
+        "principal_cache": principal_cache.metrics(),
+        "token_deny_list": token_deny_list.metrics(),
+        "collection_versions": collection_versions.metrics(),
+        "audit_sink": audit_sink.metrics(),
+        "storage": content_store.metrics(),
+        "storage_deletions": storage_deletions.metrics()
+    }
+
+@api_router.get("/admin/storage-deletions")
+async def get_storage_deletions(job_id: Optional[str] = None):
+    """Pending and failed background file deletions, or the items of one deletion job"""
+    if job_id:
+        items = await storage_deletions.job(job_id)
+        if not items:
+            raise HTTPException(status_code=404, detail="Tâche de suppression non trouvée")
+        return {"job_id": job_id, "items": items}
+    return await storage_deletions.summary()
+
+@api_router.post("/admin/storage-deletions/retry-failed")
+async def retry_failed_storage_deletions():
+    """Re-queue deletions that exhausted their retries"""
+    requeued = await storage_deletions.retry_failed()
+    return {"message": f"{requeued} suppression(s) remise(s) en file d'attente", "requeued": requeued}
+
 @api_router.get("/admin/visit-fees-stats")
 async def get_visit_fees_stats():
     """Get statistics for visit fees paid (frais de visite) for locations and services"""
@@ -5101,10 +7025,11 @@ async def get_demand_stats():
     }
 
 @api_router.get("/admin/providers")
-async def get_all_providers_admin():
+async def get_all_providers_admin(fields: Optional[str] = None):
     """Get all providers with their verification status for admin review"""
-    providers = await db.service_providers.find({}, {'_id': 0, 'password': 0}).sort('created_at', -1).to_list(1000)
-    return providers
+    projection = fieldset_projection('service_providers', fields, ADMIN_VIEWS) or {'_id': 0, 'password': 0}
+    providers = await db.service_providers.find({}, projection).sort('created_at', -1).to_list(1000)
+    return documents_response(providers)
 
 @api_router.put("/admin/providers/{provider_id}/approve")
 async def approve_provider(provider_id: str):
@@ -5113,22 +7038,19 @@ async def approve_provider(provider_id: str):
         {'id': provider_id},
         {'$set': {'verification_status': ProviderStatus.APPROVED.value}}
     )
+    principal_cache.invalidate(provider_id)
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Prestataire non trouvé")
     return {"message": "Prestataire approuvé avec succès"}
 
 @api_router.put("/admin/providers/{provider_id}/reject")
 async def reject_provider(provider_id: str):
-    """Reject a service provider and delete their Cloudinary files"""
+    """Reject a service provider and queue deletion of their stored files"""
     # Get provider to access their files
     provider = await db.service_providers.find_one({'id': provider_id})
     if not provider:
         raise HTTPException(status_code=404, detail="Prestataire non trouvé")
     
-    # Delete Cloudinary files to free up storage
-    cloudinary_result = await delete_provider_cloudinary_files(provider)
-    logging.info(f"Cloudinary cleanup on reject: {cloudinary_result}")
-    
     # Update status to rejected and clear file references
     result = await db.service_providers.update_one(
         {'id': provider_id},
@@ -5141,12 +7063,17 @@ async def reject_provider(provider_id: str):
             }
         }
     )
+    principal_cache.invalidate(provider_id)
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Prestataire non trouvé")
     
+    # Files are deleted in the background to free up storage
+    deletion = await storage_deletions.enqueue(provider_file_urls(provider), reason=f"provider {provider_id} rejected")
+    
     return {
-        "message": "Prestataire rejeté et fichiers supprimés",
-        "cloudinary_files_deleted": cloudinary_result.get('deleted', 0)
+        "message": "Prestataire rejeté (suppression des fichiers en cours)",
+        "storage_deletion_job_id": deletion['job_id'],
+        "storage_files_queued": deletion['queued']
     }
 
 class UpdateProviderAboutInput(BaseModel):
@@ -5178,6 +7105,7 @@ async def update_provider_about(provider_id: str, input_data: UpdateProviderAbou
         {'id': provider_id},
         {'$set': {'about_me': input_data.about_me.strip()}}
     )
+    principal_cache.invalidate(provider_id)
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Prestataire non trouvé")
     
@@ -5198,22 +7126,23 @@ async def get_all_jobs_admin():
             job['provider_name'] = f"{provider.get('first_name', '')} {provider.get('last_name', '')}"
             job['provider_phone'] = provider.get('phone_number', '')
     
-    return jobs
+    return documents_response(jobs)
 
 @api_router.get("/admin/rentals")
-async def get_all_rentals_admin():
+async def get_all_rentals_admin(fields: Optional[str] = None):
     """Get all rental listings for admin dashboard"""
-    rentals = await db.rental_listings.find({}, {'_id': 0}).sort('created_at', -1).to_list(1000)
-    return rentals
+    projection = fieldset_projection('rental_listings', fields, ADMIN_VIEWS) or {'_id': 0, 'search': 0}
+    rentals = await db.rental_listings.find({}, projection).sort('created_at', -1).to_list(1000)
+    return documents_response(rentals)
 
 @api_router.get("/admin/rentals/pending")
 async def get_pending_rentals_admin():
     """Get all pending rental listings for admin approval"""
     rentals = await db.rental_listings.find(
         {'approval_status': ListingApprovalStatus.PENDING.value}, 
-        {'_id': 0}
+        {'_id': 0, 'search': 0}
     ).sort('created_at', -1).to_list(1000)
-    return rentals
+    return documents_response(rentals)
 
 @api_router.put("/admin/rentals/{rental_id}/approve")
 async def approve_rental_admin(rental_id: str):
@@ -5236,6 +7165,7 @@ async def approve_rental_admin(rental_id: str):
             }
         }
     )
+    await collection_versions.bump('rental_listings')
     
     # Create notification for the provider
     notification_id = str(uuid.uuid4())
@@ -5274,6 +7204,7 @@ async def reject_rental_admin(rental_id: str, reason: Optional[str] = None):
             }
         }
     )
+    await collection_versions.bump('rental_listings')
     
     # Create notification for the provider
     notification_id = str(uuid.uuid4())
@@ -5302,7 +7233,7 @@ async def get_all_agents_immobilier():
         rental_count = await db.rental_listings.count_documents({'service_provider_id': agent['id']})
         agent['rental_count'] = rental_count
     
-    return agents
+    return documents_response(agents)
 
 @api_router.delete("/admin/rentals/{rental_id}")
 async def delete_rental_admin(rental_id: str):
@@ -5331,6 +7262,7 @@ async def delete_rental_admin(rental_id: str):
     await db.chat_messages.delete_many({'rental_id': rental_id})
     
     result = await db.rental_listings.delete_one({'id': rental_id})
+    await collection_versions.bump('rental_listings')
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Location non trouvée")
     
@@ -5340,7 +7272,7 @@ async def delete_rental_admin(rental_id: str):
 async def get_all_customers_admin():
     """Get all customers for admin dashboard"""
     customers = await db.customers.find({}, {'_id': 0, 'password': 0}).sort('created_at', -1).to_list(1000)
-    return customers
+    return documents_response(customers)
 
 @api_router.delete("/admin/providers/{provider_id}")
 async def delete_provider(provider_id: str):
@@ -5350,25 +7282,28 @@ async def delete_provider(provider_id: str):
     if not provider:
         raise HTTPException(status_code=404, detail="Prestataire non trouvé")
     
-    # Delete Cloudinary files (profile picture, ID verification, documents)
-    cloudinary_result = await delete_provider_cloudinary_files(provider)
-    logging.info(f"Cloudinary cleanup result: {cloudinary_result}")
-    
     # Delete associated data
     await db.job_offers.delete_many({'service_provider_id': provider_id})
     await db.rental_listings.delete_many({'service_provider_id': provider_id})
+    await collection_versions.bump('rental_listings')
     await db.reviews.delete_many({'service_provider_id': provider_id})
     await db.chat_messages.delete_many({'sender_id': provider_id})
     await db.notifications.delete_many({'user_id': provider_id})
     
     # Delete the provider
     result = await db.service_providers.delete_one({'id': provider_id})
+    principal_cache.invalidate(provider_id)
+    await token_deny_list.revoke_subject(provider_id)
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Prestataire non trouvé")
     
+    # Stored files (profile picture, ID verification, documents) are deleted in the background
+    deletion = await storage_deletions.enqueue(provider_file_urls(provider), reason=f"provider {provider_id} deleted")
+    
     return {
-        "message": "Prestataire et données associées supprimés avec succès",
-        "cloudinary_files_deleted": cloudinary_result.get('deleted', 0)
+        "message": "Prestataire et données associées supprimés (suppression des fichiers en cours)",
+        "storage_deletion_job_id": deletion['job_id'],
+        "storage_files_queued": deletion['queued']
     }
 
 @api_router.delete("/admin/customers/{customer_id}")
@@ -5384,6 +7319,8 @@ async def delete_customer(customer_id: str):
     
     # Delete the customer
     result = await db.customers.delete_one({'id': customer_id})
+    principal_cache.invalidate(customer_id)
+    await token_deny_list.revoke_subject(customer_id)
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Client non trouvé")
     
@@ -5393,14 +7330,14 @@ async def delete_customer(customer_id: str):
 @api_router.get("/admin/companies")
 async def admin_get_all_companies():
     """Get all companies for admin"""
-    companies = await db.companies.find({}, {'_id': 0, 'password': 0}).sort('created_at', -1).to_list(1000)
+    companies = await db.companies.find({}, {'_id': 0, 'password': 0, 'search': 0}).sort('created_at', -1).to_list(1000)
     
     # Add stats for each company
     for company in companies:
         company['services_count'] = await db.company_services.count_documents({'company_id': company['id']})
         company['job_offers_count'] = await db.company_job_offers.count_documents({'company_id': company['id']})
     
-    return companies
+    return documents_response(companies)
 
 @api_router.put("/admin/companies/{company_id}/approve")
 async def admin_approve_company(company_id: str):
@@ -5416,19 +7353,17 @@ async def admin_approve_company(company_id: str):
             'updated_at': datetime.now(timezone.utc).isoformat()
         }}
     )
+    await collection_versions.bump('companies')
+    principal_cache.invalidate(company_id)
     return {"message": "Entreprise approuvée avec succès"}
 
 @api_router.put("/admin/companies/{company_id}/reject")
 async def admin_reject_company(company_id: str):
-    """Reject a company and delete their Cloudinary files"""
+    """Reject a company and queue deletion of their stored files"""
     company = await db.companies.find_one({'id': company_id})
     if not company:
         raise HTTPException(status_code=404, detail="Entreprise non trouvée")
     
-    # Delete Cloudinary files
-    cloudinary_result = await delete_company_cloudinary_files(company)
-    logging.info(f"Cloudinary cleanup on company reject: {cloudinary_result}")
-    
     await db.companies.update_one(
         {'id': company_id},
         {'$set': {
@@ -5442,22 +7377,24 @@ async def admin_reject_company(company_id: str):
             'updated_at': datetime.now(timezone.utc).isoformat()
         }}
     )
+    await collection_versions.bump('companies')
+    principal_cache.invalidate(company_id)
+    
+    # Files are deleted in the background
+    deletion = await storage_deletions.enqueue(company_file_urls(company), reason=f"company {company_id} rejected")
     return {
-        "message": "Entreprise rejetée et fichiers supprimés",
-        "cloudinary_files_deleted": cloudinary_result.get('deleted', 0)
+        "message": "Entreprise rejetée (suppression des fichiers en cours)",
+        "storage_deletion_job_id": deletion['job_id'],
+        "storage_files_queued": deletion['queued']
     }
 
 @api_router.delete("/admin/companies/{company_id}")
 async def admin_delete_company(company_id: str):
-    """Delete a company and associated data including Cloudinary files"""
+    """Delete a company and associated data including stored files"""
     company = await db.companies.find_one({'id': company_id})
     if not company:
         raise HTTPException(status_code=404, detail="Entreprise non trouvée")
     
-    # Delete Cloudinary files
-    cloudinary_result = await delete_company_cloudinary_files(company)
-    logging.info(f"Cloudinary cleanup on company delete: {cloudinary_result}")
-    
     # Delete associated services and job offers
     await db.company_services.delete_many({'company_id': company_id})
     await db.company_job_offers.delete_many({'company_id': company_id})
@@ -5466,10 +7403,17 @@ async def admin_delete_company(company_id: str):
     
     # Delete the company
     await db.companies.delete_one({'id': company_id})
+    await collection_versions.bump('companies', 'company_job_offers', 'rental_listings', 'property_sales')
+    principal_cache.invalidate(company_id)
+    await token_deny_list.revoke_subject(company_id)
+    
+    # Stored files are deleted in the background
+    deletion = await storage_deletions.enqueue(company_file_urls(company), reason=f"company {company_id} deleted")
     
     return {
-        "message": "Entreprise et données associées supprimées avec succès",
-        "cloudinary_files_deleted": cloudinary_result.get('deleted', 0)
+        "message": "Entreprise et données associées supprimées (suppression des fichiers en cours)",
+        "storage_deletion_job_id": deletion['job_id'],
+        "storage_files_queued": deletion['queued']
     }
 
 @api_router.get("/admin/stats")
@@ -5552,6 +7496,7 @@ async def customer_confirm_complete(job_id: str, current_user: dict = Depends(ge
         {'id': job_id},
         {'$set': update_data}
     )
+    await refresh_provider_ranks(db, [job['service_provider_id']])
     
     # Get provider info for the rating popup
     provider = await db.service_providers.find_one({'id': job['service_provider_id']}, {'_id': 0, 'password': 0})
@@ -5601,6 +7546,13 @@ async def get_customer_jobs():
 
 # ==================== NOTIFICATIONS SYSTEM ====================
 
+async def insert_customer_notification(notification_doc: dict):
+    """Store a customer notification, with the canonical form of the customer's phone"""
+    await db.customer_notifications.insert_one({
+        **notification_doc,
+        'customer_phone_canonical': canonical_phone(notification_doc.get('customer_phone'))
+    })
+
 @api_router.post("/notifications")
 async def create_notification(notification: NotificationCreate):
     """Create a new notification"""
@@ -5645,10 +7597,7 @@ async def get_customer_notifications(current_customer: dict = Depends(get_curren
     
     # Get notifications from customer_notifications (visit requests)
     notifications_visits = await db.customer_notifications.find(
-        {'$or': [
-            {'customer_id': customer_id},
-            {'customer_phone': customer_phone}
-        ]},
+        {'$or': [{'customer_id': customer_id}] + customer_phone_clauses(customer_phone)},
         {'_id': 0}
     ).sort('created_at', -1).to_list(50)
     
@@ -5659,20 +7608,20 @@ async def get_customer_notifications(current_customer: dict = Depends(get_curren
     return all_notifications[:50]
 
 @api_router.get("/notifications/unread-count/provider")
-async def get_provider_unread_count(current_user: dict = Depends(get_current_user)):
-    """Get count of unread notifications for provider"""
+async def get_provider_unread_count(claims: dict = Depends(provider_claims)):
+    """Get count of unread notifications for provider (authorized from token claims)"""
     count = await db.notifications.count_documents({
-        'user_id': current_user['id'],
+        'user_id': claims['user_id'],
         'user_type': 'provider',
         'is_read': False
     })
     return {'unread_count': count}
 
 @api_router.get("/notifications/unread-count/customer")
-async def get_customer_unread_count(current_customer: dict = Depends(get_current_customer)):
-    """Get count of unread notifications for customer"""
-    customer_id = current_customer.get('id')
-    customer_phone = current_customer.get('phone_number')
+async def get_customer_unread_count(claims: dict = Depends(customer_claims)):
+    """Get count of unread notifications for customer (authorized from token claims)"""
+    customer_id = claims['user_id']
+    customer_phone = claims.get('phone')
     
     # Count from standard notifications
     count_standard = await db.notifications.count_documents({
@@ -5683,10 +7632,7 @@ async def get_customer_unread_count(current_customer: dict = Depends(get_current
     
     # Count from customer_notifications (visit requests)
     count_visits = await db.customer_notifications.count_documents({
-        '$or': [
-            {'customer_id': customer_id},
-            {'customer_phone': customer_phone}
-        ],
+        '$or': [{'customer_id': customer_id}] + customer_phone_clauses(customer_phone),
         'is_read': False
     })
     
@@ -5874,7 +7820,7 @@ class AdminSettingsUpdate(BaseModel):
     devise: Optional[str] = None                       # Devise (GNF, USD, EUR)
 
 # Public endpoint to get commission rates (visible to all users)
-@api_router.get("/commission-rates")
+@api_router.get("/commission-rates", dependencies=[conditional_get('admin_settings')])
 async def get_public_commission_rates():
     """Get public commission rates for all domains"""
     settings = await db.admin_settings.find_one({'type': 'platform_settings'}, {'_id': 0})
@@ -5951,6 +7897,7 @@ async def get_all_service_fees():
         ]
         # Insert defaults
         await db.service_fees.insert_many(default_fees)
+        await collection_versions.bump('service_fees')
         return default_fees
     
     return fees
@@ -5989,6 +7936,7 @@ async def update_service_fees(fees: ServiceFeesUpdate):
         {'$set': update_data},
         upsert=True
     )
+    await collection_versions.bump('service_fees')
     
     # Return updated fees
     updated_fees = await db.service_fees.find_one({'profession': fees.profession}, {'_id': 0})
@@ -6017,11 +7965,12 @@ async def update_bulk_service_fees(fees_list: List[ServiceFeesUpdate]):
         
         updated = await db.service_fees.find_one({'profession': fees.profession}, {'_id': 0})
         results.append(updated)
+    await collection_versions.bump('service_fees')
     
     return results
 
 # Public endpoint to get service fees (for providers and customers)
-@api_router.get("/service-fees")
+@api_router.get("/service-fees", dependencies=[conditional_get('service_fees')])
 async def get_public_service_fees():
     """Get all service fees (public endpoint)"""
     fees = await db.service_fees.find({}, {'_id': 0}).to_list(100)
@@ -6080,6 +8029,7 @@ async def get_admin_settings():
             'updated_at': datetime.now(timezone.utc).isoformat()
         }
         await db.admin_settings.insert_one(default_settings)
+        await collection_versions.bump('admin_settings')
         return {k: v for k, v in default_settings.items() if k != '_id'}
     
     # Migrate old settings format to new format if needed
@@ -6117,6 +8067,7 @@ async def update_admin_settings(settings: AdminSettingsUpdate):
         {'$set': update_data},
         upsert=True
     )
+    await collection_versions.bump('admin_settings')
     
     # Return updated settings
     settings = await db.admin_settings.find_one({'type': 'platform_settings'}, {'_id': 0})
@@ -6152,7 +8103,7 @@ async def get_commission_revenue():
     sales = await db.property_sales.find({
         'status': 'sold',
         'sold_at': {'$gte': thirty_days_ago}
-    }, {'_id': 0}).to_list(1000)
+    }, {'_id': 0, 'search': 0}).to_list(1000)
     
     # Get rentals for location calculations
     rentals = await db.rentals.find({
@@ -6286,6 +8237,7 @@ async def pay_with_credits(payment_data: PayWithCreditsRequest, current_customer
         {'id': current_customer['id']},
         {'$set': {'balance': new_balance}}
     )
+    principal_cache.invalidate(current_customer['id'])
     
     # Determine what this payment is for
     description = "Paiement par créances"
@@ -6463,6 +8415,7 @@ async def process_refund_request(request_id: str, decision: RefundDecision):
                 {'id': refund_request['customer_id']},
                 {'$set': {'balance': new_balance}}
             )
+            principal_cache.invalidate(refund_request['customer_id'])
             
             # Create credit transaction (negative = debit for refund)
             credit_transaction = {
@@ -6491,7 +8444,7 @@ async def process_refund_request(request_id: str, decision: RefundDecision):
                 'is_read': False,
                 'created_at': now
             }
-            await db.customer_notifications.insert_one(notification_doc)
+            await insert_customer_notification(notification_doc)
     else:
         # Rejected - notify customer
         notification_doc = {
@@ -6506,7 +8459,7 @@ async def process_refund_request(request_id: str, decision: RefundDecision):
             'is_read': False,
             'created_at': now
         }
-        await db.customer_notifications.insert_one(notification_doc)
+        await insert_customer_notification(notification_doc)
     
     return {
         'id': request_id,
@@ -6553,6 +8506,7 @@ async def report_provider_no_show(job_id: str, current_customer: dict = Depends(
                 {'id': current_customer['id']},
                 {'$set': {'balance': new_balance}}
             )
+            principal_cache.invalidate(current_customer['id'])
             
             # Create credit transaction record
             credit_transaction = {
@@ -6597,7 +8551,7 @@ async def report_provider_no_show(job_id: str, current_customer: dict = Depends(
                 'is_read': False,
                 'created_at': now
             }
-            await db.customer_notifications.insert_one(notification_doc)
+            await insert_customer_notification(notification_doc)
             
             return {
                 'success': True,
@@ -6635,6 +8589,7 @@ async def admin_adjust_customer_balance(
         {'id': customer_id},
         {'$set': {'balance': new_balance}}
     )
+    principal_cache.invalidate(customer_id)
     
     # Create credit transaction record
     credit_transaction = {
@@ -6664,7 +8619,7 @@ async def admin_adjust_customer_balance(
             'is_read': False,
             'created_at': now
         }
-        await db.customer_notifications.insert_one(notification_doc)
+        await insert_customer_notification(notification_doc)
     
     return {
         'customer_id': customer_id,
@@ -6693,8 +8648,7 @@ async def get_customers_with_balance():
 app.include_router(api_router)
 
 # Serve uploaded files - IMPORTANT: Use /api/uploads to work with Kubernetes ingress
-from fastapi.staticfiles import StaticFiles
-app.mount("/api/uploads", StaticFiles(directory=str(UPLOAD_DIR)), name="uploads")
+app.mount("/api/uploads", UploadedFilesApp(UPLOAD_DIR), name="uploads")
 
 # ============================================
 # SECURITY MIDDLEWARES
@@ -6706,6 +8660,9 @@ app.add_middleware(SecurityHeadersMiddleware)
 # Add Rate Limiting Middleware
 app.add_middleware(RateLimitMiddleware)
 
+# Reject oversized upload bodies before they are parsed
+app.add_middleware(UploadSizeLimitMiddleware)
+
 # CORS Configuration - Restrictive
 ALLOWED_ORIGINS = [
     os.environ.get('FRONTEND_URL', 'https://servispro-bugfix.preview.emergentagent.com'),
@@ -6724,7 +8681,7 @@ app.add_middleware(
     allow_origins=ALLOWED_ORIGINS,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"],
     allow_headers=["Authorization", "Content-Type", "X-Requested-With"],
-    expose_headers=["X-Request-ID"],
+    expose_headers=["X-Request-ID", NEXT_CURSOR_HEADER],
 )
 
 logging.basicConfig(
@@ -6733,6 +8690,72 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+PHONE_BACKFILL_ON_STARTUP = os.environ.get('PHONE_BACKFILL_ON_STARTUP', 'true').lower() == 'true'
+
+async def run_phone_backfill():
+    try:
+        report = await backfill_phone_canonical(db)
+        logger.info(f"phone_canonical backfill: {report}")
+        if report.get('companies', {}).get('updated'):
+            await collection_versions.bump('companies')
+    except Exception as e:
+        logger.error(f"phone_canonical backfill failed: {e}")
+
+SEARCH_BACKFILL_ON_STARTUP = os.environ.get('SEARCH_BACKFILL_ON_STARTUP', 'true').lower() == 'true'
+
+async def run_search_backfill():
+    try:
+        report = await backfill_search_fields(db)
+        logger.info(f"search fields backfill: {report}")
+    except Exception as e:
+        logger.error(f"search fields backfill failed: {e}")
+
+# Ranks new providers and lets the recency term decay; 0 disables the refresh
+PROVIDER_RANK_REFRESH_INTERVAL_SECONDS = float(os.environ.get('PROVIDER_RANK_REFRESH_INTERVAL_SECONDS', '3600'))
+provider_rank_task: Optional[asyncio.Task] = None
+
+async def run_provider_rank_refresh():
+    while True:
+        try:
+            updated = await refresh_stale_ranks(db)
+            if updated:
+                logger.info(f"provider ranks refreshed: {updated}")
+        except Exception as e:
+            logger.error(f"provider rank refresh failed: {e}")
+        await asyncio.sleep(PROVIDER_RANK_REFRESH_INTERVAL_SECONDS)
+
+@app.on_event("startup")
+async def start_background_services():
+    global provider_rank_task
+    await audit_counters.start()
+    audit_sink.start()
+    await ensure_phone_indexes(db)
+    # Idempotent: only indexes missing from the spec are built
+    index_report = await ensure_indexes(db)
+    if index_report['failed']:
+        logger.error(f"Indexes not created: {index_report['failed']}")
+    await rate_limiter.start()
+    await otp_store.start()
+    await content_store.start()
+    await storage_deletions.start()
+    if PHONE_BACKFILL_ON_STARTUP:
+        # Resumable and checkpointed; a no-op once every document is backfilled
+        asyncio.create_task(run_phone_backfill())
+    if SEARCH_BACKFILL_ON_STARTUP:
+        asyncio.create_task(run_search_backfill())
+    if PROVIDER_RANK_REFRESH_INTERVAL_SECONDS > 0:
+        provider_rank_task = asyncio.create_task(run_provider_rank_refresh())
+    await token_deny_list.start()
+    await collection_versions.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    if provider_rank_task:
+        provider_rank_task.cancel()
+    await token_deny_list.stop()
+    await collection_versions.stop()
+    await audit_sink.stop()
+    await storage_deletions.stop()
+    password_hasher.shutdown()
+    storage_io_executor.shutdown(wait=False)
+    client.close()
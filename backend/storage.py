@@ -0,0 +1,890 @@
+"""
+File storage backends shared by the API and maintenance scripts.
+
+Uploads are content-addressed: every stored object is registered in the
+`stored_files` collection under the SHA-256 of its bytes, with the URL it is
+served from and a reference count. Storing bytes that are already registered
+only bumps the count, and the object is deleted when the last reference to
+its URL is released.
+
+Backends:
+- local:      files under UPLOAD_DIR, served from /api/uploads (works offline)
+- cloudinary: Cloudinary assets, chunked uploads with upload_large
+- s3:         any S3-compatible bucket through boto3
+
+Deletes never run inside a request: objects whose last reference is dropped
+are written to the `storage_deletions` outbox and removed by a background
+worker in bulk calls, retried with exponential backoff.
+"""
+
+import os
+import hmac
+import time
+import asyncio
+import hashlib
+import logging
+import mimetypes
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import uuid
+from datetime import datetime, timezone, timedelta
+
+import boto3
+import botocore.config
+import botocore.exceptions
+import cloudinary
+import cloudinary.api
+import cloudinary.uploader
+import cloudinary.exceptions
+import cloudinary.utils
+from pymongo import ReturnDocument, UpdateOne
+
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'cloudinary')
+
+LOCAL_UPLOAD_URL_PREFIX = '/api/uploads/'
+# Target of signed direct uploads for the local backend (the stand-in for a storage service)
+LOCAL_DIRECT_UPLOAD_URL = '/api/direct-uploads/local'
+
+S3_BUCKET = os.environ.get('S3_BUCKET', '')
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL') or None
+S3_REGION = os.environ.get('S3_REGION') or None
+# Public URL prefix for objects (CDN or bucket website); defaults to the endpoint URL
+S3_PUBLIC_BASE_URL = os.environ.get('S3_PUBLIC_BASE_URL', '')
+
+# Deletion outbox worker (storage_deletions collection)
+STORAGE_DELETE_BATCH_SIZE = int(os.environ.get('STORAGE_DELETE_BATCH_SIZE', '100'))
+STORAGE_DELETE_MAX_ATTEMPTS = int(os.environ.get('STORAGE_DELETE_MAX_ATTEMPTS', '8'))
+STORAGE_DELETE_POLL_SECONDS = float(os.environ.get('STORAGE_DELETE_POLL_SECONDS', '10'))
+STORAGE_DELETE_BACKOFF_SECONDS = 30  # First retry delay, doubled per attempt
+STORAGE_DELETE_BACKOFF_MAX_SECONDS = 6 * 3600
+STORAGE_DELETE_LEASE_SECONDS = 300  # Claimed items are retried if a worker dies mid-batch
+STORAGE_DELETE_RETENTION_DAYS = 7  # Completed items are kept this long for job status
+PURGE_WAIT_POLL_SECONDS = 0.2  # An upload of content being deleted waits for the delete
+
+# Document fields holding stored file URLs (strings, lists of strings, or
+# lists of {path: url} dicts); the orphaned-file GC treats anything stored
+# but not referenced from here as garbage, so keep it in sync with server.py
+LISTING_DOCUMENT_FIELDS = [
+    'titre_foncier', 'registration_ministere', 'seller_id_document',
+    'document_ministere_habitat', 'document_batiment', 'documents_additionnels'
+]
+STORAGE_REFERENCE_FIELDS = {
+    'service_providers': ['profile_picture', 'id_verification_picture', 'documents'],
+    'customers': ['profile_picture'],
+    'companies': ['logo', 'licence_exploitation', 'rccm_document', 'nif_document', 'attestation_fiscale', 'documents_additionnels'],
+    'company_job_offers': ['company_logo'],
+    'rental_listings': ['photos', *LISTING_DOCUMENT_FIELDS],
+    'property_sales': ['photos', *LISTING_DOCUMENT_FIELDS, 'admin_documents'],
+    'property_inquiries': ['property_photos', 'admin_documents'],
+    'vehicle_listings': ['photos'],
+    'vehicle_sales': ['photos'],
+}
+
+HASH_CHUNK_SIZE = 1024 * 1024
+# Cloudinary requires chunks of at least 5 MB for chunked uploads
+CLOUDINARY_CHUNK_SIZE = 6 * 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def hash_fileobj(fileobj) -> Tuple[str, int]:
+    """SHA-256 and size of a seekable file, read in chunks; leaves it rewound"""
+    digest = hashlib.sha256()
+    size = 0
+    fileobj.seek(0)
+    try:
+        while True:
+            chunk = fileobj.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+    finally:
+        fileobj.seek(0)
+    return digest.hexdigest(), size
+
+
+class UnclosableReader:
+    """File wrapper for SDK calls that close the stream they are given"""
+
+    def __init__(self, fileobj, name: str):
+        self._fileobj = fileobj
+        self.name = name
+
+    def read(self, size: int = -1):
+        return self._fileobj.read(size)
+
+    def seek(self, offset: int, whence: int = 0):
+        return self._fileobj.seek(offset, whence)
+
+    def tell(self):
+        return self._fileobj.tell()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class StorageBackend(ABC):
+    """
+    Where file bytes live. Methods are blocking and meant to run on a
+    thread pool. An object is identified by a backend-specific `ref`
+    (relative path, Cloudinary public_id, S3 key) returned by put().
+    """
+
+    @property
+    @abstractmethod
+    def name(self) -> str:
+        """Key of the backend in build_storage_backends() and stored_files rows"""
+
+    # Exceptions that will not succeed on retry
+    permanent_errors: tuple = ()
+    # Max refs per delete_many() call
+    delete_batch_size = 100
+
+    @abstractmethod
+    def put(self, fileobj, key: str, ext: str, resource_type: str, timeout: Optional[float] = None) -> Tuple[str, str]:
+        """
+        Store a file under key; returns (url, ref). timeout (seconds) is
+        handed to the SDK's network calls so a stalled transfer fails and
+        frees its thread instead of hanging.
+        """
+
+    @abstractmethod
+    def delete(self, ref: str, resource_type: str) -> bool:
+        """Delete an object; returns True if it is gone (including already missing)"""
+
+    def delete_many(self, refs: List[str], resource_type: str) -> Dict[str, bool]:
+        """Delete up to delete_batch_size objects; returns ref -> gone"""
+        return {ref: self.delete(ref, resource_type) for ref in refs}
+
+    @abstractmethod
+    def locate(self, url: str) -> Optional[Tuple[str, str]]:
+        """(ref, resource_type) for a URL served by this backend, None otherwise"""
+
+    def owns(self, url: Optional[str]) -> bool:
+        return bool(url) and self.locate(url) is not None
+
+    def object_ref(self, key: str, ext: str) -> str:
+        """The ref put() would give an object stored under key"""
+        return f"{key}.{ext}"
+
+    @abstractmethod
+    def sign_upload(self, key: str, ext: str, resource_type: str, content_type: str,
+                    max_size: int, expires_at: int) -> dict:
+        """
+        Credentials for a client to upload one object directly to storage:
+        {url, method, fields}. The file goes in a multipart 'file' field
+        after the returned fields.
+        """
+
+    @abstractmethod
+    def head(self, ref: str, resource_type: str) -> Optional[dict]:
+        """{url, size} of a stored object, None if it does not exist"""
+
+
+class LocalStorageBackend(StorageBackend):
+    """Files on the API's own disk, served by the /api/uploads mount"""
+
+    name = "local"
+
+    def __init__(self, root: Path, url_prefix: str = LOCAL_UPLOAD_URL_PREFIX, signing_secret: str = ''):
+        self.root = Path(root)
+        self.url_prefix = url_prefix
+        self.signing_secret = signing_secret
+
+    def _path(self, ref: str) -> Path:
+        path = (self.root / ref).resolve()
+        if not path.is_relative_to(self.root.resolve()):
+            raise ValueError(f"Path outside upload directory: {ref}")
+        return path
+
+    def put(self, fileobj, key, ext, resource_type, timeout=None):
+        ref = f"{key}.{ext}"
+        destination = self._path(ref)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temp name and rename so readers never see a partial file
+        partial = destination.with_name(destination.name + '.part')
+        fileobj.seek(0)
+        try:
+            with open(partial, 'wb') as out:
+                while True:
+                    chunk = fileobj.read(HASH_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+            os.replace(partial, destination)
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+        finally:
+            fileobj.seek(0)
+        return self.url_prefix + ref, ref
+
+    def delete(self, ref, resource_type):
+        self._path(ref).unlink(missing_ok=True)
+        return True
+
+    def locate(self, url):
+        if not url.startswith(self.url_prefix):
+            return None
+        ref = url[len(self.url_prefix):]
+        resource_type = "raw" if ref.rsplit('.', 1)[-1].lower() in ('pdf', 'doc', 'docx') else "image"
+        return ref, resource_type
+
+    def _upload_signature(self, key: str, ext: str, max_size: int, expires_at: int) -> str:
+        message = f"{key}:{ext}:{max_size}:{expires_at}".encode()
+        return hmac.new(self.signing_secret.encode(), message, hashlib.sha256).hexdigest()
+
+    def sign_upload(self, key, ext, resource_type, content_type, max_size, expires_at):
+        # Stand-in for a storage service: the API itself receives the file
+        return {
+            "url": LOCAL_DIRECT_UPLOAD_URL,
+            "method": "POST",
+            "fields": {
+                "key": key,
+                "ext": ext,
+                "max_size": str(max_size),
+                "expires": str(expires_at),
+                "signature": self._upload_signature(key, ext, max_size, expires_at)
+            }
+        }
+
+    def verify_upload_signature(self, key: str, ext: str, max_size: int, expires_at: int, signature: str) -> bool:
+        if not self.signing_secret or expires_at < time.time():
+            return False
+        return hmac.compare_digest(self._upload_signature(key, ext, max_size, expires_at), signature)
+
+    def head(self, ref, resource_type):
+        try:
+            size = self._path(ref).stat().st_size
+        except FileNotFoundError:
+            return None
+        return {"url": self.url_prefix + ref, "size": size}
+
+
+class CloudinaryStorageBackend(StorageBackend):
+    """Cloudinary assets; the folder is carried by the public_id path"""
+
+    name = "cloudinary"
+    permanent_errors = (
+        cloudinary.exceptions.BadRequest,
+        cloudinary.exceptions.AuthorizationRequired,
+        cloudinary.exceptions.NotAllowed,
+        cloudinary.exceptions.NotFound,
+    )
+
+    def put(self, fileobj, key, ext, resource_type, timeout=None):
+        fileobj.seek(0)
+        try:
+            result = cloudinary.uploader.upload_large(
+                fileobj,
+                public_id=key,
+                resource_type=resource_type,
+                overwrite=True,
+                chunk_size=CLOUDINARY_CHUNK_SIZE,
+                timeout=timeout
+            )
+        finally:
+            fileobj.seek(0)
+        return result.get("secure_url"), result.get("public_id")
+
+    def delete(self, ref, resource_type):
+        result = cloudinary.uploader.destroy(ref, resource_type=resource_type)
+        # 'not found' counts as success: the file is gone either way
+        return result.get('result') in ('ok', 'not found')
+
+    def delete_many(self, refs, resource_type):
+        # Admin API bulk delete, up to 100 public_ids per call
+        result = cloudinary.api.delete_resources(refs, resource_type=resource_type, type='upload')
+        deleted = result.get('deleted', {})
+        return {ref: deleted.get(ref) in ('deleted', 'not_found') for ref in refs}
+
+    def object_ref(self, key, ext):
+        return key
+
+    def sign_upload(self, key, ext, resource_type, content_type, max_size, expires_at):
+        # Signed upload API parameters; Cloudinary accepts a signature for one
+        # hour after its timestamp, the size is checked when the upload is committed
+        params = {"public_id": key, "timestamp": int(time.time()), "overwrite": "false"}
+        config = cloudinary.config()
+        return {
+            "url": cloudinary.utils.cloudinary_api_url("upload", resource_type=resource_type),
+            "method": "POST",
+            "fields": {
+                **{name: str(value) for name, value in params.items()},
+                "signature": cloudinary.utils.api_sign_request(params, config.api_secret),
+                "api_key": config.api_key
+            }
+        }
+
+    def head(self, ref, resource_type):
+        try:
+            resource = cloudinary.api.resource(ref, resource_type=resource_type)
+        except cloudinary.exceptions.NotFound:
+            return None
+        return {"url": resource.get("secure_url"), "size": resource.get("bytes", 0)}
+
+    def locate(self, url):
+        # https://res.cloudinary.com/{cloud_name}/{resource_type}/upload/v{version}/{public_id}.{extension}
+        if not url.startswith('https://res.cloudinary.com'):
+            return None
+        parts = url.split('/upload/')
+        if len(parts) < 2:
+            return None
+        path = parts[1]
+        if path.startswith('v'):
+            path_parts = path.split('/', 1)
+            if len(path_parts) > 1:
+                path = path_parts[1]
+        public_id = path.rsplit('.', 1)[0]
+        resource_type = 'raw' if '/raw/upload/' in url else 'image'
+        return public_id, resource_type
+
+
+class S3StorageBackend(StorageBackend):
+    """Objects in an S3-compatible bucket (AWS, MinIO, R2, Spaces...)"""
+
+    name = "s3"
+    delete_batch_size = 1000
+
+    def __init__(self, bucket: str = S3_BUCKET, endpoint_url: Optional[str] = S3_ENDPOINT_URL,
+                 region: Optional[str] = S3_REGION, public_base_url: str = S3_PUBLIC_BASE_URL):
+        if not bucket:
+            raise ValueError("S3_BUCKET is required for the s3 storage backend")
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self.client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region)
+        # Clients with connect/read timeouts, per timeout value (boto3 has no per-call timeout)
+        self._timed_clients: Dict[float, object] = {}
+        self.permanent_errors = (botocore.exceptions.NoCredentialsError, botocore.exceptions.ParamValidationError)
+        if not public_base_url:
+            public_base_url = f"{endpoint_url}/{bucket}" if endpoint_url else f"https://{bucket}.s3.amazonaws.com"
+        self.public_base_url = public_base_url.rstrip('/') + '/'
+
+    def _client_for(self, timeout: Optional[float]):
+        if timeout is None:
+            return self.client
+        client = self._timed_clients.get(timeout)
+        if client is None:
+            config = botocore.config.Config(connect_timeout=timeout, read_timeout=timeout)
+            client = self._timed_clients[timeout] = boto3.client(
+                's3', endpoint_url=self.endpoint_url, region_name=self.region, config=config
+            )
+        return client
+
+    def put(self, fileobj, key, ext, resource_type, timeout=None):
+        ref = f"{key}.{ext}"
+        content_type = mimetypes.guess_type(ref)[0] or 'application/octet-stream'
+        fileobj.seek(0)
+        try:
+            # upload_fileobj switches to multipart for large files, streaming part by part
+            self._client_for(timeout).upload_fileobj(
+                fileobj, self.bucket, ref,
+                ExtraArgs={'ContentType': content_type, 'CacheControl': 'public, max-age=31536000, immutable'}
+            )
+        finally:
+            fileobj.seek(0)
+        return self.public_base_url + ref, ref
+
+    def delete(self, ref, resource_type):
+        self.client.delete_object(Bucket=self.bucket, Key=ref)
+        return True
+
+    def delete_many(self, refs, resource_type):
+        result = self.client.delete_objects(
+            Bucket=self.bucket,
+            Delete={'Objects': [{'Key': ref} for ref in refs], 'Quiet': True}
+        )
+        errors = {error['Key'] for error in result.get('Errors', [])}
+        return {ref: ref not in errors for ref in refs}
+
+    def sign_upload(self, key, ext, resource_type, content_type, max_size, expires_at):
+        ref = self.object_ref(key, ext)
+        fields = {'Content-Type': content_type, 'Cache-Control': 'public, max-age=31536000, immutable'}
+        post = self.client.generate_presigned_post(
+            self.bucket,
+            ref,
+            Fields=fields,
+            Conditions=[{'Content-Type': content_type}, {'Cache-Control': fields['Cache-Control']},
+                        ['content-length-range', 1, max_size]],
+            ExpiresIn=max(int(expires_at - time.time()), 1)
+        )
+        return {"url": post["url"], "method": "POST", "fields": post["fields"]}
+
+    def head(self, ref, resource_type):
+        try:
+            result = self.client.head_object(Bucket=self.bucket, Key=ref)
+        except botocore.exceptions.ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+        return {"url": self.public_base_url + ref, "size": result['ContentLength']}
+
+    def locate(self, url):
+        if not url.startswith(self.public_base_url):
+            return None
+        ref = url[len(self.public_base_url):]
+        resource_type = "raw" if ref.rsplit('.', 1)[-1].lower() in ('pdf', 'doc', 'docx') else "image"
+        return ref, resource_type
+
+
+def build_storage_backends(upload_dir: Path, default: str = STORAGE_BACKEND, signing_secret: str = '') -> Dict[str, StorageBackend]:
+    """
+    Backends able to serve or delete stored URLs, keyed by name. Local and
+    Cloudinary are always present (existing URLs use both); S3 is added when
+    it is the default or a bucket is configured. signing_secret signs direct
+    uploads to the local backend.
+    """
+    backends: Dict[str, StorageBackend] = {
+        'local': LocalStorageBackend(upload_dir, signing_secret=signing_secret),
+        'cloudinary': CloudinaryStorageBackend(),
+    }
+    if default == 's3' or S3_BUCKET:
+        backends['s3'] = S3StorageBackend()
+    if default not in backends:
+        raise ValueError(f"Unknown STORAGE_BACKEND: {default}")
+    return backends
+
+
+def stored_ext(entry: dict) -> Optional[str]:
+    """Extension of an entry stored before extensions were recorded, from its `key.ext` ref"""
+    ref, key = entry.get('ref') or '', entry['key']
+    return ref[len(key) + 1:] if ref.startswith(key + '.') else None
+
+
+class ContentStore:
+    """
+    Content-addressed, reference-counted file registry over a storage backend.
+
+    `stored_files` documents: _id (sha256), url, backend, ref, key, ext,
+    resource_type, size, refcount, state ('pending' until the bytes are
+    stored, then 'ready'). The key, backend and extension are fixed on first
+    insert so concurrent uploads of the same bytes write the same object,
+    whatever extension their file names carry.
+
+    When the last reference is dropped the entry stays as a tombstone
+    ('deleting') until the deletion worker has removed the object
+    ('purging' while it does). Storing the same bytes again re-uploads them
+    as the same object: over a 'deleting' entry the queued deletion is then
+    skipped, over a 'purging' one the upload waits for the delete to finish.
+    """
+
+    def __init__(self, db, backends: Dict[str, StorageBackend], default: str, executor,
+                 timeout: Optional[float] = None, retries: int = 0, backoff: float = 0.5):
+        self.collection = db.stored_files
+        self.backends = backends
+        self.backend = backends[default]
+        self.executor = executor
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._stats = {"stored": 0, "deduplicated": 0, "released": 0}
+
+    async def start(self):
+        await self.collection.create_index('url', name='url')
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def _put(self, backend: StorageBackend, fileobj, key: str, ext: str, resource_type: str) -> Tuple[str, str]:
+        """
+        Store bytes with the backend, with bounded retries. The timeout is
+        enforced by the backend's SDK rather than around the executor call:
+        cancelling the await would leave the thread uploading, and each retry
+        would take another one. An attempt is only retried once its thread
+        has returned.
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                return await self._run(backend.put, fileobj, key, ext, resource_type, self.timeout)
+            except backend.permanent_errors:
+                raise
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                logger.warning(f"{backend.name} upload attempt {attempt + 1} failed, retrying: {e!r}")
+                await asyncio.sleep(self.backoff * (2 ** attempt))
+
+    async def put(self, fileobj, folder: str, ext: str, resource_type: str) -> dict:
+        """
+        Store a seekable file and take a reference on it. Returns the
+        registry entry plus `deduplicated` (True when no bytes were sent).
+        """
+        sha256, size = await self._run(hash_fileobj, fileobj)
+        before = await self.collection.find_one_and_update(
+            {'_id': sha256},
+            {
+                '$inc': {'refcount': 1},
+                '$setOnInsert': {
+                    'key': f"{folder}/{sha256}",
+                    'backend': self.backend.name,
+                    'ext': ext,
+                    'resource_type': resource_type,
+                    'size': size,
+                    'state': 'pending',
+                    'created_at': datetime.now(timezone.utc).isoformat()
+                }
+            },
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+        if before is not None and before.get('state') == 'ready':
+            self._stats["deduplicated"] += 1
+            return {**before, 'refcount': before.get('refcount', 0) + 1, 'deduplicated': True}
+
+        # First copy, a concurrent upload of the same bytes still in flight or
+        # content being deleted: all write the entry's key with its backend and
+        # extension, so they produce the same object (the one a queued
+        # deletion of a tombstone targets, which is then skipped)
+        entry = before or {'key': f"{folder}/{sha256}", 'backend': self.backend.name, 'ext': ext, 'resource_type': resource_type}
+        backend = self.backends.get(entry['backend'], self.backend)
+        ext = entry.get('ext') or stored_ext(entry) or ext
+        try:
+            if before is not None and before.get('state') == 'purging':
+                await self._wait_for_purge(sha256)
+            url, ref = await self._put(backend, fileobj, entry['key'], ext, entry['resource_type'])
+        except BaseException:
+            await self._drop_reference(sha256)
+            raise
+        await self.collection.update_one(
+            {'_id': sha256},
+            {'$set': {'url': url, 'ref': ref, 'backend': backend.name, 'ext': ext, 'state': 'ready'}}
+        )
+        self._stats["stored"] += 1
+        return {**entry, '_id': sha256, 'url': url, 'ref': ref, 'backend': backend.name, 'ext': ext, 'size': size,
+                'state': 'ready', 'deduplicated': False}
+
+    async def _wait_for_purge(self, sha256: str):
+        """Wait until the deletion worker is done with the object of this content"""
+        deadline = time.monotonic() + STORAGE_DELETE_LEASE_SECONDS
+        while await self.collection.count_documents({'_id': sha256, 'state': 'purging'}, limit=1):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Stored file {sha256} is still being deleted")
+            await asyncio.sleep(PURGE_WAIT_POLL_SECONDS)
+
+    async def _drop_reference(self, sha256: str) -> Optional[dict]:
+        """
+        Decrement a refcount; returns the entry if this removed the last
+        reference to a stored object, which is left as a 'deleting' tombstone
+        """
+        after = await self.collection.find_one_and_update(
+            {'_id': sha256},
+            {'$inc': {'refcount': -1}},
+            return_document=ReturnDocument.AFTER
+        )
+        if after is None or after.get('refcount', 0) > 0:
+            return None
+        if after.get('state') == 'pending':
+            # Never stored
+            await self.collection.delete_one({'_id': sha256, 'refcount': {'$lte': 0}, 'state': 'pending'})
+            return None
+        if after.get('state') != 'ready':
+            # Already queued for deletion
+            return None
+        result = await self.collection.update_one(
+            {'_id': sha256, 'refcount': {'$lte': 0}, 'state': 'ready'},
+            {'$set': {'state': 'deleting'}}
+        )
+        return after if result.modified_count else None
+
+    async def begin_purge(self, sha256: Optional[str], backend: str, ref: str) -> bool:
+        """
+        Claim a queued object for deletion. False when it must be kept: its
+        content was stored again since it was queued (or, for objects queued
+        without a hash, an entry serves the same backend ref).
+        """
+        if sha256 is None:
+            return await self.collection.count_documents({'backend': backend, 'ref': ref}, limit=1) == 0
+        result = await self.collection.update_one(
+            {'_id': sha256, 'backend': backend, 'ref': ref, '$or': [
+                {'state': 'deleting', 'refcount': {'$lte': 0}},
+                # A worker died mid-delete
+                {'state': 'purging'},
+            ]},
+            {'$set': {'state': 'purging'}}
+        )
+        return result.matched_count > 0
+
+    async def end_purge(self, sha256: Optional[str], deleted: bool):
+        """Drop the tombstone of a deleted object, or hand it back after a failed delete"""
+        if sha256 is None:
+            return
+        if deleted:
+            result = await self.collection.delete_one({'_id': sha256, 'state': 'purging', 'refcount': {'$lte': 0}})
+            if result.deleted_count:
+                return
+        # Referenced again meanwhile: the waiting upload stores the bytes again
+        await self.collection.update_one(
+            {'_id': sha256, 'state': 'purging'},
+            [{'$set': {'state': {'$cond': [{'$gt': ['$refcount', 0]}, 'pending', 'deleting']}}}]
+        )
+
+    def locate(self, url: str) -> Optional[Tuple[StorageBackend, str, str]]:
+        """(backend, ref, resource_type) for a URL served by any known backend"""
+        for backend in self.backends.values():
+            location = backend.locate(url)
+            if location is not None:
+                return (backend, *location)
+        return None
+
+    def owns(self, url: Optional[str]) -> bool:
+        """True if url points at a file we store (as opposed to an external link)"""
+        return bool(url) and self.locate(url) is not None
+
+    async def unreference(self, url: str) -> Optional[dict]:
+        """
+        Drop one reference to a stored URL. Returns the object to delete
+        ({backend, ref, resource_type}) once nothing points at it, None while
+        other documents still use the content. URLs uploaded before the
+        registry existed have a single owner and are returned directly.
+        """
+        location = self.locate(url)
+        if location is None:
+            return None
+        self._stats["released"] += 1
+
+        entry = await self.collection.find_one({'url': url}, {'_id': 1, 'state': 1})
+        if entry is None:
+            backend, ref, resource_type = location
+            return {'sha256': None, 'backend': backend.name, 'ref': ref, 'resource_type': resource_type}
+        if entry.get('state') in ('deleting', 'purging'):
+            # Already queued for deletion
+            return None
+        last = await self._drop_reference(entry['_id'])
+        if last is None:
+            return None
+        return {'sha256': last['_id'], 'backend': last.get('backend'), 'ref': last.get('ref'), 'resource_type': last.get('resource_type')}
+
+    def metrics(self) -> dict:
+        return {"backend": self.backend.name, **self._stats}
+
+
+class StorageDeletionQueue:
+    """
+    Durable outbox of storage objects to delete.
+
+    enqueue() drops the references synchronously (cheap registry writes) and
+    records the objects that became unreferenced under a job id. The worker
+    claims due items with a lease, so several API processes can run it, and
+    deletes them grouped by backend and resource type with each backend's
+    bulk call. Failed items are retried with exponential backoff and marked
+    'failed' after max_attempts. Items whose content was stored again since
+    they were queued are skipped: the object is in use again under the same
+    key.
+
+    Item statuses: pending -> processing -> done | pending (retry) | failed
+    """
+
+    def __init__(self, db, content_store: ContentStore, executor,
+                 batch_size: int = STORAGE_DELETE_BATCH_SIZE,
+                 max_attempts: int = STORAGE_DELETE_MAX_ATTEMPTS,
+                 poll_interval: float = STORAGE_DELETE_POLL_SECONDS):
+        self.collection = db.storage_deletions
+        self.content_store = content_store
+        self.executor = executor
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._stats = {"enqueued": 0, "deleted": 0, "skipped": 0, "retried": 0, "failed": 0, "batches": 0}
+
+    async def start(self):
+        await self.collection.create_index([('status', 1), ('next_attempt_at', 1)], name='status_next_attempt')
+        await self.collection.create_index('job_id', name='job_id')
+        await self.collection.create_index('expires_at', expireAfterSeconds=0, name='expires_at_ttl')
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._closing = True
+        self._wake.set()
+        if self._task:
+            try:
+                await asyncio.wait_for(self._task, timeout=10)
+            except asyncio.TimeoutError:
+                self._task.cancel()
+
+    async def enqueue(self, urls: List[str], reason: str = "") -> dict:
+        """Release stored URLs; returns the job id and how many objects were queued for deletion"""
+        job_id = str(uuid.uuid4())
+        now = datetime.now(timezone.utc)
+        items = []
+        for url in dict.fromkeys(url for url in urls if url):
+            target = await self.content_store.unreference(url)
+            if target is None:
+                continue
+            items.append({
+                'id': str(uuid.uuid4()),
+                'job_id': job_id,
+                'url': url,
+                'sha256': target['sha256'],
+                'backend': target['backend'],
+                'ref': target['ref'],
+                'resource_type': target['resource_type'],
+                'reason': reason,
+                'status': 'pending',
+                'attempts': 0,
+                'last_error': None,
+                'next_attempt_at': now,
+                'created_at': now.isoformat()
+            })
+        if not items:
+            return {"job_id": None, "queued": 0}
+        await self.collection.insert_many(items)
+        self._stats["enqueued"] += len(items)
+        self._wake.set()
+        return {"job_id": job_id, "queued": len(items)}
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                processed = await self.process_due()
+            except Exception as e:
+                logger.error(f"Storage deletion worker error: {e!r}")
+                processed = 0
+            if processed:
+                continue
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _claim(self) -> List[dict]:
+        now = datetime.now(timezone.utc)
+        due = {'$or': [
+            {'status': 'pending', 'next_attempt_at': {'$lte': now}},
+            {'status': 'processing', 'lease_until': {'$lte': now}},
+        ]}
+        candidates = await self.collection.find(due, {'_id': 1}).limit(self.batch_size).to_list(self.batch_size)
+        if not candidates:
+            return []
+        claim = str(uuid.uuid4())
+        await self.collection.update_many(
+            {'_id': {'$in': [c['_id'] for c in candidates]}, **due},
+            {'$set': {
+                'status': 'processing',
+                'claim': claim,
+                'lease_until': now + timedelta(seconds=STORAGE_DELETE_LEASE_SECONDS)
+            }}
+        )
+        return await self.collection.find({'claim': claim, 'status': 'processing'}).to_list(self.batch_size)
+
+    async def process_due(self) -> int:
+        """Delete one batch of due items; returns how many were claimed"""
+        items = await self._claim()
+        if not items:
+            return 0
+
+        groups: Dict[Tuple[str, str], List[dict]] = {}
+        skipped = set()
+        for item in items:
+            if not await self.content_store.begin_purge(item.get('sha256'), item['backend'], item['ref']):
+                skipped.add(item['_id'])
+                continue
+            groups.setdefault((item['backend'], item['resource_type']), []).append(item)
+
+        loop = asyncio.get_running_loop()
+        outcomes: Dict = {}  # _id -> error message, None on success
+        for (backend_name, resource_type), group in groups.items():
+            backend = self.content_store.backends.get(backend_name)
+            if backend is None:
+                for item in group:
+                    outcomes[item['_id']] = f"Unknown storage backend {backend_name}"
+                continue
+            size = backend.delete_batch_size
+            for start in range(0, len(group), size):
+                chunk = group[start:start + size]
+                try:
+                    results = await loop.run_in_executor(
+                        self.executor, backend.delete_many, [item['ref'] for item in chunk], resource_type
+                    )
+                    self._stats["batches"] += 1
+                except Exception as e:
+                    logger.warning(f"{backend_name} bulk delete of {len(chunk)} objects failed: {e!r}")
+                    results = {}
+                    error = str(e) or type(e).__name__
+                else:
+                    error = f"{backend_name} did not delete the object"
+                for item in chunk:
+                    outcomes[item['_id']] = None if results.get(item['ref']) else error
+
+        now = datetime.now(timezone.utc)
+        operations = []
+        for item in items:
+            if item['_id'] in skipped:
+                self._stats["skipped"] += 1
+                update = {
+                    '$set': {'status': 'done', 'skipped': True, 'completed_at': now.isoformat(),
+                             'expires_at': now + timedelta(days=STORAGE_DELETE_RETENTION_DAYS)},
+                    '$unset': {'claim': '', 'lease_until': ''}
+                }
+                operations.append(UpdateOne({'_id': item['_id'], 'claim': item['claim']}, update))
+                continue
+            error = outcomes.get(item['_id'])
+            await self.content_store.end_purge(item.get('sha256'), error is None)
+            if error is None:
+                self._stats["deleted"] += 1
+                update = {
+                    '$set': {'status': 'done', 'completed_at': now.isoformat(),
+                             'expires_at': now + timedelta(days=STORAGE_DELETE_RETENTION_DAYS)},
+                    '$unset': {'claim': '', 'lease_until': ''}
+                }
+            else:
+                attempts = item.get('attempts', 0) + 1
+                if attempts >= self.max_attempts:
+                    self._stats["failed"] += 1
+                    status_fields = {'status': 'failed'}
+                else:
+                    self._stats["retried"] += 1
+                    delay = min(STORAGE_DELETE_BACKOFF_SECONDS * (2 ** (attempts - 1)), STORAGE_DELETE_BACKOFF_MAX_SECONDS)
+                    status_fields = {'status': 'pending', 'next_attempt_at': now + timedelta(seconds=delay)}
+                update = {
+                    '$set': {**status_fields, 'attempts': attempts, 'last_error': error},
+                    '$unset': {'claim': '', 'lease_until': ''}
+                }
+            operations.append(UpdateOne({'_id': item['_id'], 'claim': item['claim']}, update))
+        await self.collection.bulk_write(operations, ordered=False)
+        return len(items)
+
+    async def retry_failed(self) -> int:
+        """Put failed items back in the queue with a fresh attempt budget"""
+        result = await self.collection.update_many(
+            {'status': 'failed'},
+            {'$set': {'status': 'pending', 'attempts': 0, 'next_attempt_at': datetime.now(timezone.utc)}}
+        )
+        if result.modified_count:
+            self._wake.set()
+        return result.modified_count
+
+    async def summary(self, failed_limit: int = 50) -> dict:
+        """Item counts per status and the most recent failures"""
+        counts = {'pending': 0, 'processing': 0, 'done': 0, 'failed': 0}
+        async for row in self.collection.aggregate([{'$group': {'_id': '$status', 'count': {'$sum': 1}}}]):
+            counts[row['_id']] = row['count']
+        failed = await self.collection.find(
+            {'status': 'failed'},
+            {'_id': 0, 'claim': 0, 'lease_until': 0, 'expires_at': 0}
+        ).sort('created_at', -1).limit(failed_limit).to_list(failed_limit)
+        for item in failed:
+            item['next_attempt_at'] = item['next_attempt_at'].replace(tzinfo=timezone.utc).isoformat()
+        return {**counts, 'failed_items': failed}
+
+    async def job(self, job_id: str) -> List[dict]:
+        items = await self.collection.find(
+            {'job_id': job_id},
+            {'_id': 0, 'claim': 0, 'lease_until': 0, 'expires_at': 0}
+        ).to_list(1000)
+        for item in items:
+            item['next_attempt_at'] = item['next_attempt_at'].replace(tzinfo=timezone.utc).isoformat()
+        return items
+
+    def metrics(self) -> dict:
+        return dict(self._stats)
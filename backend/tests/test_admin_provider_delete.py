@@ -253,10 +253,10 @@ class TestAdminDeleteProvider:
         assert "message" in result, "Response should have message"
         assert "supprimé" in result["message"].lower(), f"Message should confirm deletion: {result['message']}"
         
-        # Check cloudinary files deleted count
-        cloudinary_deleted = result.get("cloudinary_files_deleted", 0)
+        # Stored files are queued for background deletion
+        files_queued = result.get("storage_files_queued", 0)
         print(f"✓ Provider deleted successfully")
-        print(f"✓ Cloudinary files deleted: {cloudinary_deleted}")
+        print(f"✓ Stored files queued for deletion: {files_queued}")
         
         # Verify provider no longer exists
         providers_response = requests.get(f"{BASE_URL}/api/admin/providers", headers=headers)
@@ -350,14 +350,25 @@ class TestCloudinaryCleanup:
         assert delete_response.status_code == 200, f"Delete failed: {delete_response.text}"
         result = delete_response.json()
         
-        # Verify Cloudinary cleanup was attempted
-        cloudinary_deleted = result.get("cloudinary_files_deleted", 0)
-        print(f"✓ Cloudinary files deleted count: {cloudinary_deleted}")
+        # Verify Cloudinary cleanup was queued
+        files_queued = result.get("storage_files_queued", 0)
+        print(f"✓ Stored files queued for deletion: {files_queued}")
         
-        # The delete should report files deleted (at least the document)
+        # The delete should queue the uploaded document and report the job
         if cloudinary_count > 0:
-            assert cloudinary_deleted >= 0, "Should report Cloudinary deletion count"
-            print(f"✓ Cloudinary cleanup executed: {cloudinary_deleted} file(s) processed")
+            assert files_queued >= 1, "Should queue the Cloudinary document for deletion"
+            job_id = result.get("storage_deletion_job_id")
+            assert job_id, "Should return the deletion job id"
+            
+            job_response = requests.get(
+                f"{BASE_URL}/api/admin/storage-deletions",
+                params={"job_id": job_id},
+                headers=headers
+            )
+            assert job_response.status_code == 200, f"Job lookup failed: {job_response.text}"
+            statuses = [item["status"] for item in job_response.json()["items"]]
+            assert all(s in ("pending", "processing", "done") for s in statuses), f"Unexpected statuses: {statuses}"
+            print(f"✓ Cloudinary cleanup queued: {files_queued} file(s), statuses {statuses}")
 
 
 if __name__ == "__main__":
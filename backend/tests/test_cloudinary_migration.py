@@ -0,0 +1,153 @@
+"""
+Test suite for the local-to-Cloudinary migration's stored_files references
+Features tested:
+1. Every document pointing at a shared upload takes its own reference
+2. A rerun reuses a document's checkpoint without taking another reference
+3. References taken for a document that changed meanwhile are released
+
+Runs against the database of MONGO_URL / DB_NAME (use a test database).
+Uploads go to a local backend in a temporary directory instead of Cloudinary.
+"""
+
+import pytest
+import os
+import sys
+import uuid
+import hashlib
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+MONGO_URL = os.environ.get('MONGO_URL')
+DB_NAME = os.environ.get('DB_NAME')
+
+pytestmark = pytest.mark.skipif(not (MONGO_URL and DB_NAME), reason="MONGO_URL / DB_NAME not set")
+
+FIELDS = {'profile_picture': 'servispro/profiles', 'documents': 'servispro/documents'}
+
+
+def run(coroutine_function, tmp_path):
+    """Run a coroutine with a migrator over a scratch collection, then clean up after it"""
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from concurrent.futures import ThreadPoolExecutor
+    from storage import ContentStore, StorageDeletionQueue, LocalStorageBackend
+    from migrate_to_cloudinary import Migrator
+
+    async def main():
+        client = AsyncIOMotorClient(MONGO_URL)
+        db = client[DB_NAME]
+        name = f"test_migration_{uuid.uuid4().hex[:8]}"
+        executor = ThreadPoolExecutor(max_workers=2)
+        backends = {'local': LocalStorageBackend(tmp_path / 'migrated', url_prefix='/migrated/')}
+        content_store = ContentStore(db, backends, 'local', executor)
+        migrator = Migrator(db, content_store, StorageDeletionQueue(db, content_store, executor),
+                            tmp_path / 'uploads', concurrency=2, dry_run=False)
+        context = {'db': db, 'name': name, 'migrator': migrator, 'hashes': []}
+        try:
+            return await coroutine_function(context)
+        finally:
+            await db.drop_collection(name)
+            await db.migration_checkpoints.delete_many({'collection': name})
+            await db.stored_files.delete_many({'_id': {'$in': context['hashes']}})
+            await db.storage_deletions.delete_many({'sha256': {'$in': context['hashes']}})
+            executor.shutdown()
+            client.close()
+    return asyncio.run(main())
+
+
+def local_upload(tmp_path, context, ext: str = 'jpg') -> str:
+    """Write a unique file to the upload directory and return its /api/uploads URL"""
+    content = uuid.uuid4().bytes * 16
+    context['hashes'].append(hashlib.sha256(content).hexdigest())
+    path = tmp_path / 'uploads' / 'profiles' / f"{uuid.uuid4()}.{ext}"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return f"/api/uploads/profiles/{path.name}"
+
+
+async def migrate(context, docs: list, flush: bool = True):
+    """Migrate documents of the scratch collection; returns the stats"""
+    from migrate_to_cloudinary import Stats
+
+    migrator, collection = context['migrator'], context['db'][context['name']]
+    stats, operations = Stats(), []
+    for doc in docs:
+        await migrator.document_slots.acquire()
+        await migrator.migrate_document(context['name'], doc, FIELDS, stats, operations)
+    if flush:
+        await migrator.flush(collection, operations, stats)
+    return stats
+
+
+class TestMigrationReferences:
+    """Test the migration keeps stored_files refcounts equal to the number of owners"""
+
+    def test_shared_upload_referenced_per_document(self, tmp_path):
+        """Test two documents sharing one upload leave a refcount of 2"""
+        async def check(context):
+            url = local_upload(tmp_path, context)
+            db, collection = context['db'], context['db'][context['name']]
+            docs = [{'_id': 'a', 'profile_picture': url}, {'_id': 'b', 'documents': [{'path': url}]}]
+            await collection.insert_many(docs)
+            stats = await migrate(context, docs)
+            entry = await db.stored_files.find_one({'_id': context['hashes'][0]})
+            return stats, entry, await collection.find().sort('_id', 1).to_list(None)
+
+        stats, entry, docs = run(check, tmp_path)
+        assert stats.updated == 2
+        assert entry['refcount'] == 2, f"Expected refcount 2, got {entry['refcount']}"
+        assert docs[0]['profile_picture'] == entry['url']
+        assert docs[1]['documents'][0]['path'] == entry['url']
+        print(f"✓ Shared upload migrated once, {entry['refcount']} references")
+
+    def test_same_file_twice_in_document_referenced_once(self, tmp_path):
+        """Test a document listing a file twice holds one reference, as its deletion releases it once"""
+        async def check(context):
+            url = local_upload(tmp_path, context)
+            doc = {'_id': 'a', 'profile_picture': url, 'documents': [{'path': url}]}
+            await context['db'][context['name']].insert_one(doc)
+            await migrate(context, [doc])
+            return await context['db'].stored_files.find_one({'_id': context['hashes'][0]})
+
+        entry = run(check, tmp_path)
+        assert entry['refcount'] == 1
+
+    def test_rerun_reuses_checkpoint(self, tmp_path):
+        """Test migrating a document again before its update was written takes no new reference"""
+        async def check(context):
+            url = local_upload(tmp_path, context)
+            doc = {'_id': 'a', 'profile_picture': url}
+            await context['db'][context['name']].insert_one(doc)
+            await migrate(context, [doc], flush=False)
+            stats = await migrate(context, [doc])
+            return stats, await context['db'].stored_files.find_one({'_id': context['hashes'][0]})
+
+        stats, entry = run(check, tmp_path)
+        assert stats.resumed == 1 and stats.migrated == 0
+        assert stats.updated == 1
+        assert entry['refcount'] == 1
+
+    def test_changed_document_releases_references(self, tmp_path):
+        """Test a document edited during the migration keeps its value and drops the new reference"""
+        async def check(context):
+            url = local_upload(tmp_path, context)
+            db, collection = context['db'], context['db'][context['name']]
+            doc = {'_id': 'a', 'profile_picture': url}
+            await collection.insert_one(doc)
+            await migrate(context, [doc], flush=False)
+            # The owner replaces the picture before the migration writes its update
+            await collection.update_one({'_id': 'a'}, {'$set': {'profile_picture': '/api/uploads/profiles/new.jpg'}})
+            stats = await migrate(context, [doc])
+            return (
+                stats,
+                await collection.find_one({'_id': 'a'}),
+                await db.stored_files.find_one({'_id': context['hashes'][0]}),
+                await db.migration_checkpoints.count_documents({'collection': context['name']})
+            )
+
+        stats, doc, entry, checkpoints = run(check, tmp_path)
+        assert stats.conflicts == 1 and stats.updated == 0
+        assert doc['profile_picture'] == '/api/uploads/profiles/new.jpg'
+        assert entry['refcount'] == 0 and entry['state'] == 'deleting'
+        assert checkpoints == 0
+        print("✓ Reference of a superseded migration released")
@@ -0,0 +1,61 @@
+"""
+Test suite for conditional GETs on catalog endpoints
+Features tested:
+1. Catalog endpoints return ETag and Last-Modified
+2. If-None-Match / If-Modified-Since with the current validators get a 304
+3. Different query strings get different ETags
+"""
+
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+CATALOG_ENDPOINTS = [
+    "/api/service-fees",
+    "/api/commission-rates",
+    "/api/companies",
+    "/api/job-offers",
+    "/api/rentals",
+    "/api/property-sales",
+]
+
+
+class TestConditionalGet:
+    """Test ETag / Last-Modified revalidation"""
+
+    @pytest.mark.parametrize("path", CATALOG_ENDPOINTS)
+    def test_if_none_match(self, path):
+        """Test a request with the ETag just received gets a 304 without body"""
+        response = requests.get(f"{BASE_URL}{path}")
+        assert response.status_code == 200, f"{path} failed: {response.text}"
+        etag = response.headers.get("ETag")
+        assert etag, f"{path}: no ETag"
+        assert response.headers.get("Last-Modified")
+
+        cached = requests.get(f"{BASE_URL}{path}", headers={"If-None-Match": etag})
+        assert cached.status_code == 304, f"{path}: expected 304, got {cached.status_code}"
+        assert cached.content == b""
+        assert cached.headers.get("ETag") == etag
+        print(f"✓ {path} revalidated with {etag}")
+
+    def test_if_modified_since(self):
+        """Test a request with the Last-Modified just received gets a 304"""
+        response = requests.get(f"{BASE_URL}/api/service-fees")
+        assert response.status_code == 200
+        cached = requests.get(f"{BASE_URL}/api/service-fees", headers={"If-Modified-Since": response.headers["Last-Modified"]})
+        assert cached.status_code == 304
+
+    def test_stale_etag_gets_body(self):
+        """Test an unknown ETag gets the full response"""
+        response = requests.get(f"{BASE_URL}/api/service-fees", headers={"If-None-Match": 'W/"stale"'})
+        assert response.status_code == 200
+        assert response.json() is not None
+
+    def test_query_changes_etag(self):
+        """Test responses of the same collection with other parameters have their own ETag"""
+        first = requests.get(f"{BASE_URL}/api/rentals", params={"limit": 1})
+        second = requests.get(f"{BASE_URL}/api/rentals", params={"limit": 2})
+        assert first.status_code == 200 and second.status_code == 200
+        assert first.headers["ETag"] != second.headers["ETag"]
@@ -0,0 +1,128 @@
+"""
+Test suite for signed direct uploads
+Features tested:
+1. A provider gets a signed ticket for a document (POST /api/direct-uploads/tickets)
+2. The file is uploaded straight to the signed target (local stand-in or storage service)
+3. Committing the ticket attaches the document (POST /api/direct-uploads/commit)
+4. A ticket can only be committed once, and only by its owner
+"""
+
+import pytest
+import requests
+import os
+import io
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+PDF_CONTENT = b"%PDF-1.4\n1 0 obj\n<< /Type /Catalog >>\nendobj\ntrailer\n<< /Root 1 0 R >>\n%%EOF"
+
+
+def register_provider():
+    """Register a provider and return (user, token)"""
+    data = {
+        'first_name': 'Direct',
+        'last_name': 'Upload',
+        'phone_number': f"224{uuid.uuid4().hex[:9]}",
+        'password': 'TestPassword123',
+        'profession': 'Plombier',
+        'profession_group': 'Artisanat',
+        'years_experience': '2-5',
+        'custom_profession': '',
+        'location': 'Conakry',
+        'region': 'conakry',
+        'ville': 'conakry',
+        'commune': 'ratoma',
+        'quartier': 'Test Quartier',
+        'about': 'Prestataire de test pour les uploads directs.'
+    }
+    files = {'documents': ('test_doc.pdf', io.BytesIO(PDF_CONTENT), 'application/pdf')}
+    response = requests.post(f"{BASE_URL}/api/auth/register", data=data, files=files)
+    if response.status_code != 200:
+        pytest.skip(f"Failed to create test provider: {response.text}")
+    result = response.json()
+    return result["user"], result["token"]
+
+
+class TestDirectUploads:
+    """Test the ticket / upload / commit flow"""
+
+    @pytest.fixture
+    def provider(self):
+        return register_provider()
+
+    def request_ticket(self, user, token, **overrides):
+        payload = {
+            'entity': 'provider_document',
+            'entity_id': user['id'],
+            'kind': 'document',
+            'filename': 'attestation.pdf',
+            'content_type': 'application/pdf',
+            'size': len(PDF_CONTENT),
+            **overrides
+        }
+        return requests.post(
+            f"{BASE_URL}/api/direct-uploads/tickets",
+            json=payload,
+            headers={"Authorization": f"Bearer {token}"}
+        )
+
+    def upload(self, upload):
+        url = upload["url"] if upload["url"].startswith("http") else f"{BASE_URL}{upload['url']}"
+        return requests.post(
+            url,
+            data=upload["fields"],
+            files={'file': ('attestation.pdf', io.BytesIO(PDF_CONTENT), 'application/pdf')}
+        )
+
+    def test_upload_and_commit_document(self, provider):
+        """Test a document uploaded with a ticket is attached once committed"""
+        user, token = provider
+        headers = {"Authorization": f"Bearer {token}"}
+
+        response = self.request_ticket(user, token)
+        assert response.status_code == 200, f"Ticket failed: {response.text}"
+        ticket = response.json()
+        assert "ticket" in ticket and "upload" in ticket and "expires_at" in ticket
+
+        response = self.upload(ticket["upload"])
+        assert response.status_code in (200, 201, 204), f"Direct upload failed: {response.text}"
+
+        response = requests.post(f"{BASE_URL}/api/direct-uploads/commit", json={"ticket": ticket["ticket"]}, headers=headers)
+        assert response.status_code == 200, f"Commit failed: {response.text}"
+        document = response.json()["document"]
+        assert document["filename"] == "attestation.pdf"
+
+        # A ticket is single-use
+        response = requests.post(f"{BASE_URL}/api/direct-uploads/commit", json={"ticket": ticket["ticket"]}, headers=headers)
+        assert response.status_code == 401, f"Expected 401 on second commit, got {response.status_code}"
+
+        response = requests.get(f"{BASE_URL}/api/providers/{user['id']}")
+        if response.status_code == 200:
+            paths = [doc["path"] for doc in response.json().get("documents", [])]
+            assert document["path"] in paths
+        print(f"✓ Direct upload committed: {document['path']}")
+
+    def test_commit_before_upload_fails(self, provider):
+        """Test committing a ticket whose file was never uploaded"""
+        user, token = provider
+        ticket = self.request_ticket(user, token).json()
+        response = requests.post(
+            f"{BASE_URL}/api/direct-uploads/commit",
+            json={"ticket": ticket["ticket"]},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.status_code == 400, f"Expected 400, got {response.status_code}"
+
+    def test_ticket_for_other_provider_forbidden(self, provider):
+        """Test a provider cannot get a ticket for someone else's profile"""
+        user, token = provider
+        other, _ = register_provider()
+        response = self.request_ticket(user, token, entity_id=other['id'])
+        assert response.status_code == 403, f"Expected 403, got {response.status_code}"
+
+    def test_ticket_too_large_rejected(self, provider):
+        """Test tickets are refused above the upload size limit"""
+        user, token = provider
+        response = self.request_ticket(user, token, size=1024 * 1024 * 1024)
+        assert response.status_code == 413, f"Expected 413, got {response.status_code}"
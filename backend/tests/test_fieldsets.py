@@ -0,0 +1,58 @@
+"""
+Test suite for sparse fieldsets on list endpoints
+Features tested:
+1. fields=card returns only card fields, with at most one photo
+2. Explicit field lists are honoured and keep the cursor fields
+3. Unknown fields and admin-only views are rejected on public endpoints
+"""
+
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+RENTAL_CARD_FIELDS = {
+    'id', 'title', 'property_type', 'rental_type', 'location', 'rental_price',
+    'price_per_night', 'is_available', 'approval_status', 'photos', 'created_at'
+}
+
+
+class TestFieldsets:
+    """Test the fields= parameter"""
+
+    def test_rental_cards(self):
+        """Test card view of /api/rentals"""
+        response = requests.get(f"{BASE_URL}/api/rentals", params={"fields": "card"})
+        assert response.status_code == 200, f"Card listing failed: {response.text}"
+        rentals = response.json()
+        if not rentals:
+            pytest.skip("No approved rentals")
+        for rental in rentals:
+            assert set(rental) <= RENTAL_CARD_FIELDS
+            assert len(rental.get("photos", [])) <= 1
+        print(f"✓ {len(rentals)} rental cards")
+
+    def test_explicit_fields(self):
+        """Test a field list returns those fields plus id and created_at"""
+        response = requests.get(f"{BASE_URL}/api/property-sales", params={"fields": "title,sale_price"})
+        assert response.status_code == 200
+        for sale in response.json():
+            assert set(sale) <= {"id", "created_at", "title", "sale_price"}
+
+    def test_card_pages_follow_cursor(self):
+        """Test sparse listings still page by cursor"""
+        response = requests.get(f"{BASE_URL}/api/rentals", params={"fields": "card", "limit": 1})
+        assert response.status_code == 200
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            pytest.skip("Not enough rentals to page")
+        next_page = requests.get(f"{BASE_URL}/api/rentals", params={"fields": "card", "limit": 1, "cursor": cursor})
+        assert next_page.status_code == 200
+        assert next_page.json()[0]["id"] != response.json()[0]["id"]
+
+    def test_invalid_fields_rejected(self):
+        """Test hidden fields, unknown fields and the admin view on a public endpoint"""
+        for fields in ("password", "no_such_field", "admin", "title,$where"):
+            response = requests.get(f"{BASE_URL}/api/rentals", params={"fields": fields})
+            assert response.status_code == 400, f"fields={fields}: expected 400, got {response.status_code}"
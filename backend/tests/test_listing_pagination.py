@@ -0,0 +1,63 @@
+"""
+Test suite for keyset pagination of the public listings
+Features tested:
+1. Listings honour a bounded limit (422 above the maximum)
+2. X-Next-Cursor walks every page without duplicates, newest first
+3. An invalid cursor is rejected with 400
+"""
+
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+LISTINGS = [
+    "/api/rentals",
+    "/api/property-sales",
+    "/api/vehicles",
+    "/api/vehicle-sales",
+    "/api/job-offers",
+    "/api/companies",
+    "/api/company-services",
+    "/api/providers",
+]
+
+
+class TestListingPagination:
+    """Test cursor pagination on every public listing"""
+
+    @pytest.mark.parametrize("path", LISTINGS)
+    def test_limit_is_bounded(self, path):
+        """Test a limit above the maximum page size is refused"""
+        response = requests.get(f"{BASE_URL}{path}", params={"limit": 100000})
+        assert response.status_code == 422, f"Expected 422, got {response.status_code}"
+
+    @pytest.mark.parametrize("path", LISTINGS)
+    def test_pages_are_disjoint_and_ordered(self, path):
+        """Test following X-Next-Cursor returns each item once, newest first"""
+        seen = []
+        positions = []
+        cursor = None
+        for _ in range(20):
+            params = {"limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            response = requests.get(f"{BASE_URL}{path}", params=params)
+            assert response.status_code == 200, f"Failed to list {path}: {response.text}"
+            page = response.json()
+            assert len(page) <= 2
+            seen += [item["id"] for item in page]
+            positions += [(item.get("created_at") or "", item["id"]) for item in page]
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+
+        assert len(seen) == len(set(seen)), f"Duplicate items across pages of {path}"
+        assert positions == sorted(positions, reverse=True), f"{path} is not sorted newest first"
+        print(f"✓ {path}: {len(seen)} items paged")
+
+    def test_invalid_cursor_rejected(self):
+        """Test a malformed cursor returns 400"""
+        response = requests.get(f"{BASE_URL}/api/rentals", params={"cursor": "not-a-cursor"})
+        assert response.status_code == 400, f"Expected 400, got {response.status_code}"
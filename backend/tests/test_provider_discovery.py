@@ -0,0 +1,66 @@
+"""
+Test suite for provider discovery
+Features tested:
+1. Providers are filtered server-side (GET /api/providers/discover)
+2. Results come best ranked first, paged by the X-Next-Cursor header
+3. Facet counts per profession and region come with the results
+"""
+
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+class TestProviderDiscovery:
+    """Test filters, rank order, cursors and facets of provider discovery"""
+
+    def test_discover_returns_results_and_facets(self):
+        """Test the response carries results, facet counts and a total"""
+        response = requests.get(f"{BASE_URL}/api/providers/discover")
+        assert response.status_code == 200, f"Discover failed: {response.text}"
+        data = response.json()
+        assert "results" in data and "facets" in data and "total" in data
+        assert set(data["facets"]) == {"profession", "region"}
+        assert sum(row["count"] for row in data["facets"]["profession"]) == data["total"]
+        print(f"✓ Discover: {data['total']} providers, {len(data['facets']['profession'])} professions")
+
+    def test_filters_apply_to_results_and_facets(self):
+        """Test a profession filter narrows the results and the other facets"""
+        data = requests.get(f"{BASE_URL}/api/providers/discover").json()
+        if not data["facets"]["profession"]:
+            pytest.skip("No providers to filter")
+        profession = data["facets"]["profession"][0]["value"]
+
+        response = requests.get(f"{BASE_URL}/api/providers/discover", params={"profession": profession, "verified": "true"})
+        assert response.status_code == 200
+        filtered = response.json()
+        for provider in filtered["results"]:
+            assert provider["profession"] == profession
+            assert provider["verification_status"] == "approved"
+        # The profession facet ignores the profession filter so other professions stay selectable
+        professions = {row["value"] for row in filtered["facets"]["profession"]}
+        assert not filtered["total"] or profession in professions
+        assert sum(row["count"] for row in filtered["facets"]["region"]) == filtered["total"]
+        print(f"✓ {filtered['total']} verified providers for {profession}")
+
+    def test_cursor_pages_do_not_overlap(self):
+        """Test following the cursor never repeats a provider"""
+        seen = []
+        cursor = None
+        for _ in range(5):
+            params = {"limit": 5, **({"cursor": cursor} if cursor else {})}
+            response = requests.get(f"{BASE_URL}/api/providers/discover", params=params)
+            assert response.status_code == 200
+            seen += [provider["id"] for provider in response.json()["results"]]
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        assert len(seen) == len(set(seen)), "A provider appeared on two pages"
+        print(f"✓ {len(seen)} providers over distinct pages")
+
+    def test_invalid_cursor_rejected(self):
+        """Test a malformed cursor is a 400"""
+        response = requests.get(f"{BASE_URL}/api/providers/discover", params={"cursor": "not-a-cursor"})
+        assert response.status_code == 400, f"Expected 400, got {response.status_code}"
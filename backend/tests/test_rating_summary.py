@@ -0,0 +1,41 @@
+"""
+Test suite for provider rating stats
+Features tested:
+1. Stats come from the provider's rating summary (GET /api/reviews/{provider_id}/stats)
+2. The distribution always adds up to the review count
+3. Unknown providers get empty stats
+"""
+
+import pytest
+import requests
+import os
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+class TestRatingSummary:
+    """Test the rating stats endpoint"""
+
+    def test_unknown_provider_has_empty_stats(self):
+        """Test a provider that doesn't exist has no reviews"""
+        response = requests.get(f"{BASE_URL}/api/reviews/{uuid.uuid4()}/stats")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total_reviews"] == 0
+        assert data["average_rating"] == 0
+        assert set(data["rating_distribution"]) == {"1", "2", "3", "4", "5"}
+
+    def test_stats_are_consistent(self):
+        """Test the distribution and average match the review count"""
+        providers = requests.get(f"{BASE_URL}/api/providers", params={"limit": 20}).json()
+        if not providers:
+            pytest.skip("No providers")
+        for provider in providers:
+            data = requests.get(f"{BASE_URL}/api/reviews/{provider['id']}/stats").json()
+            distribution = data["rating_distribution"]
+            assert sum(distribution.values()) == data["total_reviews"]
+            if data["total_reviews"]:
+                average = sum(int(rating) * count for rating, count in distribution.items()) / data["total_reviews"]
+                assert data["average_rating"] == round(average, 1)
+        print(f"✓ Rating stats consistent for {len(providers)} providers")
@@ -0,0 +1,56 @@
+"""
+Test suite for listing search
+Features tested:
+1. /api/search returns ranked results across listing types
+2. Search is accent and case insensitive
+3. Location filters match folded location prefixes ("matot" -> "Matotó")
+4. Invalid types are rejected
+"""
+
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+class TestSearch:
+    """Test the /api/search endpoint and folded location filters"""
+
+    def test_search_results_are_ranked(self):
+        """Test results carry a type and come best score first"""
+        response = requests.get(f"{BASE_URL}/api/search", params={"q": "conakry"})
+        assert response.status_code == 200, f"Search failed: {response.text}"
+        data = response.json()
+        assert "results" in data and "counts" in data
+        scores = [result["score"] for result in data["results"]]
+        assert scores == sorted(scores, reverse=True), "Results not ranked by score"
+        for result in data["results"]:
+            assert result["type"] in ("rentals", "property_sales", "vehicles", "companies")
+            assert "search" not in result["item"] and "password" not in result["item"]
+        print(f"✓ Search returned {len(data['results'])} results")
+
+    def test_search_is_accent_and_case_insensitive(self):
+        """Test accented and plain spellings find the same documents"""
+        accented = requests.get(f"{BASE_URL}/api/search", params={"q": "CONAKRÝ"}).json()["results"]
+        plain = requests.get(f"{BASE_URL}/api/search", params={"q": "conakry"}).json()["results"]
+        assert [r["item"]["id"] for r in accented] == [r["item"]["id"] for r in plain]
+
+    def test_search_type_filter(self):
+        """Test types restricts the collections searched"""
+        response = requests.get(f"{BASE_URL}/api/search", params={"q": "conakry", "types": "vehicles"})
+        assert response.status_code == 200
+        assert all(result["type"] == "vehicles" for result in response.json()["results"])
+
+    def test_search_invalid_type(self):
+        """Test an unknown type returns 400"""
+        response = requests.get(f"{BASE_URL}/api/search", params={"q": "conakry", "types": "boats"})
+        assert response.status_code == 400, f"Expected 400, got {response.status_code}"
+
+    @pytest.mark.parametrize("path", ["/api/property-sales", "/api/vehicles", "/api/job-offers", "/api/company-services"])
+    def test_location_filter_is_folded(self, path):
+        """Test an accented, upper-case location prefix matches like the plain one"""
+        folded = requests.get(f"{BASE_URL}{path}", params={"location": "conak"})
+        accented = requests.get(f"{BASE_URL}{path}", params={"location": "CONÂK"})
+        assert folded.status_code == 200 and accented.status_code == 200
+        assert [item["id"] for item in folded.json()] == [item["id"] for item in accented.json()]
@@ -0,0 +1,157 @@
+"""
+Test suite for serving uploaded files (GET /api/uploads/...)
+Features tested:
+1. Files are served with a strong ETag, Last-Modified and an immutable Cache-Control
+2. If-None-Match / If-Modified-Since with the current validators get a 304
+3. Single byte ranges get a 206, unsatisfiable ranges a 416
+4. Missing files and paths escaping the upload directory get a 404
+"""
+
+import pytest
+import requests
+import os
+import io
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+@pytest.fixture(scope="module")
+def uploaded_file():
+    """Register a provider with a unique PDF and return (url, content) of the stored copy"""
+    content = b"%PDF-1.4\n% " + uuid.uuid4().hex.encode() + b"\n%%EOF"
+    data = {
+        'first_name': 'Uploaded',
+        'last_name': 'Files',
+        'phone_number': f"224{uuid.uuid4().hex[:9]}",
+        'password': 'TestPassword123',
+        'profession': 'Plombier',
+        'profession_group': 'Artisanat',
+        'years_experience': '2-5',
+        'custom_profession': '',
+        'location': 'Conakry',
+        'region': 'conakry',
+        'ville': 'conakry',
+        'commune': 'ratoma',
+        'quartier': 'Test Quartier',
+        'about': 'Prestataire de test pour les fichiers servis.'
+    }
+    files = {'documents': ('test_doc.pdf', io.BytesIO(content), 'application/pdf')}
+    response = requests.post(f"{BASE_URL}/api/auth/register", data=data, files=files)
+    if response.status_code != 200:
+        pytest.skip(f"Failed to create test provider: {response.text}")
+    documents = response.json()["user"].get("documents") or []
+    if not documents or not documents[0]["path"].startswith("/api/uploads/"):
+        pytest.skip("Uploads are not stored on the local backend")
+    return f"{BASE_URL}{documents[0]['path']}", content
+
+
+class TestUploadedFiles:
+    """Test caching headers, conditional GETs, ranges and path confinement of /api/uploads"""
+
+    def test_full_response(self, uploaded_file):
+        """Test a plain GET returns the file with its validators"""
+        url, content = uploaded_file
+        response = requests.get(url)
+        assert response.status_code == 200, f"GET failed: {response.status_code}"
+        assert response.content == content
+        assert response.headers["Content-Type"] == "application/pdf"
+        assert response.headers["Content-Length"] == str(len(content))
+        assert response.headers["Accept-Ranges"] == "bytes"
+        assert "immutable" in response.headers["Cache-Control"]
+        assert response.headers["ETag"].startswith('"')
+        assert response.headers.get("Last-Modified")
+        print(f"✓ Served {len(content)} bytes with ETag {response.headers['ETag']}")
+
+    def test_head_has_no_body(self, uploaded_file):
+        """Test a HEAD request gets the headers of the GET without the body"""
+        url, content = uploaded_file
+        response = requests.head(url)
+        assert response.status_code == 200
+        assert response.content == b""
+        assert response.headers["Content-Length"] == str(len(content))
+
+    def test_if_none_match(self, uploaded_file):
+        """Test a request with the current ETag gets a 304 without body"""
+        url, _ = uploaded_file
+        etag = requests.get(url).headers["ETag"]
+        for header in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+            cached = requests.get(url, headers={"If-None-Match": header})
+            assert cached.status_code == 304, f"If-None-Match {header}: got {cached.status_code}"
+            assert cached.content == b""
+            assert cached.headers["ETag"] == etag
+        print(f"✓ Revalidated with {etag}")
+
+    def test_stale_etag_gets_body(self, uploaded_file):
+        """Test an unknown ETag gets the full file, even with a matching If-Modified-Since"""
+        url, content = uploaded_file
+        last_modified = requests.get(url).headers["Last-Modified"]
+        response = requests.get(url, headers={"If-None-Match": '"stale"', "If-Modified-Since": last_modified})
+        assert response.status_code == 200
+        assert response.content == content
+
+    def test_if_modified_since(self, uploaded_file):
+        """Test a request with the current Last-Modified gets a 304"""
+        url, _ = uploaded_file
+        last_modified = requests.get(url).headers["Last-Modified"]
+        cached = requests.get(url, headers={"If-Modified-Since": last_modified})
+        assert cached.status_code == 304
+        assert cached.content == b""
+
+    def test_byte_range(self, uploaded_file):
+        """Test a single byte range gets a 206 with the requested slice"""
+        url, content = uploaded_file
+        response = requests.get(url, headers={"Range": "bytes=0-7"})
+        assert response.status_code == 206, f"Expected 206, got {response.status_code}"
+        assert response.content == content[:8]
+        assert response.headers["Content-Range"] == f"bytes 0-7/{len(content)}"
+        assert response.headers["Content-Length"] == "8"
+
+        suffix = requests.get(url, headers={"Range": "bytes=-5"})
+        assert suffix.status_code == 206
+        assert suffix.content == content[-5:]
+
+        open_ended = requests.get(url, headers={"Range": f"bytes={len(content) - 3}-"})
+        assert open_ended.status_code == 206
+        assert open_ended.content == content[-3:]
+        print("✓ Ranges served as 206")
+
+    def test_if_range_mismatch_gets_full_file(self, uploaded_file):
+        """Test a Range with a stale If-Range gets the whole file"""
+        url, content = uploaded_file
+        response = requests.get(url, headers={"Range": "bytes=0-7", "If-Range": '"stale"'})
+        assert response.status_code == 200
+        assert response.content == content
+
+    def test_unsatisfiable_range(self, uploaded_file):
+        """Test a range starting past the end of the file is a 416"""
+        url, content = uploaded_file
+        response = requests.get(url, headers={"Range": f"bytes={len(content)}-"})
+        assert response.status_code == 416, f"Expected 416, got {response.status_code}"
+        assert response.headers["Content-Range"] == f"bytes */{len(content)}"
+        print("✓ Unsatisfiable range rejected with 416")
+
+    def test_missing_file(self):
+        """Test an unknown file is a 404"""
+        response = requests.get(f"{BASE_URL}/api/uploads/servispro/documents/{uuid.uuid4().hex}.pdf")
+        assert response.status_code == 404
+
+    def test_upload_directory_itself(self):
+        """Test the upload directory and its subdirectories are not served"""
+        for path in ("/api/uploads/", "/api/uploads/servispro"):
+            response = requests.get(f"{BASE_URL}{path}")
+            assert response.status_code == 404, f"{path}: expected 404, got {response.status_code}"
+
+    @pytest.mark.parametrize("path", [
+        "/api/uploads/..%2fserver.py",
+        "/api/uploads/%2e%2e/server.py",
+        "/api/uploads/servispro/%2e%2e/%2e%2e/server.py",
+        "/api/uploads/..%2f..%2f..%2fetc%2fpasswd",
+    ])
+    def test_path_traversal(self, path):
+        """Test paths resolving outside the upload directory are a 404"""
+        response = requests.get(f"{BASE_URL}{path}")
+        # A proxy in front of the API may reject the path itself
+        assert response.status_code in (400, 404), f"{path}: got {response.status_code}"
+        assert b"import" not in response.content and b"root:" not in response.content
+        print(f"✓ {path} not served")
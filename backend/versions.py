@@ -0,0 +1,113 @@
+"""
+Per-collection version counters behind conditional GETs.
+
+The landing page polls a few catalog endpoints that rarely change. Every
+write path to a tracked collection bumps its counter in the
+collection_versions collection ({_id: name, version, updated_at}); each
+worker mirrors the counters in memory, refreshed every few seconds like
+the token deny-list, so an endpoint can answer If-None-Match /
+If-Modified-Since with a 304 without querying the database. A worker sees
+its own writes immediately and other workers' within the refresh interval.
+
+Scripts that rewrite catalog documents outside the API call bump_versions().
+"""
+
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+VERSIONS_COLLECTION = 'collection_versions'
+
+
+async def bump_versions(db, *names: str) -> Dict[str, dict]:
+    """Increment the counters of these collections; returns their new state"""
+    now = datetime.now(timezone.utc)
+    states = {}
+    for name in names:
+        states[name] = await db[VERSIONS_COLLECTION].find_one_and_update(
+            {'_id': name},
+            {'$inc': {'version': 1}, '$set': {'updated_at': now}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    return states
+
+
+class CollectionVersions:
+    """In-memory mirror of the version counters of `names`"""
+
+    def __init__(self, db, names: Iterable[str], refresh_interval: float):
+        self.db = db
+        self.names = tuple(names)
+        self.refresh_interval = refresh_interval
+        self._versions: Dict[str, Tuple[int, datetime]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def _set(self, doc: dict):
+        updated_at = doc['updated_at']
+        if updated_at.tzinfo is None:
+            updated_at = updated_at.replace(tzinfo=timezone.utc)
+        current = self._versions.get(doc['_id'])
+        # A sync can read a counter older than a bump this worker just made
+        if current is None or doc['version'] >= current[0]:
+            self._versions[doc['_id']] = (doc['version'], updated_at)
+
+    async def bump(self, *names: str):
+        """Record a write to these collections (untracked names are ignored)"""
+        tracked = [name for name in names if name in self.names]
+        for doc in (await bump_versions(self.db, *tracked)).values():
+            self._set(doc)
+
+    def validators(self, names: Iterable[str], variant: str = '') -> Tuple[str, str]:
+        """
+        (ETag, Last-Modified) of a response built from these collections;
+        `variant` distinguishes responses of the same collections (path and
+        query string).
+        """
+        states = [self._versions.get(name, (0, datetime.min.replace(tzinfo=timezone.utc))) for name in names]
+        key = '|'.join(f"{name}:{version}:{updated_at.timestamp()}" for name, (version, updated_at) in zip(names, states))
+        digest = hashlib.blake2b(f"{key}|{variant}".encode(), digest_size=10).hexdigest()
+        last_modified = max(updated_at for _, updated_at in states)
+        return f'W/"{digest}"', format_datetime(last_modified.replace(microsecond=0), usegmt=True)
+
+    async def sync(self):
+        async for doc in self.db[VERSIONS_COLLECTION].find({'_id': {'$in': list(self.names)}}):
+            self._set(doc)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.warning(f"Collection versions sync failed: {e}")
+
+    async def start(self):
+        # Counters exist from the start so every worker agrees on Last-Modified
+        now = datetime.now(timezone.utc)
+        for name in self.names:
+            await self.db[VERSIONS_COLLECTION].update_one(
+                {'_id': name},
+                {'$setOnInsert': {'version': 0, 'updated_at': now}},
+                upsert=True
+            )
+        await self.sync()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def metrics(self) -> dict:
+        return {
+            name: {'version': version, 'updated_at': updated_at.isoformat()}
+            for name, (version, updated_at) in self._versions.items()
+        }
@@ -0,0 +1,103 @@
+import axios from "axios";
+
+const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
+
+// Access token storage key -> refresh token storage key
+export const REFRESH_TOKEN_KEYS = {
+  token: "refreshToken",
+  customerToken: "customerRefreshToken",
+  companyToken: "companyRefreshToken",
+  adminToken: "adminRefreshToken",
+};
+
+const pendingRefreshes = {};
+
+const refreshAccessToken = (tokenKey) => {
+  if (!pendingRefreshes[tokenKey]) {
+    const refreshKey = REFRESH_TOKEN_KEYS[tokenKey];
+    pendingRefreshes[tokenKey] = axios
+      .post(`${API}/auth/refresh`, {
+        refresh_token: localStorage.getItem(refreshKey),
+      })
+      .then((response) => {
+        localStorage.setItem(tokenKey, response.data.token);
+        localStorage.setItem(refreshKey, response.data.refresh_token);
+        return response.data.token;
+      })
+      .finally(() => {
+        delete pendingRefreshes[tokenKey];
+      });
+  }
+  return pendingRefreshes[tokenKey];
+};
+
+// Access tokens are short-lived: when one expires, exchange the stored
+// refresh token for a new pair and replay the original request once.
+export const installAuthRefresh = () => {
+  axios.interceptors.response.use(
+    (response) => response,
+    async (error) => {
+      const { config, response } = error;
+      if (!config || config._retried || response?.status !== 401) {
+        return Promise.reject(error);
+      }
+      if (response.data?.detail !== "Token expired") {
+        return Promise.reject(error);
+      }
+
+      const authorization = config.headers?.Authorization || "";
+      const tokenKey = Object.keys(REFRESH_TOKEN_KEYS).find(
+        (key) =>
+          localStorage.getItem(key) &&
+          authorization === `Bearer ${localStorage.getItem(key)}`
+      );
+      if (!tokenKey || !localStorage.getItem(REFRESH_TOKEN_KEYS[tokenKey])) {
+        return Promise.reject(error);
+      }
+
+      try {
+        const token = await refreshAccessToken(tokenKey);
+        config._retried = true;
+        config.headers.Authorization = `Bearer ${token}`;
+        return axios(config);
+      } catch (refreshError) {
+        return Promise.reject(error);
+      }
+    }
+  );
+};
+
+// Revoke the stored session server-side (access and refresh token) before
+// the caller clears it. An expired access token is refreshed first so the
+// refresh token that gets revoked is the current one; errors are ignored so
+// logging out always completes locally.
+export const revokeSession = async (tokenKey) => {
+  const refreshKey = REFRESH_TOKEN_KEYS[tokenKey];
+  const logout = () =>
+    axios.post(
+      `${API}/auth/logout`,
+      { refresh_token: localStorage.getItem(refreshKey) },
+      {
+        headers: { Authorization: `Bearer ${localStorage.getItem(tokenKey)}` },
+        _retried: true,
+      }
+    );
+  if (!localStorage.getItem(tokenKey)) {
+    return;
+  }
+  try {
+    await logout();
+  } catch (error) {
+    if (
+      error.response?.data?.detail === "Token expired" &&
+      localStorage.getItem(refreshKey)
+    ) {
+      try {
+        await refreshAccessToken(tokenKey);
+        await logout();
+      } catch (retryError) {
+        // Session already unusable
+      }
+    }
+  }
+};
@@ -35,6 +35,7 @@ const AdminAuth = ({ setIsAdminAuthenticated }) => {
       });
       
       localStorage.setItem('adminToken', response.data.token);
+      localStorage.setItem('adminRefreshToken', response.data.refresh_token);
       localStorage.setItem('admin', JSON.stringify(response.data.user));
       
       if (setIsAdminAuthenticated) {
@@ -15,6 +15,7 @@ import { toast } from 'sonner';
 import axios from 'axios';
 import AdminSalesManager from '@/components/AdminSalesManager';
 import { getImageUrl } from '@/utils/imageUrl';
+import { revokeSession } from '@/lib/authRefresh';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
@@ -301,8 +302,10 @@ const AdminDashboard = ({ setIsAdminAuthenticated }) => {
     }
   };
 
-  const handleLogout = () => {
+  const handleLogout = async () => {
+    await revokeSession('adminToken');
     localStorage.removeItem('adminToken');
+    localStorage.removeItem('adminRefreshToken');
     localStorage.removeItem('admin');
     setIsAdminAuthenticated(false);
     toast.success('Déconnexion réussie');
@@ -269,6 +269,7 @@ const AuthPage = ({ setIsAuthenticated }) => {
         });
         
         localStorage.setItem('token', response.data.token);
+        localStorage.setItem('refreshToken', response.data.refresh_token);
         localStorage.setItem('user', JSON.stringify(response.data.user));
         
         toast.success(`Bienvenue ${response.data.user.first_name} !`);
@@ -369,6 +370,7 @@ const AuthPage = ({ setIsAuthenticated }) => {
       });
       
       localStorage.setItem('token', response.data.token);
+      localStorage.setItem('refreshToken', response.data.refresh_token);
       localStorage.setItem('user', JSON.stringify(response.data.user));
       
       toast.success('Inscription réussie ! Bienvenue sur ServisPro.');
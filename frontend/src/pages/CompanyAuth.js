@@ -101,6 +101,7 @@ const CompanyAuth = ({ setIsCompanyAuthenticated }) => {
     try {
       const response = await axios.post(`${API}/auth/company/login`, loginData);
       localStorage.setItem('companyToken', response.data.token);
+      localStorage.setItem('companyRefreshToken', response.data.refresh_token);
       localStorage.setItem('company', JSON.stringify(response.data.user));
       toast.success('Connexion réussie !');
       if (setIsCompanyAuthenticated) setIsCompanyAuthenticated(true);
@@ -147,6 +148,7 @@ const CompanyAuth = ({ setIsCompanyAuthenticated }) => {
       });
 
       localStorage.setItem('companyToken', response.data.token);
+      localStorage.setItem('companyRefreshToken', response.data.refresh_token);
       localStorage.setItem('company', JSON.stringify(response.data.user));
       setCreatedCompanyId(response.data.user.id);
       toast.success('Entreprise créée ! Veuillez télécharger vos documents.');
@@ -18,6 +18,7 @@ import {
 import axios from 'axios';
 import { getErrorMessage } from '@/utils/helpers';
 import CommissionRatesCard from '@/components/CommissionRatesCard';
+import { revokeSession } from '@/lib/authRefresh';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
@@ -161,6 +162,7 @@ const CompanyDashboard = () => {
         console.error('Error fetching profile:', error);
         if (error.response?.status === 401) {
           localStorage.removeItem('companyToken');
+          localStorage.removeItem('companyRefreshToken');
           navigate('/company/auth');
         }
       } finally {
@@ -202,8 +204,10 @@ const CompanyDashboard = () => {
     if (company) fetchData();
   }, [company]);
 
-  const handleLogout = () => {
+  const handleLogout = async () => {
+    await revokeSession('companyToken');
     localStorage.removeItem('companyToken');
+    localStorage.removeItem('companyRefreshToken');
     localStorage.removeItem('company');
     toast.success('Déconnexion réussie');
     navigate('/');
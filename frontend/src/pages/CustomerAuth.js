@@ -119,6 +119,7 @@ const CustomerAuth = ({ setIsCustomerAuthenticated }) => {
       }
       
       localStorage.setItem('customerToken', response.data.token);
+      localStorage.setItem('customerRefreshToken', response.data.refresh_token);
       localStorage.setItem('customer', JSON.stringify(response.data.user));
       
       if (setIsCustomerAuthenticated) {
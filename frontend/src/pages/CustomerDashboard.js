@@ -15,6 +15,7 @@ import { toast } from 'sonner';
 import axios from 'axios';
 import NotificationBell from '@/components/NotificationBell';
 import RatingPopup from '@/components/RatingPopup';
+import { revokeSession } from '@/lib/authRefresh';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
@@ -311,8 +312,10 @@ const CustomerDashboard = ({ setIsCustomerAuthenticated }) => {
     setShowRatingPopup(true);
   };
 
-  const handleLogout = () => {
+  const handleLogout = async () => {
+    await revokeSession('customerToken');
     localStorage.removeItem('customerToken');
+    localStorage.removeItem('customerRefreshToken');
     localStorage.removeItem('customer');
     setIsCustomerAuthenticated(false);
     toast.success('Déconnexion réussie');
@@ -26,6 +26,7 @@ import NotificationBell from '@/components/NotificationBell';
 import ProviderFeesCard from '@/components/ProviderFeesCard';
 import VisitRequestsList from '@/components/VisitRequestsList';
 import { getImageUrl } from '@/utils/imageUrl';
+import { revokeSession } from '@/lib/authRefresh';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
@@ -136,8 +137,10 @@ const Dashboard = ({ setIsAuthenticated }) => {
     }
   };
 
-  const handleLogout = () => {
+  const handleLogout = async () => {
+    await revokeSession('token');
     localStorage.removeItem('token');
+    localStorage.removeItem('refreshToken');
     localStorage.removeItem('user');
     setIsAuthenticated(false);
   };
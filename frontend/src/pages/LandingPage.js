@@ -200,6 +200,7 @@ const LandingPage = ({ isCustomerAuthenticated }) => {
 
   const handleCustomerLogout = () => {
     localStorage.removeItem('customerToken');
+    localStorage.removeItem('customerRefreshToken');
     localStorage.removeItem('customer');
     setCustomer(null);
     window.location.reload();
@@ -0,0 +1,89 @@
+"""
+Test Suite for ServisPro - Access/Refresh Tokens and Revocation
+Tests:
+1. Customer registration returns an access token and a refresh token
+2. Claims-only endpoints accept the access token (GET /api/notifications/unread-count/customer)
+3. Refresh token rotation (POST /api/auth/refresh) - old refresh token is single use
+4. Logout revokes the access token (POST /api/auth/logout)
+"""
+
+import pytest
+import requests
+import os
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', 'https://servispro-bugfix.preview.emergentagent.com')
+
+TEST_CUSTOMER_PHONE = f"624{uuid.uuid4().hex[:7]}"
+TEST_PASSWORD = "test123456"
+
+
+@pytest.fixture(scope="module")
+def customer_tokens():
+    """Register a customer and return its token pair"""
+    response = requests.post(f"{BASE_URL}/api/auth/customer/register", json={
+        "first_name": "Test",
+        "last_name": "Token",
+        "phone_number": TEST_CUSTOMER_PHONE,
+        "password": TEST_PASSWORD
+    })
+    assert response.status_code == 200, f"Registration failed: {response.text}"
+    data = response.json()
+    assert data.get("token"), "Access token not in response"
+    assert data.get("refresh_token"), "Refresh token not in response"
+    return data
+
+
+class TestTokenRefresh:
+    """Test refresh token rotation and revocation"""
+
+    def test_claims_endpoint_with_access_token(self, customer_tokens):
+        """Unread count is served from the access token claims"""
+        response = requests.get(
+            f"{BASE_URL}/api/notifications/unread-count/customer",
+            headers={"Authorization": f"Bearer {customer_tokens['token']}"}
+        )
+        assert response.status_code == 200, f"Expected 200, got {response.status_code}: {response.text}"
+        assert "unread_count" in response.json()
+        print("✓ Claims-only endpoint accepts access token")
+
+    def test_refresh_token_rejected_as_access_token(self, customer_tokens):
+        """A refresh token cannot be used to call the API"""
+        response = requests.get(
+            f"{BASE_URL}/api/notifications/unread-count/customer",
+            headers={"Authorization": f"Bearer {customer_tokens['refresh_token']}"}
+        )
+        assert response.status_code == 401, f"Expected 401, got {response.status_code}: {response.text}"
+        print("✓ Refresh token rejected on API endpoints")
+
+    def test_refresh_rotates_tokens(self, customer_tokens):
+        """Refreshing returns a new pair and the old refresh token becomes unusable"""
+        old_refresh = customer_tokens['refresh_token']
+        response = requests.post(f"{BASE_URL}/api/auth/refresh", json={"refresh_token": old_refresh})
+        assert response.status_code == 200, f"Refresh failed: {response.text}"
+        data = response.json()
+        assert data.get("token") and data.get("refresh_token")
+        assert data["refresh_token"] != old_refresh
+
+        reuse = requests.post(f"{BASE_URL}/api/auth/refresh", json={"refresh_token": old_refresh})
+        assert reuse.status_code == 401, f"Expected 401 on reuse, got {reuse.status_code}"
+
+        customer_tokens.update(data)
+        print("✓ Refresh token rotated, old one revoked")
+
+    def test_logout_revokes_access_token(self, customer_tokens):
+        """After logout the access token is rejected"""
+        headers = {"Authorization": f"Bearer {customer_tokens['token']}"}
+        response = requests.post(
+            f"{BASE_URL}/api/auth/logout",
+            json={"refresh_token": customer_tokens['refresh_token']},
+            headers=headers
+        )
+        assert response.status_code == 200, f"Logout failed: {response.text}"
+
+        response = requests.get(f"{BASE_URL}/api/notifications/unread-count/customer", headers=headers)
+        assert response.status_code == 401, f"Expected 401 after logout, got {response.status_code}"
+
+        response = requests.post(f"{BASE_URL}/api/auth/refresh", json={"refresh_token": customer_tokens['refresh_token']})
+        assert response.status_code == 401, f"Expected 401 for revoked refresh token, got {response.status_code}"
+        print("✓ Logout revokes access and refresh tokens")